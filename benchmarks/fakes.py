@@ -0,0 +1,182 @@
+"""Deterministic stand-ins for Groq and Tavily used by the offline benchmark."""
+import re
+import json
+import time
+import asyncio
+import threading
+from typing import Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+from src.utils.context import estimate_tokens
+
+REPORT_TEMPLATE = """## Recommendations for: {query}
+
+Based on your preferences ({persona}), the institutions below stand out. {filler}
+
+| Institution | Why it fits |
+|---|---|
+| First choice | Strong programs and a good match for your location and budget |
+| Second choice | Comparable outcomes at a lower total cost |
+
+Review admission rates, total cost of attendance and campus size before applying."""
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers each agent's prompt with a canned response after a fixed latency.
+
+    latency is paid once per call, plus token_latency per output token (streamed calls pay it per chunk).
+    Calls and estimated tokens are counted per prompt kind.
+    """
+
+    latency: float = 0.2
+    token_latency: float = 0.0
+    corpus: Dict[str, Dict] = {}
+    _counters: Dict[str, Dict[str, int]] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def reset_counters(self) -> Dict[str, Dict[str, int]]:
+        """Return the counters since the last reset and start new ones."""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+        return counters
+
+    def _kind(self, messages: List[BaseMessage], tools) -> str:
+        system = messages[0].content if messages else ""
+        if tools:
+            return "tools"
+        if "Extract user preferences" in system or "Extract preferences" in str(messages[-1].content):
+            return "planner"
+        if "knowledge graph" in system:
+            return "enrich"
+        if "recommendation report" in system:
+            return "recommender"
+        if "weather" in system.lower():
+            return "weather"
+        if "SQLite" in system:
+            return "sql"
+        return "other"
+
+    def _entry(self, messages: List[BaseMessage]) -> Dict:
+        text = str(messages[-1].content)
+        for query, entry in self.corpus.items():
+            if query in text:
+                return entry
+        return {}
+
+    def _reply(self, kind: str, messages: List[BaseMessage]) -> AIMessage:
+        entry = self._entry(messages)
+        if kind == "tools":
+            calls = [{"name": call["name"], "args": call["args"], "id": f"call_{i}"}
+                     for i, call in enumerate(entry.get("tool_calls", []))]
+            return AIMessage(content="", tool_calls=calls)
+        if kind == "planner":
+            return AIMessage(content=json.dumps(entry.get("persona", {})))
+        if kind == "enrich":
+            node_ids = re.findall(r"^(univ-[\w-]+):", str(messages[-1].content), re.MULTILINE)
+            return AIMessage(content=json.dumps({node_id: "A solid match for the stated preferences." for node_id in node_ids}))
+        if kind == "recommender":
+            filler = "The gathered data covers cost, admissions and enrollment. " * 8
+            return AIMessage(content=REPORT_TEMPLATE.format(
+                query=entry.get("query", "your query"), persona=json.dumps(entry.get("persona", {})), filler=filler))
+        if kind == "weather":
+            return AIMessage(content="Mild today, around 65°F with light wind and no precipitation expected.")
+        if kind == "sql":
+            return AIMessage(content="SELECT h.UNITID, h.INSTNM, h.CITY, h.STABBR FROM hd2023 h "
+                                     "WHERE h.STABBR IN ('MA', 'CT', 'RI', 'NH', 'VT', 'ME') ORDER BY h.INSTNM LIMIT 25")
+        return AIMessage(content="OK")
+
+    def _count(self, kind: str, messages: List[BaseMessage], reply: AIMessage) -> None:
+        output = reply.content or json.dumps(reply.tool_calls)
+        with self._lock:
+            counter = self._counters.setdefault(kind, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+            counter["calls"] += 1
+            counter["input_tokens"] += sum(estimate_tokens(str(message.content)) for message in messages)
+            counter["output_tokens"] += estimate_tokens(output)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        kind = self._kind(messages, kwargs.get("tools"))
+        reply = self._reply(kind, messages)
+        self._count(kind, messages, reply)
+        time.sleep(self.latency + self.token_latency * estimate_tokens(reply.content))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _chunks(self, reply: AIMessage):
+        """(delay, chunk) pairs for streaming a reply word by word, or its tool calls in one chunk."""
+        if reply.tool_calls:
+            yield 0.0, ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(reply.tool_calls)
+            ]))
+            return
+
+        words = reply.content.split(" ")
+        for i, word in enumerate(words):
+            text = word if i == len(words) - 1 else word + " "
+            yield self.token_latency * estimate_tokens(text), ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        kind = self._kind(messages, kwargs.get("tools"))
+        reply = self._reply(kind, messages)
+        self._count(kind, messages, reply)
+        time.sleep(self.latency)
+        for delay, chunk in self._chunks(reply):
+            time.sleep(delay)
+            yield chunk
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        kind = self._kind(messages, kwargs.get("tools"))
+        reply = self._reply(kind, messages)
+        self._count(kind, messages, reply)
+        await asyncio.sleep(self.latency + self.token_latency * estimate_tokens(reply.content))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        kind = self._kind(messages, kwargs.get("tools"))
+        reply = self._reply(kind, messages)
+        self._count(kind, messages, reply)
+        await asyncio.sleep(self.latency)
+        for delay, chunk in self._chunks(reply):
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+class FakeTavilyClient:
+    """Tavily stand-in returning a fixed search result after a fixed latency."""
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _result(self, query: str) -> Dict:
+        with self._lock:
+            self.calls += 1
+        return {
+            "query": query,
+            "results": [{"title": "Current weather", "url": "https://example.com/weather",
+                         "content": "65°F, partly cloudy, wind 5 mph, humidity 50%"}],
+        }
+
+    def search(self, query: str, **kwargs) -> Dict:
+        time.sleep(self.latency)
+        return self._result(query)
+
+
+class FakeAsyncTavilyClient:
+    """Async view of a FakeTavilyClient, counting into the same calls."""
+
+    def __init__(self, client: FakeTavilyClient):
+        self.client = client
+
+    async def search(self, query: str, **kwargs) -> Dict:
+        await asyncio.sleep(self.client.latency)
+        return self.client._result(query)
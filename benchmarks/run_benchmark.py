@@ -0,0 +1,278 @@
+"""Offline benchmark for the plan -> gather -> recommend -> format pipeline.
+
+Replays benchmarks/queries.jsonl through run_graph with a deterministic fake LLM
+and a fake Tavily client, so runs need no API keys or network and are repeatable:
+
+    python -m benchmarks.run_benchmark --repeat 5 --save benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --compare benchmarks/baseline.json
+
+Reports p50/p95/p99 latency per node and per query, time to the first report
+token, LLM calls and estimated tokens per query, time spent holding SQLite
+connections, and peak Python memory (measured in a separate pass, since
+tracemalloc slows everything down). --compare exits non-zero on regressions,
+including entry modules over their import-time budgets (see run_importtime).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import tracemalloc
+from typing import Dict, List
+
+# install_fakes replaces the shared client before anything creates the Groq one; responses are never cached
+os.environ.pop("LLM_CACHE_PATH", None)
+
+import numpy as np
+from benchmarks.fakes import FakeAsyncTavilyClient, FakeChatModel, FakeTavilyClient
+from benchmarks.run_importtime import BUDGETS_MS, check as check_imports, measure as measure_import
+from src.utils.shared_llm import set_shared_llm
+from src.utils.scheduler import LLMScheduler, SchedulingChatModel
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "queries.jsonl")
+
+# Relative slowdown tolerated by --compare, and an absolute floor (ms) below which latency changes are noise
+TOLERANCE = 0.20
+NOISE_FLOOR_MS = 5.0
+
+
+def load_queries(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2),
+            "mean": round(float(np.mean(values)), 2), "n": len(values)}
+
+
+def run_query(entry: Dict, run_graph) -> Dict:
+    """Run one query; node latency is the time since the previous node finished (ms)."""
+    initial_state = {"query": entry["query"], "user_persona": "", "report": "", "knowledge_graph": ""}
+    start = time.perf_counter()
+    marks = {"last": start, "first_token": None}
+    nodes = {}
+
+    def on_step(node_name):
+        now = time.perf_counter()
+        nodes[node_name] = (now - marks["last"]) * 1000
+        marks["last"] = now
+
+    def on_token(_):
+        if marks["first_token"] is None:
+            marks["first_token"] = time.perf_counter()
+
+    run_graph(initial_state, step_callback=on_step, token_callback=on_token)
+    end = time.perf_counter()
+    return {
+        "total_ms": (end - start) * 1000,
+        "first_token_ms": (marks["first_token"] - start) * 1000 if marks["first_token"] else None,
+        "nodes": nodes,
+    }
+
+
+def install_fakes(queries: List[Dict], llm_latency: float, token_latency: float, tavily_latency: float,
+                  rpm: float = 0, tpm: float = 0):
+    """Point the shared LLM and the weather clients at the fakes; returns (llm, scheduler, tavily)."""
+    llm = FakeChatModel(latency=llm_latency, token_latency=token_latency,
+                        corpus={entry["query"]: entry for entry in queries})
+    # Same scheduler wrapper as production; limits are off unless given
+    scheduler = LLMScheduler(rpm=rpm, tpm=tpm)
+    set_shared_llm(SchedulingChatModel(inner=llm, scheduler=scheduler))
+    tavily = FakeTavilyClient(latency=tavily_latency)
+
+    from src.utils.weather import set_weather_client, set_async_weather_client, weather_cache
+    set_weather_client(tavily)
+    set_async_weather_client(FakeAsyncTavilyClient(tavily))
+    weather_cache.clear()
+    return llm, scheduler, tavily
+
+
+def benchmark(queries: List[Dict], repeat: int, llm_latency: float, token_latency: float,
+              tavily_latency: float, measure_memory: bool = True, rpm: float = 0, tpm: float = 0,
+              use_query_cache: bool = False, use_async: bool = False) -> Dict:
+    llm, scheduler, tavily = install_fakes(queries, llm_latency, token_latency, tavily_latency, rpm, tpm)
+
+    from src.utils.db import get_pool
+    from src.utils.query_cache import query_cache
+    from src.graph.runner import run_graph, arun_graph, warm_up, PARALLEL_FORMAT, PARALLEL_PLAN
+    if use_async:
+        def run_graph(*args, **kwargs):
+            return asyncio.run(arun_graph(*args, **kwargs))
+
+    warm_up_ms = warm_up() * 1000
+    llm.reset_counters()
+    pool = get_pool()
+
+    totals, first_tokens, sql_ms = [], [], []
+    node_times: Dict[str, List[float]] = {}
+    llm_calls: Dict[str, List[int]] = {}
+    input_tokens, output_tokens, call_counts = [], [], []
+    per_query = {}
+
+    for _ in range(repeat):
+        for entry in queries:
+            # Repeated passes would otherwise only measure query cache hits
+            if not use_query_cache:
+                query_cache.clear()
+            sql_before = pool.metrics()["busy_seconds"]
+            result = run_query(entry, run_graph)
+            sql_ms.append((pool.metrics()["busy_seconds"] - sql_before) * 1000)
+            counters = llm.reset_counters()
+
+            totals.append(result["total_ms"])
+            per_query.setdefault(entry["id"], []).append(result["total_ms"])
+            if result["first_token_ms"] is not None:
+                first_tokens.append(result["first_token_ms"])
+            for node_name, elapsed in result["nodes"].items():
+                node_times.setdefault(node_name, []).append(elapsed)
+            for kind, counter in counters.items():
+                llm_calls.setdefault(kind, []).append(counter["calls"])
+            call_counts.append(sum(counter["calls"] for counter in counters.values()))
+            input_tokens.append(sum(counter["input_tokens"] for counter in counters.values()))
+            output_tokens.append(sum(counter["output_tokens"] for counter in counters.values()))
+
+    runs = len(totals)
+    results = {
+        "config": {
+            "queries": len(queries), "repeat": repeat, "llm_latency": llm_latency,
+            "token_latency": token_latency, "tavily_latency": tavily_latency,
+            "parallel_format": PARALLEL_FORMAT, "parallel_plan": PARALLEL_PLAN, "rpm": rpm, "tpm": tpm, "query_cache": use_query_cache,
+            "async": use_async,
+        },
+        "warm_up_ms": round(warm_up_ms, 2),
+        "latency_ms": {
+            "query": percentiles(totals),
+            "first_token": percentiles(first_tokens),
+            "nodes": {name: percentiles(values) for name, values in node_times.items()},
+            "per_query_p50": {query_id: round(float(np.median(values)), 2) for query_id, values in per_query.items()},
+        },
+        "llm": {
+            "calls_per_query": round(sum(call_counts) / runs, 2),
+            "input_tokens_per_query": round(sum(input_tokens) / runs, 1),
+            "output_tokens_per_query": round(sum(output_tokens) / runs, 1),
+            "calls_by_prompt": {kind: sum(values) for kind, values in llm_calls.items()},
+        },
+        "sql_ms": percentiles(sql_ms),
+        "tavily_calls": tavily.calls,
+        "scheduler": scheduler.stats(),
+        "db_pool": pool.metrics(),
+    }
+
+    if measure_memory:
+        # Separate pass: tracemalloc overhead would distort the latencies above
+        tracemalloc.start()
+        peak = 0
+        for entry in queries:
+            if not use_query_cache:
+                query_cache.clear()
+            tracemalloc.reset_peak()
+            run_query(entry, run_graph)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        llm.reset_counters()
+        results["peak_memory_mb"] = round(peak / (1024 * 1024), 2)
+
+    return results
+
+
+def print_report(results: Dict) -> None:
+    print("\n=== Benchmark ===")
+    print(f"Config: {results['config']}")
+    print(f"Warm-up: {results['warm_up_ms']:.1f} ms")
+    print(f"\n{'latency (ms)':<22}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}")
+    rows = [("query", results["latency_ms"]["query"]), ("first token", results["latency_ms"]["first_token"])]
+    rows += [(f"node: {name}", stats) for name, stats in results["latency_ms"]["nodes"].items()]
+    rows.append(("sql", results["sql_ms"]))
+    for label, stats in rows:
+        if stats:
+            print(f"{label:<22}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['mean']:>10.1f}")
+    llm = results["llm"]
+    print(f"\nLLM calls/query: {llm['calls_per_query']}  "
+          f"tokens/query: {llm['input_tokens_per_query']} in, {llm['output_tokens_per_query']} out")
+    print(f"LLM calls by prompt: {llm['calls_by_prompt']}")
+    print(f"Tavily calls: {results['tavily_calls']}")
+    print(f"Scheduler: {results['scheduler']}")
+    if "peak_memory_mb" in results:
+        print(f"Peak traced memory per query: {results['peak_memory_mb']} MB")
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = TOLERANCE) -> List[str]:
+    """Describe every metric that got worse than the baseline by more than the tolerance."""
+    regressions = []
+
+    def check(label, current, previous, floor=0.0):
+        if current is None or previous is None:
+            return
+        if current > previous * (1 + tolerance) and current - previous > floor:
+            regressions.append(f"{label}: {previous} -> {current}")
+
+    for name in ("query", "first_token"):
+        for stat in ("p50", "p95"):
+            check(f"{name} {stat} ms", results["latency_ms"][name].get(stat),
+                  baseline["latency_ms"].get(name, {}).get(stat), NOISE_FLOOR_MS)
+    for node_name, stats in results["latency_ms"]["nodes"].items():
+        previous = baseline["latency_ms"]["nodes"].get(node_name, {})
+        for stat in ("p50", "p95"):
+            check(f"node {node_name} {stat} ms", stats.get(stat), previous.get(stat), NOISE_FLOOR_MS)
+    check("sql p95 ms", results["sql_ms"].get("p95"), baseline["sql_ms"].get("p95"), NOISE_FLOOR_MS)
+    for metric in ("calls_per_query", "input_tokens_per_query", "output_tokens_per_query"):
+        check(f"llm {metric}", results["llm"][metric], baseline["llm"].get(metric))
+    check("peak memory MB", results.get("peak_memory_mb"), baseline.get("peak_memory_mb"), 1.0)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the university planning pipeline")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSONL corpus of queries with scripted tool calls")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Extra seconds per output token")
+    parser.add_argument("--tavily-latency", type=float, default=0.3, help="Seconds per fake Tavily search")
+    parser.add_argument("--rpm", type=float, default=0, help="Scheduler requests-per-minute limit (0: none)")
+    parser.add_argument("--tpm", type=float, default=0, help="Scheduler tokens-per-minute limit (0: none)")
+    parser.add_argument("--query-cache", action="store_true", help="Keep the query cache between runs")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Drive the graph with arun_graph")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' progress output")
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to diff against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--import-scale", type=float, default=1.0,
+                        help="Multiply the import-time budgets checked by --compare, e.g. on slower machines")
+    args = parser.parse_args()
+
+    # The agents print progress on every step; keep it out of the report unless asked for
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(output):
+        results = benchmark(load_queries(args.queries), args.repeat, args.llm_latency,
+                            args.token_latency, args.tavily_latency, not args.no_memory, args.rpm, args.tpm,
+                            args.query_cache, args.use_async)
+    print_report(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        # Cold imports run in fresh interpreters, so the pipeline run above doesn't skew them
+        regressions += check_imports({module: measure_import(module, 3) for module in BUDGETS_MS}, args.import_scale)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
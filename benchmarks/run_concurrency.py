@@ -0,0 +1,104 @@
+"""Concurrent sessions: run_graph on one thread per session vs arun_graph on one event loop.
+
+Starts --sessions planning runs at once against the offline fakes and reports wall
+time and the peak number of live threads for each driver:
+
+    python -m benchmarks.run_concurrency --sessions 50
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.run_benchmark import QUERIES_PATH, install_fakes, load_queries
+
+
+class ThreadSampler:
+    """Samples threading.active_count() in the background and keeps the maximum."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        # The sampler itself is not part of the pipeline
+        self.peak -= 1
+
+
+def initial_state(entry: Dict) -> Dict:
+    return {"query": entry["query"], "user_persona": "", "report": "", "knowledge_graph": ""}
+
+
+def run_threaded(entries: List[Dict]) -> Dict:
+    from src.graph.runner import run_graph
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(entries)) as executor:
+            list(executor.map(lambda entry: run_graph(initial_state(entry)), entries))
+        elapsed = time.perf_counter() - start
+    return {"wall_s": round(elapsed, 2), "peak_threads": sampler.peak}
+
+
+def run_async(entries: List[Dict]) -> Dict:
+    from src.graph.runner import arun_graph
+
+    async def main():
+        await asyncio.gather(*(arun_graph(initial_state(entry)) for entry in entries))
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - start
+    return {"wall_s": round(elapsed, 2), "peak_threads": sampler.peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent sessions with the threaded and async drivers")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--sessions", type=int, default=50, help="Concurrent planning sessions")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--tavily-latency", type=float, default=0.3)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    entries = [queries[i % len(queries)] for i in range(args.sessions)]
+
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(output):
+        install_fakes(queries, args.llm_latency, args.token_latency, args.tavily_latency)
+        from src.graph.runner import warm_up
+        from src.utils.query_cache import query_cache
+        warm_up()
+        query_cache.clear()
+        threaded = run_threaded(entries)
+        query_cache.clear()
+        async_ = run_async(entries)
+
+    print(f"{args.sessions} concurrent sessions")
+    print(f"{'driver':<12}{'wall (s)':>10}{'peak threads':>14}")
+    print(f"{'threads':<12}{threaded['wall_s']:>10}{threaded['peak_threads']:>14}")
+    print(f"{'async':<12}{async_['wall_s']:>10}{async_['peak_threads']:>14}")
+
+
+if __name__ == "__main__":
+    main()
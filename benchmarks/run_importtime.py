@@ -0,0 +1,95 @@
+"""Import-time budget: cold-import each entry module in a fresh interpreter under -X importtime.
+
+Reports the median cumulative import time per module and fails (exit 1) when a module
+goes over its budget or pulls in something it must load lazily (LangGraph, the Groq
+client, Tavily, the Streamlit graph component):
+
+    python -m benchmarks.run_importtime
+    python -m benchmarks.run_importtime --repeat 7 --scale 2   # slower machine
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Optional
+
+# Median cumulative import time allowed per module (ms)
+BUDGETS_MS = {
+    "src.utils.shared_llm": 100,
+    "src.graph.runner": 600,
+    "src.graph.batch": 600,
+    "src.utils.tools": 2000,
+}
+
+# Modules each import must not load; they are imported on first use instead
+LAZY_MODULES = ["langchain_groq", "groq", "tavily", "st_link_analysis"]
+MUST_NOT_LOAD = {
+    "src.utils.shared_llm": LAZY_MODULES + ["langchain_core"],
+    "src.graph.runner": LAZY_MODULES + ["langgraph", "src.agents.gatherer", "numpy"],
+    "src.graph.batch": LAZY_MODULES + ["langgraph", "src.agents.gatherer", "numpy"],
+    # Importing a tool for a unit test must not create the LLM client
+    "src.utils.tools": LAZY_MODULES + ["langgraph"],
+}
+
+CHECK = "import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+
+
+def cumulative_us(stderr: str, module: str) -> Optional[int]:
+    """The module's own cumulative time from -X importtime output."""
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            return int(parts[1])
+    return None
+
+
+def measure(module: str, repeat: int) -> Dict:
+    times, loaded = [], set()
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHECK.format(module=module)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        times.append(cumulative_us(result.stderr, module) or 0)
+        loaded = set(json.loads(result.stdout.strip().splitlines()[-1]))
+    forbidden = [name for name in MUST_NOT_LOAD.get(module, [])
+                 if name in loaded or any(other.startswith(name + ".") for other in loaded)]
+    return {"median_ms": round(statistics.median(times) / 1000, 1), "forbidden": forbidden}
+
+
+def check(results: Dict[str, Dict], scale: float) -> List[str]:
+    """Describe every module over its budget or loading a lazy dependency."""
+    failures = []
+    for module, result in results.items():
+        budget = BUDGETS_MS[module] * scale
+        if result["median_ms"] > budget:
+            failures.append(f"{module}: {result['median_ms']} ms > budget {budget:.0f} ms")
+        if result["forbidden"]:
+            failures.append(f"{module}: imports {', '.join(result['forbidden'])} eagerly")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import times of the entry modules against their budgets")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module; the median is reported")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget, e.g. on slower machines")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS_MS), help="Modules to check (default: all budgeted)")
+    args = parser.parse_args()
+
+    results = {module: measure(module, args.repeat) for module in args.modules}
+    print(f"{'module':<24}{'median ms':>11}{'budget ms':>11}")
+    for module, result in results.items():
+        print(f"{module:<24}{result['median_ms']:>11}{BUDGETS_MS[module] * args.scale:>11.0f}")
+
+    failures = check(results, args.scale)
+    if failures:
+        print(f"\n{len(failures)} import-time budget failure(s):")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nAll imports within budget")
+
+
+if __name__ == "__main__":
+    main()
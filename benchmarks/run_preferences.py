@@ -0,0 +1,70 @@
+"""Preference extraction cases: run each query through extract_preferences and compare the
+persona and confidence with the expected ones.
+
+Queries at or above PREFERENCE_CONFIDENCE skip the LLM, so a wrong persona there goes
+straight into the tool calls; fails (exit 1) on any mismatch:
+
+    python -m benchmarks.run_preferences
+"""
+import sys
+from typing import Dict, List, Tuple
+from src.utils.preferences import PREFERENCE_CONFIDENCE, extract_preferences
+
+# query -> (persona, confidence rounded to 2 places)
+CASES: Dict[str, Tuple[Dict, float]] = {
+    "nursing in Texas under $30,000 a year": ({"budget": 30000, "location": "Texas", "major": "nursing"}, 1.0),
+    "nursing in Texas under 30000 per year": ({"budget": 30000, "location": "Texas", "major": "nursing"}, 1.0),
+    "engineering schools with tuition under 40000": ({"budget": 40000, "major": "engineering", "intent": "cost"}, 1.0),
+    "nursing in Ohio under 40,000 dollars": ({"budget": 40000, "location": "Ohio", "major": "nursing"}, 1.0),
+    "nursing in Ohio under 40k usd": ({"budget": 40000, "location": "Ohio", "major": "nursing"}, 1.0),
+    "budget of 25,000 for nursing in Ohio": ({"budget": 25000, "location": "Ohio", "major": "nursing"}, 1.0),
+    "business schools in California under 50k": ({"budget": 50000, "location": "California", "major": "business"}, 1.0),
+    "cheap nursing schools in Florida": ({"budget": "low", "location": "Florida", "major": "nursing"}, 1.0),
+    # Years, scores and counts are not budgets, and leave the query to the LLM
+    "fall 2025 admission in Texas for nursing": ({"location": "Texas", "major": "nursing"}, 0.4),
+    "nursing in Texas for 2026 entry": ({"location": "Texas", "major": "nursing"}, 0.5),
+    "schools in Texas with 20,000 students for nursing": ({"location": "Texas", "major": "nursing"}, 0.4),
+    "schools with SAT under 1200": ({}, 0.0),
+    "SAT under 1200 and tuition under 30000": ({"budget": 30000, "intent": "cost"}, 0.4),
+    # A bare number without a money word is ambiguous
+    "nursing in Texas under 30000": ({"location": "Texas", "major": "nursing"}, 0.5),
+    # A state after an alias city is the city's own; the location must not widen to the whole state
+    "computer science in Boston, MA": ({"location": "Boston", "major": "computer science"}, 1.0),
+    "colleges in NYC, NY": ({"location": "NYC"}, 1.0),
+    "nursing in Cambridge, MA": ({"location": "Cambridge, MA", "major": "nursing"}, 1.0),
+    # The intent separates questions about the same place or schools
+    "What universities are in Boston?": ({"location": "Boston"}, 1.0),
+    "What's the weather like in Boston?": ({"location": "Boston", "intent": "weather"}, 1.0),
+    "Compare Harvard and MIT": ({"institution": "Harvard, MIT", "intent": "compare"}, 1.0),
+    "Which is cheaper, Harvard or MIT?": ({"institution": "Harvard, MIT", "intent": "cost"}, 1.0),
+    # Questions the persona can't express go to the LLM
+    "acceptance rate at MIT": ({"institution": "MIT"}, 0.33),
+    # Curated aliases are institutions however short
+    "compare ut and tamu": ({"institution": "ut, tamu", "intent": "compare"}, 1.0),
+}
+
+
+def check() -> List[str]:
+    """Describe every case whose persona or confidence differs from the expected one."""
+    failures = []
+    for query, (persona, confidence) in CASES.items():
+        found, found_confidence = extract_preferences(query)
+        if found != persona or round(found_confidence, 2) != confidence:
+            failures.append(f"{query!r}: got {found} at {found_confidence:.2f}, expected {persona} at {confidence:.2f}")
+    return failures
+
+
+def main():
+    failures = check()
+    skipped_llm = sum(confidence >= PREFERENCE_CONFIDENCE for _, confidence in CASES.values())
+    print(f"{len(CASES)} cases, {skipped_llm} confident enough to skip the LLM")
+    if failures:
+        print(f"\n{len(failures)} preference extraction failure(s):")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("All preference cases match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Reconcile cases: check which tool calls correct_tool_calls rewrites to match the persona.
+
+With PARALLEL_PLAN the gatherer picks its tool arguments before the persona is known, and
+every correction re-runs a tool, so only real conflicts may be corrected; fails (exit 1)
+on any mismatch:
+
+    python -m benchmarks.run_reconcile
+"""
+import sys
+from typing import Dict, List, Optional, Tuple
+from src.agents.gatherer import correct_tool_calls
+
+# (persona, tool arguments) -> corrected arguments, or None when the call is left alone
+CASES: List[Tuple[Dict, Dict, Optional[Dict]]] = [
+    # Conflicts are corrected
+    ({"location": "California"}, {"location": "Texas"}, {"location": "California"}),
+    ({"institution": "MIT"}, {"institution": "Harvard"}, {"institution": "MIT"}),
+    ({"degree_level": "associate"}, {"location": "Ohio", "degree_level": "bachelor"},
+     {"location": "Ohio", "degree_level": "associate"}),
+    ({"location": "Ohio"}, {"major": "nursing"}, {"major": "nursing", "location": "Ohio"}),
+    # A narrower location is compatible, not a contradiction
+    ({"location": "California"}, {"location": "Los Angeles, CA"}, None),
+    ({"location": "Boston"}, {"location": "Cambridge, MA"}, None),
+    ({"location": "Los Angeles, CA"}, {"location": "California"}, None),
+    # So is a call that names the persona's schools and more, or some of them
+    ({"institution": "MIT"}, {"institution": "MIT, Harvard"}, None),
+    ({"institution": "MIT, Harvard"}, {"institution": "Massachusetts Institute of Technology"}, None),
+    # Named institutions already pin the location
+    ({"location": "Texas"}, {"institution": "Stanford"}, None),
+]
+
+
+def check() -> List[str]:
+    """Describe every case whose correction differs from the expected one."""
+    failures = []
+    for persona, args, expected in CASES:
+        corrections = correct_tool_calls(persona, [{"name": "university_search", "args": args}])
+        corrected = corrections[0]["args"] if corrections else None
+        if corrected != expected:
+            failures.append(f"{persona} / {args}: got {corrected}, expected {expected}")
+    return failures
+
+
+def main():
+    failures = check()
+    print(f"{len(CASES)} cases")
+    if failures:
+        print(f"\n{len(failures)} reconcile failure(s):")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("All reconcile cases match")
+
+
+if __name__ == "__main__":
+    main()
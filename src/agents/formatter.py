@@ -1,50 +1,135 @@
 import os
-from typing import Dict
-from langchain_core.prompts import ChatPromptTemplate
-from src.utils.shared_llm import get_shared_llm
+import re
+import json
+from typing import Dict, List
+from src.utils.shared_llm import chat_prompt, get_shared_llm, llm_factory
+from src.utils.graph_builder import build_elements
+from src.utils.tracing import annotate
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Use shared LLM client
-client = get_shared_llm()
-
-prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are an expert at creating knowledge graphs from university reports. 
-    
-Create a knowledge graph with nodes and edges representing universities, programs, locations, and relationships.
-
-Output ONLY valid JSON in this format:
-{{
-  "nodes": [
-    {{"data": {{"id": "unique_id", "label": "TYPE", "name": "display_name", "description": "detailed_description"}}}}
-  ],
-  "edges": [
-    {{"data": {{"id": "edge_id", "source": "node_id", "target": "node_id", "label": "RELATIONSHIP", "description": "relationship_description"}}}}
-  ]
-}}
-
-Extract universities, majors, locations, costs, and relationships. Use meaningful labels and unique IDs."""),
-    
+# Ask the LLM for one-line summaries of the university nodes; the graph itself is built locally
+FORMATTER_ENRICH = os.getenv("FORMATTER_ENRICH", "0").lower() not in ("0", "false", "no")
+FORMATTER_ENRICH_MAX_NODES = int(os.getenv("FORMATTER_ENRICH_MAX_NODES", "10"))
+# Report characters sent with the enrichment prompt
+FORMATTER_ENRICH_MAX_CHARS = int(os.getenv("FORMATTER_ENRICH_MAX_CHARS", "3000"))
+
+enrich_prompt = (
+    ("system", """You annotate the university nodes of a knowledge graph for a student.
+
+For each university write one short sentence on why it fits (or doesn't fit) the student's request.
+Output ONLY a JSON object mapping node id to sentence, for example:
+{{"univ-123456": "Affordable public option with a strong engineering school."}}"""),
+
     ("human", """
-University Report:
+User Query: {query}
+
+Report:
 {report}
 
-Create a knowledge graph JSON. Output only the JSON.
+Universities (id: name, details):
+{universities}
+
+Output only the JSON object.
 """)
-])
+)
+
+@llm_factory
+def get_enrich_chain():
+    """Enrichment prompt on the shared LLM client, built on first use"""
+    return chat_prompt(enrich_prompt) | get_shared_llm()
+
+def _enrich_inputs(elements: Dict, query: str, report: str):
+    universities = [node["data"] for node in elements["nodes"] if node["data"]["label"] == "UNIVERSITY"][:FORMATTER_ENRICH_MAX_NODES]
+    inputs = {
+        "query": query,
+        "report": report[:FORMATTER_ENRICH_MAX_CHARS] or "(not written yet)",
+        "universities": "\n".join(f"{data['id']}: {data['name']}, {data['description']}" for data in universities),
+    }
+    return universities, inputs
+
+def _apply_summaries(elements: Dict, universities: List[Dict], content) -> Dict:
+    match = re.search(r"\{.*\}", str(content), re.DOTALL)
+    try:
+        summaries = json.loads(match.group(0)) if match else {}
+    except json.JSONDecodeError:
+        summaries = {}
+    if not isinstance(summaries, dict):
+        summaries = {}
+
+    enriched = 0
+    for data in universities:
+        summary = summaries.get(data["id"])
+        if isinstance(summary, str) and summary.strip():
+            data["summary"] = summary.strip()
+            data["description"] = f"{data['summary']}\n{data['description']}"
+            enriched += 1
+    annotate(enriched_nodes=enriched)
+    return elements
+
+def enrich_elements(elements: Dict, query: str, report: str = "") -> Dict:
+    """Add LLM-written summaries to the university nodes; the graph is returned unchanged if the reply is unusable."""
+    universities, inputs = _enrich_inputs(elements, query, report)
+    if not universities:
+        return elements
+    return _apply_summaries(elements, universities, get_enrich_chain().invoke(inputs).content)
+
+async def aenrich_elements(elements: Dict, query: str, report: str = "") -> Dict:
+    """Async enrich_elements"""
+    universities, inputs = _enrich_inputs(elements, query, report)
+    if not universities:
+        return elements
+    return _apply_summaries(elements, universities, (await get_enrich_chain().ainvoke(inputs)).content)
+
+def _build_elements(state: Dict) -> Dict:
+    elements = build_elements(state)
+    annotate(nodes=len(elements["nodes"]), edges=len(elements["edges"]))
+    return elements
 
-chain = prompt | client
+def build_graph_json(state: Dict, report: str = "") -> str:
+    elements = _build_elements(state)
+    if FORMATTER_ENRICH:
+        try:
+            elements = enrich_elements(elements, state.get("query", ""), report)
+        except Exception as e:
+            # Enrichment is optional; keep the deterministic graph
+            print(f"Knowledge graph enrichment failed: {e}")
+    return json.dumps(elements)
+
+async def abuild_graph_json(state: Dict, report: str = "") -> str:
+    elements = _build_elements(state)
+    if FORMATTER_ENRICH:
+        try:
+            elements = await aenrich_elements(elements, state.get("query", ""), report)
+        except Exception as e:
+            print(f"Knowledge graph enrichment failed: {e}")
+    return json.dumps(elements)
 
 def formatter_agent(state: Dict) -> Dict:
-    """Generate a knowledge graph JSON from university report"""
-    
+    """Build the knowledge graph JSON from the gathered data once the report is written"""
+
+    print("Generating knowledge graph...")
+
+    return {**state, "knowledge_graph": build_graph_json(state, state.get("report") or "")}
+
+async def aformatter_agent(state: Dict) -> Dict:
+    """Async formatter_agent"""
+
     print("Generating knowledge graph...")
-    
-    # Let LLM handle everything including JSON generation
-    response = chain.invoke({"report": state.get("report", "")})
-    
-    # Let the LLM handle the response format - no hardcoded parsing
-    return {**state, "knowledge_graph": response.content}
 
+    return {**state, "knowledge_graph": await abuild_graph_json(state, state.get("report") or "")}
+
+def data_formatter_agent(state: Dict) -> Dict:
+    """Build the knowledge graph JSON from the gathered tool results, without waiting for the report"""
+
+    print("Generating knowledge graph from gathered data...")
+
+    return {**state, "knowledge_graph": build_graph_json(state)}
+
+async def adata_formatter_agent(state: Dict) -> Dict:
+    """Async data_formatter_agent"""
+
+    print("Generating knowledge graph from gathered data...")
 
+    return {**state, "knowledge_graph": await abuild_graph_json(state)}
@@ -1,21 +1,31 @@
 import os
-from typing import Dict
-from langchain_core.prompts import ChatPromptTemplate
+import math
+import time
+import asyncio
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List
 from src.utils.tools import university_search, university_comparison, cost_analysis, get_weather_data
-from src.utils.shared_llm import get_shared_llm
+from src.utils.shared_llm import chat_prompt, get_shared_llm, llm_factory
+from src.utils.tracing import span, annotate
+from src.utils.preferences import parse_persona
+from src.utils.query_cache import canonical_persona
+from src.utils.query_builder import parse_institutions, parse_location
+from src.utils.names import CURATED_ALIASES
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Use shared LLM client
-tool_llm = get_shared_llm()
-
 # Let LLM discover tools dynamically
 tools = [university_search, university_comparison, cost_analysis, get_weather_data]
-tool_llm_with_tools = tool_llm.bind_tools(tools)
+tools_by_name = {tool.name: tool for tool in tools}
+
+# Concurrency cap and per-tool timeout (seconds) for tool execution
+MAX_TOOL_WORKERS = int(os.getenv("GATHER_MAX_WORKERS", "4"))
+TOOL_TIMEOUT = float(os.getenv("GATHER_TOOL_TIMEOUT", "60"))
 
 # Tool calling prompt
-tool_prompt = ChatPromptTemplate.from_messages([
+tool_prompt = (
     ("system", """You are an intelligent university planning assistant. Based on the user's query and persona, determine which tools to call.
 
 Available tools:
@@ -42,41 +52,235 @@ Call the most appropriate tool(s) with all relevant parameters."""),
 User Persona: {persona}
 
 Determine which tool(s) to call and extract the relevant parameters. Be efficient and call each tool only once.""")
+)
+
+@llm_factory
+def get_tool_chain():
+    """Tool-selection prompt on the shared LLM client with the tools bound, built on first use"""
+    return chat_prompt(tool_prompt) | get_shared_llm().bind_tools(tools)
+
+def run_tool(call: Dict):
+    """Invoke one tool call inside a tool span."""
+    with span(call["name"], kind="tool", args=str(call.get("args", {}))) as tool_span:
+        result = tools_by_name[call["name"]].invoke(call.get("args", {}))
+        if isinstance(result, dict):
+            tool_span.set_attributes(rows=len(result.get("rows") or []), error=result.get("error"))
+        return result
+
+def run_tool_calls(tool_calls: List[Dict], max_workers: int = MAX_TOOL_WORKERS, timeout: float = TOOL_TIMEOUT) -> Dict:
+    """Run tool calls concurrently and merge their results in call order.
+
+    Each call gets `timeout` seconds from when it starts running, as in arun_tool_calls. A call
+    that overruns is reported as a timeout and its result discarded; a worker thread can't be
+    interrupted, so it finishes in the background, but calls still queued behind it are cancelled.
+    """
+    calls = [call for call in tool_calls if call.get("name") in tools_by_name]
+    if not calls:
+        return {}
+    
+    workers = max(1, min(max_workers, len(calls)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gather")
+    started: Dict[int, float] = {}
+    
+    def timed(index: int, call: Dict):
+        started[index] = time.monotonic()
+        return run_tool(call)
+    
+    futures = {}
+    for index, call in enumerate(calls):
+        print(f"Executing tool: {call['name']} with args: {call.get('args', {})}")
+        # Each call runs in a copy of the current context so its spans nest under this node
+        futures[executor.submit(contextvars.copy_context().run, timed, index, call)] = index
+    
+    # Calls queued behind the concurrency cap get one timeout per wave, counted from submission
+    waves = math.ceil(len(calls) / workers)
+    queued_deadline = time.monotonic() + timeout * waves
+    outcomes: Dict[int, object] = {}
+    pending = set(futures)
+    try:
+        while pending:
+            deadlines = [started[futures[future]] + timeout for future in pending if futures[future] in started]
+            wait(pending, timeout=max(0.0, min(deadlines + [queued_deadline]) - time.monotonic()), return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(pending):
+                index, name = futures[future], calls[futures[future]]["name"]
+                if future.done():
+                    try:
+                        outcomes[index] = future.result()
+                    except Exception as e:
+                        outcomes[index] = f"Tool error: {str(e)}"
+                elif index in started and now >= started[index] + timeout:
+                    outcomes[index] = f"Tool timeout: {name} did not finish within {timeout}s"
+                elif index not in started and now >= queued_deadline:
+                    outcomes[index] = f"Tool timeout: {name} did not start within {timeout * waves}s"
+                else:
+                    continue
+                pending.discard(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return {calls[index]["name"]: outcomes[index] for index in range(len(calls))}
+
+async def arun_tool(call: Dict):
+    """Await one tool call inside a tool span."""
+    with span(call["name"], kind="tool", args=str(call.get("args", {}))) as tool_span:
+        result = await tools_by_name[call["name"]].ainvoke(call.get("args", {}))
+        if isinstance(result, dict):
+            tool_span.set_attributes(rows=len(result.get("rows") or []), error=result.get("error"))
+        return result
+
+async def arun_tool_calls(tool_calls: List[Dict], max_workers: int = MAX_TOOL_WORKERS, timeout: float = TOOL_TIMEOUT) -> Dict:
+    """Async run_tool_calls: tool calls run as tasks on the event loop, at most max_workers at a time."""
+    calls = [call for call in tool_calls if call.get("name") in tools_by_name]
+    if not calls:
+        return {}
+    
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+    
+    async def run(call: Dict):
+        async with semaphore:
+            # The timeout starts once the call has a slot
+            return await asyncio.wait_for(arun_tool(call), timeout)
+    
+    for call in calls:
+        print(f"Executing tool: {call['name']} with args: {call.get('args', {})}")
+    # Tasks copy the current context, so their spans nest under this node
+    outcomes = await asyncio.gather(*(run(call) for call in calls), return_exceptions=True)
+    
+    results = {}
+    for call, outcome in zip(calls, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            results[call["name"]] = f"Tool timeout: {call['name']} did not finish within {timeout}s"
+        elif isinstance(outcome, Exception):
+            results[call["name"]] = f"Tool error: {str(outcome)}"
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results[call["name"]] = outcome
+    return results
+
+def _select_tools_inputs(state: Dict) -> Dict:
+    return {"query": state.get("query", ""), "persona": state.get("user_persona", {})}
 
-])
+def _recorded_calls(tool_calls: List[Dict]) -> List[Dict]:
+    # Keep the calls so a persona extracted in parallel can be checked against them
+    return [{"name": call["name"], "args": call.get("args", {})} for call in tool_calls if call.get("name") in tools_by_name]
 
 def gatherer_agent(state: Dict) -> Dict:
     """Gather university data using LLM-driven tool calling."""
     query = state.get("query", "")
-    persona = state.get("user_persona", {})
     
     print(f"LLM tool calling for query: {query}")
     
     # Let LLM decide which tools to call
-    chain = tool_prompt | tool_llm_with_tools
-    response = chain.invoke({
-        "query": query,
-        "persona": persona
-    })
+    response = get_tool_chain().invoke(_select_tools_inputs(state))
     
     print(f"LLM response: {response.content}")
     
     # Let LLM handle tool execution and result processing
     tool_calls = response.tool_calls if hasattr(response, 'tool_calls') else []
     
-    # Let LLM handle all tool execution logic
-    results = {}
-    for tool_call in tool_calls:
-        tool_name = tool_call.get("name")
-        tool_args = tool_call.get("args", {})
-        
-        print(f"Executing tool: {tool_name} with args: {tool_args}")
-        
-        # Let LLM handle tool discovery and execution
-        for tool in tools:
-            if tool.name == tool_name:
-                result = tool.invoke(tool_args)
-                results[tool_name] = result
-                break
-    
-    return {**state, **results}
+    # Execute the selected tools concurrently
+    results = run_tool_calls(tool_calls)
+    
+    return {**state, **results, "tool_calls": _recorded_calls(tool_calls)}
+
+async def agatherer_agent(state: Dict) -> Dict:
+    """Async gatherer_agent: awaits tool selection, then the tools."""
+    print(f"LLM tool calling for query: {state.get('query', '')}")
+    
+    response = await get_tool_chain().ainvoke(_select_tools_inputs(state))
+    
+    print(f"LLM response: {response.content}")
+    
+    tool_calls = response.tool_calls if hasattr(response, 'tool_calls') else []
+    results = await arun_tool_calls(tool_calls)
+    return {**state, **results, "tool_calls": _recorded_calls(tool_calls)}
+
+# Database tools whose arguments are checked against the persona
+DATA_TOOLS = ("university_search", "cost_analysis", "university_comparison")
+
+def _places(location: str):
+    """States and lower-cased cities a location covers, or None when it can't be parsed."""
+    parsed = parse_location(location or "")
+    if parsed is None:
+        return None
+    states, cities = parsed
+    return set(states) | {state for _, state in cities if state}, {city.lower() for city, _ in cities}
+
+def _location_conflicts(wanted: str, used: str) -> bool:
+    """Only places with nothing in common conflict; "Los Angeles, CA" is a narrower "California"."""
+    wanted_places, used_places = _places(wanted), _places(used)
+    if not wanted_places or not used_places:
+        return False
+    (wanted_states, wanted_cities), (used_states, used_cities) = wanted_places, used_places
+    if wanted_states and used_states:
+        return not wanted_states & used_states
+    if wanted_cities and used_cities:
+        return not wanted_cities & used_cities
+    return False
+
+def _institution_names(institution: str) -> set:
+    return {CURATED_ALIASES.get(name.lower(), name).lower() for name in parse_institutions(institution or "")}
+
+def _institutions_conflict(wanted: str, used: str) -> bool:
+    """Only lists where neither contains the other conflict; a call that adds a school keeps it."""
+    wanted_names, used_names = _institution_names(wanted), _institution_names(used)
+    return not (wanted_names <= used_names or used_names <= wanted_names)
+
+def correct_tool_calls(persona, tool_calls: List[Dict]) -> List[Dict]:
+    """Calls whose location, institution or degree level contradict the extracted persona,
+    with those arguments replaced by the persona's values. Narrower locations and calls
+    naming more schools than the persona are compatible and left alone."""
+    wanted = {key: value for key, value in parse_persona(persona).items() if key in ("location", "institution", "degree_level")}
+    wanted = {key: value if isinstance(value, str) else ", ".join(map(str, value)) for key, value in wanted.items()}
+    wanted_canonical = canonical_persona(wanted)
+    corrections = []
+    for call in tool_calls:
+        if call["name"] not in DATA_TOOLS:
+            continue
+        args = dict(call.get("args", {}))
+        used = canonical_persona({key: args.get(key) for key in ("location", "institution", "degree_level")})
+        for field in ("institution", "location", "degree_level"):
+            if field not in wanted_canonical or used.get(field) == wanted_canonical[field]:
+                continue
+            # Named institutions already pin the location; don't narrow them further
+            if field == "location" and used.get("institution"):
+                continue
+            # A call that left an institution out isn't contradicting the persona
+            if field == "institution" and not used.get("institution"):
+                continue
+            if field == "location" and used.get("location") and not _location_conflicts(wanted[field], args["location"]):
+                continue
+            if field == "institution" and not _institutions_conflict(wanted[field], args["institution"]):
+                continue
+            args[field] = wanted[field]
+        if args != call.get("args", {}):
+            corrections.append({"name": call["name"], "args": args})
+    return corrections
+
+def reconcile_agent(state: Dict) -> Dict:
+    """Re-run only the tool calls that conflict with the persona extracted alongside them."""
+    corrections = correct_tool_calls(state.get("user_persona"), state.get("tool_calls") or [])
+    annotate(corrections=len(corrections))
+    if not corrections:
+        return state
+    
+    print(f"Correcting tool calls to match the extracted persona: {corrections}")
+    results = run_tool_calls(corrections)
+    corrected = {call["name"]: call for call in corrections}
+    calls = [corrected.get(call["name"], call) for call in state.get("tool_calls") or []]
+    return {**state, **results, "tool_calls": calls}
+
+async def areconcile_agent(state: Dict) -> Dict:
+    """Async reconcile_agent"""
+    corrections = correct_tool_calls(state.get("user_persona"), state.get("tool_calls") or [])
+    annotate(corrections=len(corrections))
+    if not corrections:
+        return state
+    
+    print(f"Correcting tool calls to match the extracted persona: {corrections}")
+    results = await arun_tool_calls(corrections)
+    corrected = {call["name"]: call for call in corrections}
+    calls = [corrected.get(call["name"], call) for call in state.get("tool_calls") or []]
+    return {**state, **results, "tool_calls": calls}
@@ -1,15 +1,12 @@
-import os
 from typing import Dict
-from langchain_core.prompts import ChatPromptTemplate
-from src.utils.shared_llm import get_shared_llm
+from src.utils.shared_llm import chat_prompt, get_shared_llm, llm_factory
+from src.utils.preferences import PREFERENCE_CONFIDENCE, extract_preferences, merge_preferences
+from src.utils.tracing import annotate
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Use shared LLM client
-client = get_shared_llm()
-
-prompt = ChatPromptTemplate.from_messages([
+prompt = (
     ("system", 
     """You are a university planning assistant. Extract user preferences from queries.
 
@@ -21,17 +18,40 @@ Output only valid JSON with these fields."""),
     """Extract preferences from this query: {query}
 
 Output only valid JSON.""")
+)
 
-])
+@llm_factory
+def get_chain():
+    """Extraction prompt on the shared LLM client, built on first use"""
+    return chat_prompt(prompt) | get_shared_llm()
 
-chain = prompt | client
+def _rule_persona(query: str):
+    """Rule-based persona, and whether it is too unsure to use without the LLM."""
+    persona, confidence = extract_preferences(query)
+    fallback = confidence < PREFERENCE_CONFIDENCE
+    annotate(rule_confidence=round(confidence, 2), llm_fallback=fallback)
+    return persona, fallback
 
 def planner_agent(state: Dict) -> Dict:
-    """Extract user preferences using LLM."""
+    """Extract user preferences with the local rules, asking the LLM only when they aren't confident."""
+    print("Extracting user preferences...")
+    
+    query = state.get("query", "")
+    persona, fallback = _rule_persona(query)
+    if not fallback:
+        return {**state, "user_persona": persona}
+    
+    response = get_chain().invoke({"query": query})
+    return {**state, "user_persona": merge_preferences(persona, response.content)}
+
+async def aplanner_agent(state: Dict) -> Dict:
+    """Async planner_agent."""
     print("Extracting user preferences...")
     
-    # Let LLM handle everything including JSON parsing
-    response = chain.invoke({"query": state.get("query", "")})
+    query = state.get("query", "")
+    persona, fallback = _rule_persona(query)
+    if not fallback:
+        return {**state, "user_persona": persona}
     
-    # Let the LLM handle the response format - no hardcoded parsing
-    return {**state, "user_persona": response.content}
+    response = await get_chain().ainvoke({"query": query})
+    return {**state, "user_persona": merge_preferences(persona, response.content)}
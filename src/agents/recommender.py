@@ -1,15 +1,11 @@
-import os
 from typing import Dict
-from langchain_core.prompts import ChatPromptTemplate
-from src.utils.shared_llm import get_shared_llm
+from src.utils.shared_llm import chat_prompt, get_shared_llm, llm_factory
+from src.utils.context import build_recommender_context
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Use shared LLM client
-client = get_shared_llm()
-
-prompt = ChatPromptTemplate.from_messages([
+prompt = (
     ("system", 
     """You are a world-class university planning expert. Create comprehensive university recommendation reports.
 
@@ -29,18 +25,43 @@ User Query: {query}
 All Available Data: {all_data}
 
 Generate a comprehensive report that directly addresses the user's query and helps them make an informed decision.""")
-])
+)
 
-chain = prompt | client
+@llm_factory
+def get_chain():
+    """Report prompt on the shared LLM client, built on first use"""
+    return chat_prompt(prompt) | get_shared_llm()
 
 def recommender_agent(state: Dict) -> Dict:
     """Generate university recommendation report using LLM."""
     print("Generating recommendation report...")
     
-    # Let LLM handle all the data processing
-    response = chain.invoke({
+    # Only the persona and tool results, de-duplicated and within the token budget
+    context, context_tokens = build_recommender_context(state)
+    print(f"Recommender context: {context_tokens} tokens")
+    
+    # Stream the report so run_graph can surface tokens as they arrive
+    chunks = []
+    for chunk in get_chain().stream({
+        "query": state.get("query", ""),
+        "all_data": context
+    }):
+        chunks.append(chunk.content)
+    
+    return {**state, "report": "".join(chunks)}
+
+async def arecommender_agent(state: Dict) -> Dict:
+    """Async recommender_agent; tokens stream without holding a thread."""
+    print("Generating recommendation report...")
+    
+    context, context_tokens = build_recommender_context(state)
+    print(f"Recommender context: {context_tokens} tokens")
+    
+    chunks = []
+    async for chunk in get_chain().astream({
         "query": state.get("query", ""),
-        "all_data": state
-    })
+        "all_data": context
+    }):
+        chunks.append(chunk.content)
     
-    return {**state, "report": response.content}
\ No newline at end of file
+    return {**state, "report": "".join(chunks)}
@@ -0,0 +1,199 @@
+"""Offline batch planning: run a JSONL or CSV file of queries through the graph.
+
+    python -m src.graph.batch queries.csv --output reports.jsonl --concurrency 8
+
+Each input row needs a query (and optionally an id; the row number is used otherwise).
+Results are appended to the output JSONL as each query finishes, and the output doubles
+as the checkpoint: rerunning the same command skips ids that already succeeded, so a
+crashed job resumes where it stopped. A resumed job appends new lines for ids that
+failed before, so an id can appear more than once: the last line wins (see read_results).
+Identical queries in a job run once, and queries with the same extracted preferences and
+intent (a weather question never reuses a school search) share results through the query
+cache; set QUERY_CACHE=0 to run every query in full.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+from typing import Dict, Iterable, List, Optional, TextIO
+from src.graph.runner import arun_graph, warm_up
+from src.utils.tracing import Span, Trace
+
+# Concurrent queries in a batch job
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# State keys written to the output for each query
+OUTPUT_KEYS = ["user_persona", "report", "knowledge_graph", "cache_hit"]
+
+
+def read_queries(path: str) -> List[Dict]:
+    """Rows of a .jsonl or .csv file as {"id", "query", ...}; rows without a query are skipped."""
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    queries = []
+    for number, row in enumerate(rows, start=1):
+        query = str(row.get("query") or "").strip()
+        if not query:
+            print(f"Skipping row {number}: no query")
+            continue
+        queries.append({**row, "id": str(row.get("id") or number), "query": query})
+    return queries
+
+
+def read_results(path: str) -> Dict[str, Dict]:
+    """The output file's records by id. A resumed job appends a new line for each id that
+    failed before, so the last record for an id wins; read results through this."""
+    results: Dict[str, Dict] = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by a crash; that query runs again
+                continue
+            results[str(record.get("id"))] = record
+    return results
+
+
+def completed_ids(path: str) -> set:
+    """Ids that already have a successful result in the output file."""
+    return {result_id for result_id, record in read_results(path).items() if record.get("status") == "ok"}
+
+
+def _stage(span: Span) -> Optional[str]:
+    while span is not None:
+        if span.kind == "node":
+            return span.name
+        span = span.parent
+    return None
+
+
+def stage_costs(trace: Trace) -> Dict[str, Dict[str, float]]:
+    """Per node: wall time, LLM calls and tokens, tool calls and SQL time of one run."""
+    costs: Dict[str, Dict[str, float]] = {}
+    for span in trace.spans:
+        stage = _stage(span)
+        if stage is None:
+            continue
+        cost = costs.setdefault(stage, {"ms": 0.0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                        "tool_calls": 0, "sql_ms": 0.0})
+        if span.kind == "node":
+            cost["ms"] += span.duration_ms or 0
+        elif span.kind == "llm" and not span.attributes.get("cache_hit"):
+            cost["llm_calls"] += 1
+            cost["prompt_tokens"] += span.attributes.get("prompt_tokens", 0)
+            cost["completion_tokens"] += span.attributes.get("completion_tokens", 0)
+        elif span.kind == "tool":
+            cost["tool_calls"] += 1
+        elif span.kind == "sql":
+            cost["sql_ms"] += span.duration_ms or 0
+    return {stage: {key: round(value, 2) for key, value in cost.items()} for stage, cost in costs.items()}
+
+
+async def run_one(query: str) -> Dict:
+    """Run one query; returns the output fields, with status "error" instead of raising."""
+    traces = []
+    start = time.perf_counter()
+    try:
+        final_state = await arun_graph({"query": query}, trace_callback=traces.append)
+        record = {"status": "ok", **{key: (final_state or {}).get(key) for key in OUTPUT_KEYS}}
+    except Exception as e:
+        record = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    record["stages"] = stage_costs(traces[0]) if traces else {}
+    return record
+
+
+def summarize(records: List[Dict], elapsed: float, skipped: int) -> Dict:
+    """Throughput and mean per-stage cost of the queries run in this job."""
+    from src.utils.scheduler import get_scheduler
+    ok = [record for record in records if record["status"] == "ok"]
+    stages: Dict[str, Dict[str, float]] = {}
+    for record in ok:
+        for stage, cost in record["stages"].items():
+            totals = stages.setdefault(stage, {})
+            for key, value in cost.items():
+                totals[key] = totals.get(key, 0) + value
+    return {
+        "completed": len(ok),
+        "failed": len(records) - len(ok),
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 2),
+        # Failures finish fast, so only completed queries count as throughput
+        "queries_per_minute": round(len(ok) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "per_query_stage_cost": {stage: {key: round(value / len(ok), 2) for key, value in totals.items()}
+                                 for stage, totals in stages.items()},
+        "scheduler": get_scheduler().stats(),
+    }
+
+
+async def run_batch(queries: List[Dict], output: TextIO, concurrency: int = BATCH_CONCURRENCY,
+                    skip_ids: Iterable[str] = (), log: TextIO = sys.stdout) -> Dict:
+    """Run the queries with at most `concurrency` in flight, appending one JSON line per query id to output."""
+    skip_ids = set(skip_ids)
+    pending = [entry for entry in queries if entry["id"] not in skip_ids]
+    skipped = len(queries) - len(pending)
+
+    # Identical queries run once and share the result
+    groups: Dict[str, List[Dict]] = {}
+    for entry in pending:
+        groups.setdefault(" ".join(entry["query"].lower().split()), []).append(entry)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    records: List[Dict] = []
+    start = time.perf_counter()
+
+    async def run_group(entries: List[Dict]) -> None:
+        async with semaphore:
+            result = await run_one(entries[0]["query"])
+        for entry in entries:
+            record = {"id": entry["id"], "query": entry["query"], **result}
+            output.write(json.dumps(record, default=str) + "\n")
+            records.append(record)
+        # Flush per query so a crash loses at most the queries still in flight
+        output.flush()
+        print(f"[{len(records)}/{len(pending)}] {entries[0]['id']}: {result['status']} in {result['elapsed_ms'] / 1000:.1f}s",
+              file=log, flush=True)
+
+    await asyncio.gather(*(run_group(entries) for entries in groups.values()))
+    return summarize(records, time.perf_counter() - start, skipped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a file of university planning queries through the graph")
+    parser.add_argument("input", help="JSONL or CSV file with a query (and optional id) per row")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to; also the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Queries in flight at once")
+    parser.add_argument("--restart", action="store_true", help="Ignore existing results and start over")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' progress output")
+    args = parser.parse_args()
+
+    queries = read_queries(args.input)
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = completed_ids(args.output)
+    if done:
+        print(f"Resuming: {len(done)} queries already completed in {args.output}")
+
+    log = sys.stdout
+    with contextlib.ExitStack() as stack:
+        agents_output = sys.stdout if args.verbose else stack.enter_context(open(os.devnull, "w"))
+        stack.enter_context(contextlib.redirect_stdout(agents_output))
+        output = stack.enter_context(open(args.output, "a"))
+        warm_up()
+        summary = asyncio.run(run_batch(queries, output, args.concurrency, done, log=log))
+
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Checkpointing of graph state after every node.
+
+Runs started with a session and run id save their state after each node, so a failed
+run can resume from the last node that finished, and a finished run can re-execute
+just the nodes downstream of a changed field (e.g. only format, or recommend onwards)
+without repeating the gather step's LLM and SQL calls.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from src.graph.state import TOOL_RESULT_KEYS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# memory, sqlite (needs langgraph-checkpoint-sqlite) or none
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory").lower()
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "data/checkpoints.db")
+# Runs whose checkpoints are kept; older runs are deleted
+CHECKPOINT_MAX_RUNS = int(os.getenv("CHECKPOINT_MAX_RUNS", "200"))
+
+# Nodes in execution order
+NODE_ORDER = ["plan", "gather", "reconcile", "recommend", "format"]
+
+
+def field_readers(parallel_plan: bool = False, parallel_format: bool = False) -> Dict[str, str]:
+    """First node that reads each state field in a graph mode (see build_graph); changing the
+    field re-runs that node and everything after it. Fields no node reads are left out."""
+    readers = {"query": "plan"}
+    if parallel_plan:
+        # Gather runs from the query alone; reconcile checks its calls against the persona
+        readers.update({"user_persona": "reconcile", "tool_calls": "reconcile"})
+    else:
+        readers["user_persona"] = "gather"
+    readers.update({key: "recommend" for key in TOOL_RESULT_KEYS})
+    if not parallel_format:
+        # The parallel formatter builds the knowledge graph from the tool results, not the report
+        readers["report"] = "format"
+    return readers
+
+
+def create_checkpointer(kind: str = CHECKPOINTER):
+    """A LangGraph checkpointer for the given backend, or None when checkpointing is off."""
+    if kind == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+        except ImportError:
+            raise RuntimeError("CHECKPOINTER=sqlite needs the langgraph-checkpoint-sqlite package")
+        os.makedirs(os.path.dirname(CHECKPOINT_PATH) or ".", exist_ok=True)
+        saver = SqliteSaver(sqlite3.connect(CHECKPOINT_PATH, check_same_thread=False))
+        saver.setup()
+        prune_checkpoints(saver)
+        return saver
+    if kind == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver()
+    return None
+
+
+def prune_checkpoints(saver, keep: Optional[str] = None, max_runs: int = CHECKPOINT_MAX_RUNS) -> int:
+    """Delete all but the max_runs most recently saved runs (plus keep) from a SQLite
+    checkpointer's database, including runs saved by earlier processes. Returns the number
+    of runs deleted; other checkpointers are left alone."""
+    if not hasattr(saver, "cursor"):
+        return 0
+    # Checkpoint ids are time-ordered, so a run's newest id dates its last save
+    with saver.cursor(transaction=False) as cur:
+        cur.execute(
+            "SELECT thread_id FROM checkpoints GROUP BY thread_id "
+            "ORDER BY MAX(checkpoint_id) DESC LIMIT -1 OFFSET ?",
+            (max_runs,),
+        )
+        expired = [row[0] for row in cur.fetchall() if row[0] != keep]
+    for old in expired:
+        saver.delete_thread(old)
+    return len(expired)
+
+
+_checkpointer = None
+_checkpointer_created = False
+_runs: "OrderedDict[str, None]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """The process-wide checkpointer, or None when CHECKPOINTER is none"""
+    global _checkpointer, _checkpointer_created
+    with _lock:
+        if not _checkpointer_created:
+            _checkpointer = create_checkpointer()
+            _checkpointer_created = True
+        return _checkpointer
+
+
+def thread_id(session_id: str, run_id: str) -> str:
+    return f"{session_id}:{run_id}"
+
+
+def run_config(session_id: str, run_id: str) -> Dict:
+    """Graph config selecting a run's checkpoints; also marks the run as recently used."""
+    key = thread_id(session_id, run_id)
+    checkpointer = get_checkpointer()
+    with _lock:
+        new = key not in _runs
+        _runs[key] = None
+        _runs.move_to_end(key)
+        expired = []
+        while len(_runs) > CHECKPOINT_MAX_RUNS:
+            expired.append(_runs.popitem(last=False)[0])
+    for old in expired:
+        checkpointer.delete_thread(old)
+    if new:
+        # _runs only knows this process's runs; a SQLite database also holds earlier ones
+        prune_checkpoints(checkpointer, keep=key)
+    return {"configurable": {"thread_id": key}}
+
+
+def first_node(fields: Iterable[str], parallel_plan: bool = False, parallel_format: bool = False) -> Optional[str]:
+    """Earliest node that reads any of the fields in the graph mode, or None if no node does."""
+    readers = field_readers(parallel_plan, parallel_format)
+    nodes = {readers[field] for field in fields if field in readers}
+    return min(nodes, key=NODE_ORDER.index) if nodes else None
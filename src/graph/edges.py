@@ -1,25 +1,81 @@
-from langgraph.graph import StateGraph
+from functools import partial
+from typing import Callable, List
 from src.graph.state import UniversityState
-from src.graph.nodes import (
-    plan_node,
-    gather_node,
-    recommend_node,
-    format_node,
-)
-
-def build_graph():
+
+# LangGraph's END node; route functions return it as a plain string so langgraph is only imported by build_graph
+END = "__end__"
+
+def as_node(func: Callable, afunc: Callable):
+    """One node for both drivers: graph.stream calls func, graph.astream awaits afunc."""
+    from langchain_core.runnables import RunnableLambda
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
+def route_after_plan(state: UniversityState) -> str:
+    """Finish right after planning when the query cache already had the results."""
+    return END if state.get("cache_hit") else "gather"
+
+def route_after_reconcile(state: UniversityState, next_nodes: List[str]):
+    """Finish after reconciling when the query cache already had the report."""
+    return END if state.get("cache_hit") else next_nodes
+
+def build_graph(parallel_format: bool = False, parallel_plan: bool = False, checkpointer=None):
+    """Build the workflow.
+
+    parallel_format: build the knowledge graph from the gathered data while the report
+    is being written, instead of after it.
+    parallel_plan: extract preferences and select/run tools concurrently from the query,
+    then reconcile them (re-running only tool calls that contradict the persona).
+    checkpointer: LangGraph checkpointer that saves the state after every node.
+    """
+    # LangGraph and the agents (LangChain tools) are the costliest imports in the app;
+    # load them when a graph is first compiled rather than when the runner is imported
+    from langgraph.graph import StateGraph
+    from src.graph.nodes import (
+        plan_node,
+        gather_node,
+        recommend_node,
+        format_node,
+        format_data_node,
+        plan_only_node,
+        reconcile_node,
+        aplan_node,
+        agather_node,
+        arecommend_node,
+        aformat_node,
+        aformat_data_node,
+        aplan_only_node,
+        areconcile_node,
+    )
+
     graph = StateGraph(state_schema=UniversityState)
 
-    graph.add_node("plan", plan_node)
-    graph.add_node("gather", gather_node)
-    graph.add_node("recommend", recommend_node)
-    graph.add_node("format", format_node)
+    graph.add_node("plan", as_node(plan_only_node, aplan_only_node) if parallel_plan else as_node(plan_node, aplan_node))
+    graph.add_node("gather", as_node(gather_node, agather_node))
+    graph.add_node("recommend", as_node(recommend_node, arecommend_node))
+    graph.add_node("format", as_node(format_data_node, aformat_data_node) if parallel_format else as_node(format_node, aformat_node))
 
-    graph.set_entry_point("plan")
     graph.set_finish_point("format")
 
-    graph.add_edge("plan", "gather")
-    graph.add_edge("gather", "recommend")
-    graph.add_edge("recommend", "format")
+    # With parallel_format the graph is built alongside the report once the data is final
+    next_nodes = ["recommend", "format"] if parallel_format else ["recommend"]
+
+    if parallel_plan:
+        # Fan out from the query, fan in at reconcile
+        graph.add_node("reconcile", as_node(reconcile_node, areconcile_node))
+        graph.set_entry_point("plan")
+        graph.set_entry_point("gather")
+        graph.add_edge(["plan", "gather"], "reconcile")
+        graph.add_conditional_edges("reconcile", partial(route_after_reconcile, next_nodes=next_nodes), next_nodes + [END])
+    else:
+        graph.set_entry_point("plan")
+        graph.add_conditional_edges("plan", route_after_plan, ["gather", END])
+        for node in next_nodes:
+            graph.add_edge("gather", node)
+
+    if parallel_format:
+        # Both branches finish the run
+        graph.set_finish_point("recommend")
+    else:
+        graph.add_edge("recommend", "format")
 
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
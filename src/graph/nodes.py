@@ -1,21 +1,99 @@
 from src.graph.state import UniversityState
-from src.agents.planner import planner_agent
-from src.agents.gatherer import gatherer_agent
-from src.agents.recommender import recommender_agent
-from src.agents.formatter import formatter_agent
+from src.agents.planner import planner_agent, aplanner_agent
+from src.agents.gatherer import gatherer_agent, reconcile_agent, agatherer_agent, areconcile_agent
+from src.agents.recommender import recommender_agent, arecommender_agent
+from src.agents.formatter import formatter_agent, data_formatter_agent, aformatter_agent, adata_formatter_agent
+from src.utils.tracing import span
+from src.utils.scheduler import llm_priority
+from src.utils.query_cache import get_query_cache
+
+def _changes(state: UniversityState, new_state: UniversityState) -> UniversityState:
+    """Keep only the keys an agent changed, so parallel branches don't write the same keys."""
+    return {key: value for key, value in new_state.items() if key not in state or state[key] is not value}
+
+def _from_query_cache(new_state: UniversityState, keys=None) -> UniversityState:
+    """Restore a cached run for the same (or a near-identical) persona and intent, if there is one."""
+    cache = get_query_cache()
+    cached = cache.get(new_state.get("user_persona"), new_state.get("query", "")) if cache else None
+    if not cached:
+        return new_state
+    print("Query cache hit: reusing cached results")
+    if keys is not None:
+        cached = {key: value for key, value in cached.items() if key in keys}
+    return {**new_state, **cached, "cache_hit": True}
 
 def plan_node(state: UniversityState) -> UniversityState:
     print("Running planner_node")
-    return planner_agent(state)
+    with span("plan", kind="node"):
+        return _changes(state, _from_query_cache(planner_agent(state)))
+
+def plan_only_node(state: UniversityState) -> UniversityState:
+    print("Running planner_node alongside the gatherer")
+    with span("plan", kind="node", parallel=True):
+        return _changes(state, planner_agent(state))
+
+def reconcile_node(state: UniversityState) -> UniversityState:
+    print("Running reconcile_node")
+    with span("reconcile", kind="node"):
+        new_state = reconcile_agent(state)
+        # Gathering already happened, so only the report and graph can come from the cache
+        return _changes(state, _from_query_cache(new_state, keys=("report", "knowledge_graph")))
 
 def gather_node(state: UniversityState) -> UniversityState:
     print("Running gather_node")
-    return gatherer_agent(state)
+    with span("gather", kind="node"):
+        return _changes(state, gatherer_agent(state))
 
 def recommend_node(state: UniversityState) -> UniversityState:
     print("Running recommender_node")
-    return recommender_agent(state)
+    # The streamed report is what the user is waiting on
+    with span("recommend", kind="node"), llm_priority("interactive"):
+        return _changes(state, recommender_agent(state))
 
 def format_node(state: UniversityState) -> UniversityState:
     print("Running formatter_node")
-    return formatter_agent(state)
+    with span("format", kind="node"), llm_priority("background"):
+        return _changes(state, formatter_agent(state))
+
+def format_data_node(state: UniversityState) -> UniversityState:
+    print("Running formatter_node from gathered data")
+    with span("format", kind="node", source="gathered_data"), llm_priority("background"):
+        return _changes(state, data_formatter_agent(state))
+
+# Async versions of the nodes, used when the graph runs with astream
+
+async def aplan_node(state: UniversityState) -> UniversityState:
+    print("Running planner_node")
+    with span("plan", kind="node"):
+        return _changes(state, _from_query_cache(await aplanner_agent(state)))
+
+async def aplan_only_node(state: UniversityState) -> UniversityState:
+    print("Running planner_node alongside the gatherer")
+    with span("plan", kind="node", parallel=True):
+        return _changes(state, await aplanner_agent(state))
+
+async def areconcile_node(state: UniversityState) -> UniversityState:
+    print("Running reconcile_node")
+    with span("reconcile", kind="node"):
+        new_state = await areconcile_agent(state)
+        return _changes(state, _from_query_cache(new_state, keys=("report", "knowledge_graph")))
+
+async def agather_node(state: UniversityState) -> UniversityState:
+    print("Running gather_node")
+    with span("gather", kind="node"):
+        return _changes(state, await agatherer_agent(state))
+
+async def arecommend_node(state: UniversityState) -> UniversityState:
+    print("Running recommender_node")
+    with span("recommend", kind="node"), llm_priority("interactive"):
+        return _changes(state, await arecommender_agent(state))
+
+async def aformat_node(state: UniversityState) -> UniversityState:
+    print("Running formatter_node")
+    with span("format", kind="node"), llm_priority("background"):
+        return _changes(state, await aformatter_agent(state))
+
+async def aformat_data_node(state: UniversityState) -> UniversityState:
+    print("Running formatter_node from gathered data")
+    with span("format", kind="node", source="gathered_data"), llm_priority("background"):
+        return _changes(state, await adata_formatter_agent(state))
@@ -1,17 +1,191 @@
+import os
+import time
+from functools import lru_cache
 from src.graph.edges import build_graph
 from src.graph.state import UniversityState
-from typing import Callable
+from src.utils.tracing import start_trace, TracingCallbackHandler
+from src.utils.query_cache import get_query_cache
+from src.utils.preferences import gazetteers
+from src.graph.checkpoints import NODE_ORDER, get_checkpointer, run_config, first_node
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
 
-def run_graph(initial_state: UniversityState, step_callback: Callable = None) -> UniversityState:
-    """Executes the university planning graph."""
-    graph = build_graph()
-    
-    # LangGraph's stream method allows for step-by-step execution
+# Node whose LLM tokens are streamed to callers
+STREAMING_NODE = "recommend"
+
+# Build the knowledge graph alongside the report instead of after it
+PARALLEL_FORMAT = os.getenv("PARALLEL_FORMAT", "").lower() in ("1", "true", "yes")
+
+# Extract preferences and run the gatherer's tool selection concurrently
+PARALLEL_PLAN = os.getenv("PARALLEL_PLAN", "").lower() in ("1", "true", "yes")
+
+@lru_cache(maxsize=None)
+def get_graph(parallel_format: bool = PARALLEL_FORMAT, parallel_plan: bool = PARALLEL_PLAN, checkpointed: bool = False):
+    """Build and compile the graph once per process and mode; checkpointed graphs save state after each node."""
+    checkpointer = get_checkpointer() if checkpointed else None
+    return build_graph(parallel_format=parallel_format, parallel_plan=parallel_plan, checkpointer=checkpointer)
+
+def warm_up() -> float:
+    """Import the agents, bind the gatherer tools, compile the graph and load the IPEDS snapshot and preference gazetteers ahead of the first request."""
+    start = time.perf_counter()
+    # Compiling imports LangGraph and every agent; the runner itself imports neither
+    get_graph()
+    if get_checkpointer():
+        get_graph(PARALLEL_FORMAT, PARALLEL_PLAN, True)
+    # Binding the tools creates the shared LLM client
+    from src.agents.gatherer import get_tool_chain
+    get_tool_chain()
+    from src.utils.snapshot import get_snapshot, USE_SNAPSHOT
+    if USE_SNAPSHOT:
+        get_snapshot()
+    gazetteers()
+    elapsed = time.perf_counter() - start
+    print(f"Graph warm-up took {elapsed * 1000:.1f} ms")
+    return elapsed
+
+def stream_graph(initial_state: Optional[UniversityState], parallel_format: bool = PARALLEL_FORMAT,
+                 parallel_plan: bool = PARALLEL_PLAN, thread: Optional[Dict] = None) -> Iterator[Tuple[str, object]]:
+    """Yield ("token", text) for recommender tokens and ("step", (node_name, state)) as nodes finish.
+
+    thread: run_config(...) of a checkpointed run; initial_state None then continues from its last checkpoint.
+    """
+    graph = get_graph(parallel_format, parallel_plan, thread is not None)
+    state = dict(initial_state) if initial_state is not None else dict(graph.get_state(thread).values)
+
+    # "messages" carries LLM token chunks, "updates" each node's changes to the state
+    config = {"callbacks": [TracingCallbackHandler()], **(thread or {})}
+    for mode, chunk in graph.stream(initial_state, config=config, stream_mode=["updates", "messages"]):
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") == STREAMING_NODE and message.content:
+                yield "token", message.content
+            continue
+        for node_name, update in chunk.items():
+            state.update(update or {})
+            yield "step", (node_name, dict(state))
+
+async def astream_graph(initial_state: UniversityState, parallel_format: bool = PARALLEL_FORMAT,
+                        parallel_plan: bool = PARALLEL_PLAN) -> AsyncIterator[Tuple[str, object]]:
+    """Async stream_graph: the graph runs its async nodes on the event loop."""
+    graph = get_graph(parallel_format, parallel_plan)
+    state = dict(initial_state)
+
+    config = {"callbacks": [TracingCallbackHandler()]}
+    async for mode, chunk in graph.astream(initial_state, config=config, stream_mode=["updates", "messages"]):
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") == STREAMING_NODE and message.content:
+                yield "token", message.content
+            continue
+        for node_name, update in chunk.items():
+            state.update(update or {})
+            yield "step", (node_name, dict(state))
+
+def _finish_run(final_state: UniversityState, trace, trace_callback: Callable = None) -> None:
+    cache = get_query_cache()
+    if cache and final_state and not final_state.get("cache_hit"):
+        cache.put(final_state.get("user_persona"), final_state)
+
+    if trace_callback:
+        trace_callback(trace)
+
+def _drive(graph_input: Optional[UniversityState], query: str, step_callback: Callable = None,
+           token_callback: Callable = None, trace_callback: Callable = None, thread: Optional[Dict] = None) -> UniversityState:
+    final_state = None
+    with start_trace("run_graph", query=query) as trace:
+        for event, payload in stream_graph(graph_input, thread=thread):
+            if event == "token":
+                if token_callback:
+                    token_callback(payload)
+                continue
+            node_name, final_state = payload
+            if step_callback:
+                step_callback(node_name)
+
+    if final_state is None and thread is not None:
+        # Nothing left to run, e.g. resuming a run that already finished
+        final_state = dict(get_graph(PARALLEL_FORMAT, PARALLEL_PLAN, True).get_state(thread).values)
+    _finish_run(final_state, trace, trace_callback)
+    return final_state
+
+def run_graph(initial_state: UniversityState, step_callback: Callable = None, token_callback: Callable = None,
+              trace_callback: Callable = None, session_id: str = None, run_id: str = None) -> UniversityState:
+    """Executes the university planning graph; trace_callback receives the request's Trace when it ends.
+    With a session_id and run_id (and CHECKPOINTER not none) the state is saved after every node."""
+    thread = run_config(session_id, run_id) if session_id and run_id and get_checkpointer() else None
+    return _drive(initial_state, initial_state.get("query", ""), step_callback, token_callback, trace_callback, thread)
+
+def _checkpointed(session_id: str, run_id: str):
+    if get_checkpointer() is None:
+        raise RuntimeError("checkpointing is off (CHECKPOINTER=none)")
+    thread = run_config(session_id, run_id)
+    graph = get_graph(PARALLEL_FORMAT, PARALLEL_PLAN, True)
+    snapshot = graph.get_state(thread)
+    if not snapshot.values:
+        raise KeyError(f"no checkpoints for run {run_id} of session {session_id}")
+    return graph, thread, snapshot
+
+def resume_graph(session_id: str, run_id: str, step_callback: Callable = None, token_callback: Callable = None,
+                 trace_callback: Callable = None) -> UniversityState:
+    """Continue a checkpointed run from the last node that finished, e.g. after a timeout in a later node."""
+    _, thread, snapshot = _checkpointed(session_id, run_id)
+    print(f"Resuming run {run_id} at {', '.join(snapshot.next) or 'the end'}")
+    return _drive(None, snapshot.values.get("query", ""), step_callback, token_callback, trace_callback, thread)
+
+def rerun_graph(session_id: str, run_id: str, changes: Optional[Dict] = None, from_node: Optional[str] = None,
+                step_callback: Callable = None, token_callback: Callable = None, trace_callback: Callable = None) -> UniversityState:
+    """Re-execute a checkpointed run from from_node (by default the first node reading a changed field),
+    keeping the state upstream of it. The previous result stays in the run's history."""
+    changes = dict(changes or {})
+    from_node = from_node or first_node(changes, PARALLEL_PLAN, PARALLEL_FORMAT)
+    if from_node is None:
+        raise ValueError("nothing to re-run: give from_node or change a field a node reads")
+    graph, thread, snapshot = _checkpointed(session_id, run_id)
+
+    # Newest checkpoint that was about to run from_node, and the one before it
+    history = list(graph.get_state_history(thread))
+    index = next((i for i, state in enumerate(history) if from_node in state.next), None)
+    if index is None:
+        raise ValueError(f"run {run_id} never reached {from_node}")
+    target = history[index]
+    # After a fan-in (PARALLEL_PLAN's plan and gather) the update must name a writer; use the earliest
+    writers = history[index + 1].next if index + 1 < len(history) else ()
+    as_node = min(writers, key=NODE_ORDER.index) if len(writers) > 1 else None
+
+    print(f"Re-running run {run_id} from {from_node}")
+    fork = graph.update_state(target.config, changes, as_node=as_node) if changes else target.config
+    query = changes.get("query") or snapshot.values.get("query", "")
+    return _drive(None, query, step_callback, token_callback, trace_callback, fork)
+
+async def arun_graph(initial_state: UniversityState, step_callback: Callable = None, token_callback: Callable = None,
+                     trace_callback: Callable = None) -> UniversityState:
+    """Async run_graph, so one event loop can serve many concurrent sessions; callbacks are plain functions."""
     final_state = None
-    for s in graph.stream(initial_state):
-        node_name = list(s.keys())[0] # Get the current node name
-        if step_callback:
-            step_callback(node_name)
-        final_state = s[node_name]
-        
+    with start_trace("run_graph", query=initial_state.get("query", "")) as trace:
+        async for event, payload in astream_graph(initial_state):
+            if event == "token":
+                if token_callback:
+                    token_callback(payload)
+                continue
+            node_name, final_state = payload
+            if step_callback:
+                step_callback(node_name)
+
+    _finish_run(final_state, trace, trace_callback)
     return final_state
+
+# Startup-time measurement: per-request graph construction vs the cached graph
+if __name__ == "__main__":
+    runs = 20
+    start = time.perf_counter()
+    for _ in range(runs):
+        build_graph()
+    rebuild_ms = (time.perf_counter() - start) * 1000 / runs
+
+    warm_up()
+    start = time.perf_counter()
+    for _ in range(runs):
+        get_graph()
+    cached_ms = (time.perf_counter() - start) * 1000 / runs
+
+    print(f"build_graph() per request: {rebuild_ms:.3f} ms")
+    print(f"get_graph() per request:   {cached_ms:.3f} ms")
@@ -1,5 +1,8 @@
 from typing import TypedDict, List, Optional, Dict
 
+# State keys written by the gatherer tools, in a stable order
+TOOL_RESULT_KEYS = ["university_search", "university_comparison", "cost_analysis", "get_weather_data"]
+
 class UniversityState(TypedDict):
     """Represents the state of the university planner workflow."""
     query: str  # The user's initial query
@@ -9,3 +12,10 @@ class UniversityState(TypedDict):
     location_details: Optional[Dict] # Weather, transport info
     report: Optional[str] # The final recommendation report
     knowledge_graph: Optional[Dict] # The JSON for the knowledge graph
+    # Tool results merged in by the gatherer, keyed by tool name
+    university_search: Optional[Dict] # {"columns": [...], "rows": [[...]]}
+    university_comparison: Optional[Dict]
+    cost_analysis: Optional[Dict]
+    get_weather_data: Optional[str]
+    tool_calls: Optional[List[Dict]] # The gatherer's tool calls ({"name", "args"}), checked by reconcile
+    cache_hit: Optional[bool] # Results were restored from the query cache after planning
@@ -0,0 +1,121 @@
+import os
+import re
+import json
+from typing import Dict, List, Tuple
+from src.graph.state import TOOL_RESULT_KEYS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Token budget for the data section of the recommender prompt
+RECOMMENDER_TOKEN_BUDGET = int(os.getenv("RECOMMENDER_TOKEN_BUDGET", "3000"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English text."""
+    return (len(text) + 3) // 4
+
+
+def _persona_lines(persona) -> List[str]:
+    if not persona:
+        return []
+    if isinstance(persona, str):
+        try:
+            persona = json.loads(persona.strip().strip("`").removeprefix("json"))
+        except ValueError:
+            return [persona.strip()]
+    if isinstance(persona, dict):
+        return ["; ".join(f"{key}={value}" for key, value in persona.items() if value not in (None, "", [], {}))]
+    return [str(persona)]
+
+
+def _compact_lines(value) -> List[str]:
+    """Split a tool result into compact lines, dropping blank lines and markdown decoration."""
+    lines = []
+    for line in str(value).splitlines():
+        line = re.sub(r"\s+", " ", line.replace("**", "").strip(" \t*#>"))
+        # Markdown table separators carry no data
+        if line and not re.fullmatch(r"[\s|:\-+]+", line):
+            lines.append(line)
+    return lines
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+
+def _table_lines(columns: List[str], rows: List[list]) -> List[str]:
+    """Pipe-delimited header line followed by one line per row."""
+    return ["|".join(columns)] + ["|".join(_cell(value) for value in row) for row in rows]
+
+
+def _merge_institutions(results: List[Dict]) -> Tuple[List[str], List[list]]:
+    """Merge rows from several tools into one row per UNITID with the union of their columns."""
+    columns, merged = [], {}
+    for result in results:
+        for column in result["columns"]:
+            if column not in columns:
+                columns.append(column)
+        for row in result["rows"]:
+            record = dict(zip(result["columns"], row))
+            merged.setdefault(record["UNITID"], {}).update(record)
+    return columns, [[record.get(column) for column in columns] for record in merged.values()]
+
+
+def build_recommender_context(state: Dict, token_budget: int = RECOMMENDER_TOKEN_BUDGET) -> Tuple[str, int]:
+    """Pack the persona and tool results into a de-duplicated context within token_budget.
+
+    Returns the context text and its estimated token count.
+    """
+    sections = [("user_persona", _persona_lines(state.get("user_persona")))]
+
+    # Structured tool results that share UNITIDs collapse into one institutions table
+    keyed = []
+    for key in TOOL_RESULT_KEYS:
+        value = state.get(key)
+        if not value:
+            continue
+        if isinstance(value, dict) and "rows" in value:
+            if value.get("error"):
+                sections.append((key, [value["error"]]))
+            elif "UNITID" in value.get("columns", []):
+                keyed.append(value)
+            else:
+                sections.append((key, _table_lines(value["columns"], value["rows"])))
+        else:
+            sections.append((key, _compact_lines(value)))
+    if keyed:
+        sections.insert(1, ("institutions", _table_lines(*_merge_institutions(keyed))))
+    sections = [(name, lines) for name, lines in sections if lines]
+
+    seen = set()
+    parts = []
+    remaining = token_budget
+    for i, (name, lines) in enumerate(sections):
+        # Each section gets an even share of what's left; unused budget carries over
+        share = remaining // (len(sections) - i)
+        header = f"[{name}]"
+        used = estimate_tokens(header)
+        kept = []
+        for line in lines:
+            # Tools often repeat the same rows (search and comparison of the same schools)
+            key = line.lower()
+            if key in seen:
+                continue
+            cost = estimate_tokens(line) + 1
+            if used + cost > share:
+                kept.append("... (truncated)")
+                break
+            seen.add(key)
+            kept.append(line)
+            used += cost
+        if kept:
+            parts.append("\n".join([header] + kept))
+            remaining -= used
+
+    context = "\n\n".join(parts)
+    return context, estimate_tokens(context)
@@ -0,0 +1,146 @@
+import os
+import queue
+import asyncio
+import contextvars
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool size and how long (seconds) a checkout waits for a free connection
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Per-connection tuning: memory-mapped reads, page cache in KiB (negative), compiled statement cache
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 16 * 1024
+CACHED_STATEMENTS = 256
+
+
+def get_db_path() -> str:
+    return os.getenv("DATABASE_PATH", "data/ipeds_data.db")
+
+
+class ConnectionPool:
+    """Thread-safe pool of read-only SQLite connections to the IPEDS database."""
+
+    def __init__(self, path: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._busy_seconds = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        # immutable=1 lets SQLite skip locking and change detection; the data never changes while serving
+        uri = Path(self.path).resolve().as_uri() + "?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._open < self.size
+            if can_open:
+                self._open += 1
+            else:
+                self._waits += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection available within {self.timeout}s")
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check a connection out of the pool for the duration of the block."""
+        conn = self._acquire()
+        with self._lock:
+            self._checkouts += 1
+        start = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            busy = time.perf_counter() - start
+            with self._lock:
+                self._busy_seconds += busy
+            self._idle.put(conn)
+
+    def metrics(self) -> Dict:
+        """Checkouts, waits for a free connection, total time connections were checked out,
+        and open/idle connection counts."""
+        with self._lock:
+            return {
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "busy_seconds": self._busy_seconds,
+                "open_connections": self._open,
+                "idle_connections": self._idle.qsize(),
+            }
+
+    def close(self) -> None:
+        """Close idle connections; any still checked out are closed when garbage collected."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._open -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Get the shared connection pool for DATABASE_PATH"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(get_db_path())
+        return _pool
+
+
+def reset_pool() -> None:
+    """Close the shared pool, e.g. after the database file has been rebuilt"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+
+
+# SQLite has no async driver; async callers run queries on a fixed pool of DB_POOL_SIZE threads
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="sqlite")
+
+
+async def run_db(fn: Callable[..., Any], *args) -> Any:
+    """Run a blocking database call off the event loop, keeping the caller's context (e.g. its trace span)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, contextvars.copy_context().run, fn, *args)
@@ -0,0 +1,193 @@
+"""Build the knowledge graph directly from the gathered IPEDS rows.
+
+Universities are keyed by UNITID (univ-<UNITID>), so the same institution gets the same
+node id in every run and across tools. Each university links to its city and state,
+a cost node, an admissions node and the program the student asked about; weather
+results hang off the location they were fetched for. The output is always valid
+Cytoscape JSON and takes milliseconds, with no LLM call.
+"""
+import re
+import json
+from typing import Dict, List, Optional
+from src.graph.state import TOOL_RESULT_KEYS
+from src.utils.query_builder import parse_location
+from src.utils.preferences import parse_persona
+
+SECTORS = {1: "Public 4-year", 2: "Private nonprofit 4-year", 3: "Private for-profit 4-year"}
+
+# Longest weather text kept on a weather node
+MAX_WEATHER_CHARS = 500
+# Failed weather lookups that should not become nodes
+WEATHER_ERRORS = ("Weather search error", "Tool error", "Tool timeout")
+
+
+def slug(text) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", str(text).lower()).strip("-")
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return None if value is None or value == "" else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _money(value) -> Optional[str]:
+    value = _number(value)
+    return None if value is None else f"${value:,.0f}"
+
+
+def merge_rows(state: Dict) -> Dict[str, Dict]:
+    """One record per institution across every tool result, keyed by node id.
+
+    Column names are upper-cased so LLM-written SQL with different casing still lines up;
+    values from earlier tools win, later tools only fill in missing columns.
+    """
+    records: Dict[str, Dict] = {}
+    for key in TOOL_RESULT_KEYS:
+        result = state.get(key)
+        if not isinstance(result, dict) or result.get("error"):
+            continue
+        columns = [str(column).upper() for column in result.get("columns") or []]
+        for row in result.get("rows") or []:
+            record = {column: value for column, value in zip(columns, row) if value is not None}
+            if record.get("UNITID") is not None:
+                unitid = _number(record["UNITID"])
+                node_id = f"univ-{int(unitid) if unitid is not None else slug(record['UNITID'])}"
+            elif record.get("INSTNM"):
+                node_id = f"univ-{slug(record['INSTNM'])}"
+            else:
+                continue
+            merged = records.setdefault(node_id, {})
+            for column, value in record.items():
+                merged.setdefault(column, value)
+    return records
+
+
+class _Elements:
+    """Nodes and edges in insertion order, de-duplicated by id."""
+
+    def __init__(self):
+        self.nodes: Dict[str, Dict] = {}
+        self.edges: Dict[str, Dict] = {}
+
+    def node(self, node_id: str, label: str, name: str, description: str, **data) -> str:
+        if node_id not in self.nodes:
+            self.nodes[node_id] = {"data": {"id": node_id, "label": label, "name": name, "description": description, **data}}
+        return node_id
+
+    def edge(self, source: str, target: str, label: str, description: str) -> None:
+        edge_id = f"{source}-{label.lower()}-{target}"
+        if edge_id not in self.edges:
+            self.edges[edge_id] = {"data": {"id": edge_id, "source": source, "target": target, "label": label, "description": description}}
+
+    def to_dict(self) -> Dict[str, List[Dict]]:
+        return {"nodes": list(self.nodes.values()), "edges": list(self.edges.values())}
+
+
+def _add_location(elements: _Elements, city, state_code) -> Optional[str]:
+    """City and state nodes for a location; returns the most specific one."""
+    state_id = None
+    if state_code:
+        state_code = str(state_code).upper()
+        state_id = elements.node(f"state-{state_code}", "STATE", state_code, f"U.S. state {state_code}")
+    if not city:
+        return state_id
+    where = f"{city}, {state_code}" if state_code else str(city)
+    city_id = elements.node(f"city-{slug(where)}", "CITY", where, f"City of {where}")
+    if state_id:
+        elements.edge(city_id, state_id, "IN_STATE", f"{city} is in {state_code}")
+    return city_id
+
+
+def _add_university(elements: _Elements, node_id: str, record: Dict) -> None:
+    name = str(record.get("INSTNM") or node_id)
+    suffix = node_id[len("univ-"):]
+    sector = SECTORS.get(int(_number(record.get("SECTOR")) or 0))
+    enrollment = _number(record.get("UGDS"))
+    details = [part for part in (
+        sector,
+        f"{record['CITY']}, {record['STABBR']}" if record.get("CITY") and record.get("STABBR") else None,
+        f"{enrollment:,.0f} undergraduates" if enrollment is not None else None,
+    ) if part]
+    data = {"unitid": record.get("UNITID"), "website": record.get("WEBADDR"), "sector": sector}
+    elements.node(node_id, "UNIVERSITY", name, "; ".join(details) or name,
+                  **{key: value for key, value in data.items() if value is not None})
+
+    location_id = _add_location(elements, record.get("CITY"), record.get("STABBR"))
+    if location_id:
+        elements.edge(node_id, location_id, "LOCATED_IN", f"{name} campus location")
+
+    costs = [(label, _money(record.get(column))) for label, column in (
+        ("In-state tuition", "TUITIONFEE_IN"), ("Out-of-state tuition", "TUITIONFEE_OUT"),
+        ("Room and board", "ROOMBOARD_ON"), ("Other expenses", "OTHEREXPENSES"),
+        ("Total in-state", "TOTAL_COST_IN"), ("Total out-of-state", "TOTAL_COST_OUT"),
+    )]
+    costs = [(label, value) for label, value in costs if value]
+    if costs:
+        headline = dict(costs).get("Total out-of-state") or dict(costs).get("Out-of-state tuition") or costs[0][1]
+        cost_id = elements.node(f"cost-{suffix}", "COST", f"{headline}/yr", "; ".join(f"{label}: {value}" for label, value in costs))
+        elements.edge(node_id, cost_id, "HAS_COST", f"Yearly cost of attending {name}")
+
+    rate = _number(record.get("ADM_RATE"))
+    scores = [(label, _number(record.get(column))) for label, column in (("SAT average", "SAT_AVG"), ("ACT average", "ACT_AVG"))]
+    scores = [(label, value) for label, value in scores if value is not None]
+    if rate is not None or scores:
+        # ADM_RATE is stored as a fraction
+        percent = f"{rate * 100:.0f}%" if rate is not None else None
+        details = ([f"Admission rate: {percent}"] if percent else []) + [f"{label}: {value:.0f}" for label, value in scores]
+        admission_id = elements.node(f"admission-{suffix}", "ADMISSION", f"Admits {percent}" if percent else "Admissions", "; ".join(details))
+        elements.edge(node_id, admission_id, "HAS_ADMISSION", f"Admissions profile of {name}")
+
+
+def _majors(state: Dict) -> List[str]:
+    """Programs the student asked about, from the persona and the gatherer's tool arguments."""
+    values = [parse_persona(state.get("user_persona")).get("major")]
+    values += [(call.get("args") or {}).get("major") for call in state.get("tool_calls") or []]
+    majors = []
+    for value in values:
+        for major in (value if isinstance(value, list) else [value]):
+            major = " ".join(str(major or "").split())
+            if major and major.lower() not in ("none", "null", "any") and major.lower() not in map(str.lower, majors):
+                majors.append(major)
+    return majors
+
+
+def _add_weather(elements: _Elements, state: Dict) -> None:
+    weather = state.get("get_weather_data")
+    if not isinstance(weather, str) or not weather.strip() or weather.startswith(WEATHER_ERRORS):
+        return
+    calls = [call for call in state.get("tool_calls") or [] if call.get("name") == "get_weather_data"]
+    # The gatherer keeps the last result per tool
+    location = str((calls[-1].get("args") or {}).get("location", "")) if calls else ""
+    weather_id = elements.node(f"weather-{slug(location) or 'query'}", "WEATHER", f"Weather: {location}" if location else "Weather",
+                               weather.strip()[:MAX_WEATHER_CHARS])
+    parsed = parse_location(location) if location else None
+    if parsed is None:
+        return
+    states, cities = parsed
+    targets = [_add_location(elements, city, state_code) for city, state_code in cities] or [_add_location(elements, None, code) for code in states]
+    for target in targets:
+        if target:
+            elements.edge(target, weather_id, "HAS_WEATHER", f"Current weather for {location}")
+
+
+def build_elements(state: Dict) -> Dict[str, List[Dict]]:
+    """Cytoscape elements for the gathered universities, their locations, costs, admissions and programs."""
+    elements = _Elements()
+    records = merge_rows(state)
+    for node_id, record in records.items():
+        _add_university(elements, node_id, record)
+
+    for major in _majors(state):
+        program_id = elements.node(f"program-{slug(major)}", "PROGRAM", major.title(), f"Program of interest: {major}")
+        for node_id in records:
+            elements.edge(node_id, program_id, "CANDIDATE_FOR", f"Matched the search for {major}")
+
+    _add_weather(elements, state)
+    return elements.to_dict()
+
+
+def build_knowledge_graph(state: Dict) -> str:
+    """The knowledge graph as a JSON string."""
+    return json.dumps(build_elements(state))
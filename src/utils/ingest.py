@@ -0,0 +1,277 @@
+"""Bulk-load official IPEDS survey CSVs into the SQLite database.
+
+Each survey year is loaded into its own tables (hd<year>, adm<year>, ef<year>a,
+ic<year>_ay), so years can be added or refreshed independently:
+
+    python -m src.utils.ingest --source-dir ~/ipeds --years 2022 2023
+
+The source directory holds the files as published by NCES (HD2023.csv,
+ADM2023.csv, EF2023A.csv, IC2023_AY.csv, or the .zip archives containing them;
+revised "_rv" files are preferred). Rows are streamed and inserted in batches
+inside one transaction per file, and indexes are built after the load.
+"""
+import io
+import os
+import csv
+import time
+import sqlite3
+import zipfile
+import argparse
+from typing import Callable, Dict, Iterator, List, Optional, TextIO
+from src.utils.query_builder import table_names
+from src.utils.names import build_name_index
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_SIZE = 5000
+
+
+def _num(value: Optional[str]):
+    """Parse an IPEDS numeric cell; blanks and "." mean not reported."""
+    if value is None:
+        return None
+    value = value.strip()
+    if value in ("", "."):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+
+def _text(value: Optional[str]):
+    value = (value or "").strip()
+    return value or None
+
+
+def _midpoint(row: Dict, low: str, high: str):
+    low, high = _num(row.get(low)), _num(row.get(high))
+    if low is None or high is None:
+        return None
+    return (low + high) / 2
+
+
+def _hd_row(row: Dict):
+    return (
+        _num(row.get("UNITID")), _text(row.get("INSTNM")), _text(row.get("CITY")),
+        _text(row.get("STABBR")), _text(row.get("ZIP")), _text(row.get("WEBADDR")),
+        _num(row.get("SECTOR")), _num(row.get("ICLEVEL")),
+    )
+
+
+def _adm_row(row: Dict):
+    applied, admitted = _num(row.get("APPLCN")), _num(row.get("ADMSSN"))
+    adm_rate = round(admitted / applied, 4) if applied and admitted is not None else None
+
+    # Composite SAT from the section medians, or the 25th/75th midpoints in older files
+    verbal = _num(row.get("SATVR50")) or _midpoint(row, "SATVR25", "SATVR75")
+    math = _num(row.get("SATMT50")) or _midpoint(row, "SATMT25", "SATMT75")
+    sat = round(verbal + math) if verbal is not None and math is not None else None
+    act = _num(row.get("ACTCM50")) or _midpoint(row, "ACTCM25", "ACTCM75")
+
+    return (
+        _num(row.get("UNITID")), adm_rate, sat, round(act) if act is not None else None,
+        applied, admitted, _num(row.get("ENRLT")),
+    )
+
+
+# EF "A" files are long: one row per UNITID and level. 2 = all undergraduates, 12 = all graduates
+EF_LEVELS = {2: "UGDS", 12: "GRADS"}
+
+
+def _ef_row(row: Dict):
+    column = EF_LEVELS.get(_num(row.get("EFALEVEL")))
+    if column is None:
+        return None
+    total = _num(row.get("EFTOTLT"))
+    unitid = _num(row.get("UNITID"))
+    return (unitid, total, None) if column == "UGDS" else (unitid, None, total)
+
+
+def _ic_row(row: Dict):
+    # CHG*AY3 are the current academic year's published charges
+    return (
+        _num(row.get("UNITID")), _num(row.get("CHG2AY3")), _num(row.get("CHG3AY3")),
+        _num(row.get("CHG5AY3")), _num(row.get("CHG6AY3")),
+    )
+
+
+# Per survey: file stem, table schema, insert statement and row transform
+SURVEYS = {
+    "hd": {
+        "file": "HD{year}",
+        "schema": """UNITID INTEGER PRIMARY KEY, INSTNM TEXT, CITY TEXT, STABBR TEXT, ZIP TEXT,
+            WEBADDR TEXT, SECTOR INTEGER, ICLEVEL INTEGER""",
+        "insert": "INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        "transform": _hd_row,
+    },
+    "adm": {
+        "file": "ADM{year}",
+        "schema": """UNITID INTEGER PRIMARY KEY, ADM_RATE REAL, SAT_AVG INTEGER, ACT_AVG INTEGER,
+            APPLY_COUNT INTEGER, ADMIT_COUNT INTEGER, ENROLL_COUNT INTEGER""",
+        "insert": "INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)",
+        "transform": _adm_row,
+    },
+    "ef": {
+        "file": "EF{year}A",
+        "schema": "UNITID INTEGER PRIMARY KEY, UGDS INTEGER, GRADS INTEGER",
+        # Undergraduate and graduate totals arrive on separate rows
+        "insert": """INSERT INTO {table} VALUES (?, ?, ?) ON CONFLICT(UNITID) DO UPDATE SET
+            UGDS = COALESCE(excluded.UGDS, UGDS), GRADS = COALESCE(excluded.GRADS, GRADS)""",
+        "transform": _ef_row,
+    },
+    "ic": {
+        "file": "IC{year}_AY",
+        "schema": """UNITID INTEGER PRIMARY KEY, TUITIONFEE_IN INTEGER, TUITIONFEE_OUT INTEGER,
+            ROOMBOARD_ON INTEGER, OTHEREXPENSES INTEGER""",
+        "insert": "INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?)",
+        "transform": _ic_row,
+    },
+}
+
+
+def find_source(source_dir: str, stem: str) -> Optional[str]:
+    """Path of the CSV (or zip) for a file stem, preferring revised "_rv" releases."""
+    files = {name.lower(): name for name in os.listdir(source_dir)}
+    for candidate in (f"{stem}_rv.csv", f"{stem}.csv", f"{stem}_rv.zip", f"{stem}.zip"):
+        if candidate.lower() in files:
+            return os.path.join(source_dir, files[candidate.lower()])
+    return None
+
+
+def open_source(path: str, encoding: str) -> TextIO:
+    """Open a CSV for streaming, reading it straight out of the zip when needed."""
+    if not path.lower().endswith(".zip"):
+        return open(path, newline="", encoding=encoding, errors="replace")
+    archive = zipfile.ZipFile(path)
+    member = next(name for name in archive.namelist() if name.lower().endswith(".csv"))
+    return io.TextIOWrapper(archive.open(member), newline="", encoding=encoding, errors="replace")
+
+
+def read_rows(stream: TextIO) -> Iterator[Dict]:
+    """Stream CSV rows as dicts keyed by upper-cased header names."""
+    reader = csv.reader(stream)
+    header = [name.strip().lstrip("\ufeff").upper() for name in next(reader)]
+    for values in reader:
+        yield dict(zip(header, values))
+
+
+def load_table(conn: sqlite3.Connection, table: str, schema: str, insert: str, transform: Callable,
+               rows: Iterator[Dict], batch_size: int = BATCH_SIZE) -> int:
+    """Replace a table with transformed rows, inserting in batches inside a single transaction."""
+    count = 0
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"CREATE TABLE {table} ({schema})")
+        statement = insert.format(table=table)
+        batch: List[tuple] = []
+        for row in rows:
+            values = transform(row)
+            if values is None or values[0] is None:
+                continue
+            batch.append(values)
+            if len(batch) >= batch_size:
+                conn.executemany(statement, batch)
+                count += len(batch)
+                batch.clear()
+        if batch:
+            conn.executemany(statement, batch)
+            count += len(batch)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return count
+
+
+def build_indexes(conn: sqlite3.Connection, year: str) -> None:
+    """Secondary indexes plus the institution-name FTS and alias indexes for one survey year."""
+    hd = table_names(year)["hd"]
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {hd}_stabbr ON {hd}(STABBR)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {hd}_city ON {hd}(CITY COLLATE NOCASE, STABBR)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {hd}_sector ON {hd}(SECTOR)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {hd}_instnm ON {hd}(INSTNM COLLATE NOCASE)")
+
+    # External-content FTS5 index over the directory table, rebuilt from it after each load
+    conn.execute(f"DROP TABLE IF EXISTS {hd}_fts")
+    conn.execute(
+        f"CREATE VIRTUAL TABLE {hd}_fts USING fts5("
+        f"INSTNM, CITY, content='{hd}', content_rowid='UNITID', tokenize='trigram')"
+    )
+    conn.execute(f"INSERT INTO {hd}_fts({hd}_fts) VALUES ('rebuild')")
+    conn.commit()
+    build_name_index(conn, year)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def connect_for_load(db_path: str) -> sqlite3.Connection:
+    """Writable connection tuned for bulk loading."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -65536")
+    return conn
+
+
+def ingest(source_dir: str, years: List[str], db_path: str, batch_size: int = BATCH_SIZE,
+           encoding: str = "utf-8-sig") -> Dict[str, int]:
+    """Load every survey file found for the given years; returns rows loaded per table."""
+    loaded = {}
+    conn = connect_for_load(db_path)
+    try:
+        for year in years:
+            tables = table_names(year)
+            for survey, spec in SURVEYS.items():
+                stem = spec["file"].format(year=year)
+                path = find_source(source_dir, stem)
+                if path is None:
+                    print(f"Skipping {stem}: no file in {source_dir}")
+                    continue
+                start = time.perf_counter()
+                with open_source(path, encoding) as stream:
+                    count = load_table(conn, tables[survey], spec["schema"], spec["insert"],
+                                       spec["transform"], read_rows(stream), batch_size)
+                loaded[tables[survey]] = count
+                print(f"Loaded {count} rows from {os.path.basename(path)} into {tables[survey]} "
+                      f"in {time.perf_counter() - start:.2f}s")
+            if tables["hd"] in loaded:
+                build_indexes(conn, year)
+    finally:
+        conn.close()
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load IPEDS survey CSVs into the SQLite database")
+    parser.add_argument("--source-dir", help="Directory holding the IPEDS CSV or zip files")
+    parser.add_argument("--years", nargs="+", default=["2023"], help="Survey years to load")
+    parser.add_argument("--database", default=os.getenv("DATABASE_PATH", "data/ipeds_data.db"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--encoding", default="utf-8-sig", help="Use latin-1 for older IPEDS releases")
+    parser.add_argument("--reindex", action="store_true", help="Only rebuild indexes for existing tables")
+    args = parser.parse_args()
+
+    if args.reindex:
+        conn = sqlite3.connect(args.database)
+        for year in args.years:
+            build_indexes(conn, year)
+        conn.close()
+        print(f"Rebuilt indexes for {', '.join(args.years)}")
+        return
+    if not args.source_dir:
+        parser.error("--source-dir is required unless --reindex is given")
+
+    start = time.perf_counter()
+    loaded = ingest(args.source_dir, args.years, args.database, args.batch_size, args.encoding)
+    print(f"Ingested {sum(loaded.values())} rows into {len(loaded)} tables in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
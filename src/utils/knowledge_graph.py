@@ -0,0 +1,132 @@
+"""Knowledge graph model behind the Streamlit explorer.
+
+Holds Cytoscape-style elements ({"nodes": [{"data": {...}}], "edges": [...]}) with
+id maps and forward/reverse adjacency indexes, so expanding or removing nodes costs
+O(degree) instead of a scan over every edge, and tracks which elements are visible.
+"""
+import json
+from typing import Dict, Iterable, List, Optional, Set
+
+
+def parse_elements(knowledge_graph) -> Dict:
+    """Parse knowledge graph JSON (or an already parsed dict) into {"nodes", "edges"}; raises ValueError if invalid."""
+    if isinstance(knowledge_graph, str):
+        text = knowledge_graph.strip()
+        # LLM output sometimes wraps the JSON in a code fence or prose
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end < start:
+            raise ValueError("no JSON object found")
+        try:
+            elements = json.loads(text[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e}")
+    else:
+        elements = knowledge_graph or {}
+    if not isinstance(elements, dict):
+        raise ValueError("knowledge graph must be a JSON object")
+    return {"nodes": list(elements.get("nodes") or []), "edges": list(elements.get("edges") or [])}
+
+
+class KnowledgeGraph:
+    """Cytoscape elements indexed by id and adjacency, with a visible subset."""
+
+    def __init__(self, elements: Optional[Dict] = None):
+        self.nodes: Dict[str, Dict] = {}
+        self.edges: Dict[str, Dict] = {}
+        self.out_edges: Dict[str, Set[str]] = {}
+        self.in_edges: Dict[str, Set[str]] = {}
+        for node in (elements or {}).get("nodes", []):
+            self.add_node(node)
+        for edge in (elements or {}).get("edges", []):
+            self.add_edge(edge)
+        self.visible_nodes: Set[str] = set(self.nodes)
+        self.visible_edges: Set[str] = set(self.edges)
+        self._elements: Optional[Dict] = None
+
+    @classmethod
+    def from_json(cls, knowledge_graph) -> "KnowledgeGraph":
+        return cls(parse_elements(knowledge_graph))
+
+    def add_node(self, node: Dict) -> None:
+        data = node.get("data") or {}
+        if "id" not in data:
+            return
+        node_id = str(data["id"])
+        self.nodes[node_id] = node
+        self.out_edges.setdefault(node_id, set())
+        self.in_edges.setdefault(node_id, set())
+
+    def add_edge(self, edge: Dict) -> None:
+        data = edge.get("data") or {}
+        source, target = data.get("source"), data.get("target")
+        # Edges to nodes that don't exist would break the Cytoscape layout
+        if source is None or target is None or str(source) not in self.nodes or str(target) not in self.nodes:
+            return
+        edge_id = str(data.get("id") or f"{source}->{target}:{data.get('label', '')}")
+        if "id" not in data:
+            edge = {**edge, "data": {**data, "id": edge_id}}
+        self.edges[edge_id] = edge
+        self.out_edges[str(source)].add(edge_id)
+        self.in_edges[str(target)].add(edge_id)
+
+    def _endpoints(self, edge_id: str):
+        data = self.edges[edge_id]["data"]
+        return str(data["source"]), str(data["target"])
+
+    def incident_edges(self, node_id: str) -> Set[str]:
+        return self.out_edges.get(node_id, set()) | self.in_edges.get(node_id, set())
+
+    def neighbors(self, node_id: str) -> Set[str]:
+        """Nodes one edge away in either direction."""
+        result = set()
+        for edge_id in self.incident_edges(node_id):
+            source, target = self._endpoints(edge_id)
+            result.add(target if source == node_id else source)
+        return result
+
+    def expand(self, node_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Show the neighbours of node_ids and the edges linking them to visible nodes; returns what was added."""
+        added_nodes = set()
+        for node_id in map(str, node_ids):
+            added_nodes |= self.neighbors(node_id) - self.visible_nodes
+        self.visible_nodes |= added_nodes
+
+        added_edges = set()
+        for node_id in added_nodes:
+            for edge_id in self.incident_edges(node_id):
+                source, target = self._endpoints(edge_id)
+                if edge_id not in self.visible_edges and source in self.visible_nodes and target in self.visible_nodes:
+                    added_edges.add(edge_id)
+        self.visible_edges |= added_edges
+
+        if added_nodes or added_edges:
+            self._elements = None
+        return {"added_nodes": sorted(added_nodes), "added_edges": sorted(added_edges)}
+
+    def remove(self, node_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Hide node_ids and their edges; returns what was removed."""
+        removed_nodes = {node_id for node_id in map(str, node_ids) if node_id in self.visible_nodes}
+        removed_edges = set()
+        for node_id in removed_nodes:
+            removed_edges |= self.incident_edges(node_id) & self.visible_edges
+        self.visible_nodes -= removed_nodes
+        self.visible_edges -= removed_edges
+
+        if removed_nodes or removed_edges:
+            self._elements = None
+        return {"removed_nodes": sorted(removed_nodes), "removed_edges": sorted(removed_edges)}
+
+    def get_elements(self) -> Dict[str, List[Dict]]:
+        """Visible elements, rebuilt only after expand or remove changed them."""
+        if self._elements is None:
+            self._elements = {
+                "nodes": [node for node_id, node in self.nodes.items() if node_id in self.visible_nodes],
+                "edges": [edge for edge_id, edge in self.edges.items() if edge_id in self.visible_edges],
+            }
+        return self._elements
+
+    def node_labels(self) -> List[str]:
+        return sorted({node["data"].get("label", "UNKNOWN") for node in self.nodes.values()})
+
+    def edge_labels(self) -> List[str]:
+        return sorted({edge["data"].get("label", "RELATED") for edge in self.edges.values()})
@@ -0,0 +1,135 @@
+import re
+import sqlite3
+from typing import Dict, List
+from src.utils.db import get_pool
+from src.utils.tracing import span
+from src.utils.query_builder import QuerySpec, IPEDS_YEAR, table_names
+
+# Acronyms and short names that neither substring nor trigram matching can find, mapped to INSTNM
+CURATED_ALIASES = {
+    "mit": "Massachusetts Institute of Technology",
+    "ucb": "University of California-Berkeley",
+    "uc berkeley": "University of California-Berkeley",
+    "berkeley": "University of California-Berkeley",
+    "cal": "University of California-Berkeley",
+    "ucla": "University of California-Los Angeles",
+    "usc": "University of Southern California",
+    "ut austin": "University of Texas at Austin",
+    "ut": "University of Texas at Austin",
+    "tamu": "Texas A&M University",
+    "texas a and m": "Texas A&M University",
+    "nyu": "New York University",
+    "cmu": "Carnegie Mellon University",
+    "caltech": "California Institute of Technology",
+    "gatech": "Georgia Institute of Technology-Main Campus",
+    "georgia tech": "Georgia Institute of Technology-Main Campus",
+    "upenn": "University of Pennsylvania",
+    "penn": "University of Pennsylvania",
+    "umich": "University of Michigan-Ann Arbor",
+    "uiuc": "University of Illinois Urbana-Champaign",
+}
+
+ACRONYM_STOPWORDS = {"of", "and", "the", "at", "in", "for", "&"}
+
+# Most fuzzy matches kept per name when no alias matches exactly
+MAX_MATCHES = 10
+
+
+def acronym(name: str) -> str:
+    """Initials of the significant words ("Massachusetts Institute of Technology" -> "MIT")."""
+    words = [word for word in re.split(r"[\s\-/,]+", name) if word and word.lower() not in ACRONYM_STOPWORDS]
+    return "".join(word[0] for word in words if word[0].isalpha()).upper()
+
+
+def build_name_index(conn: sqlite3.Connection, year: str = IPEDS_YEAR) -> None:
+    """Build the alias table for one survey year: curated aliases plus unambiguous acronyms."""
+    hd = table_names(year)["hd"]
+    conn.execute(f"DROP TABLE IF EXISTS {hd}_alias")
+    conn.execute(f"CREATE TABLE {hd}_alias (alias TEXT COLLATE NOCASE, UNITID INTEGER, PRIMARY KEY (alias, UNITID))")
+
+    for alias, instnm in CURATED_ALIASES.items():
+        conn.execute(f"INSERT OR IGNORE INTO {hd}_alias SELECT ?, UNITID FROM {hd} WHERE INSTNM = ?", (alias, instnm))
+
+    # Generated acronyms only when exactly one institution produces them and no curated alias claims them
+    by_acronym: Dict[str, List[int]] = {}
+    for unitid, instnm in conn.execute(f"SELECT UNITID, INSTNM FROM {hd} WHERE INSTNM IS NOT NULL"):
+        initials = acronym(instnm)
+        if len(initials) >= 3:
+            by_acronym.setdefault(initials.lower(), []).append(unitid)
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {hd}_alias VALUES (?, ?)",
+        [(alias, unitids[0]) for alias, unitids in by_acronym.items() if len(unitids) == 1 and alias not in CURATED_ALIASES],
+    )
+    conn.commit()
+
+
+def _fts_phrase(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def resolve_institutions(names: List[str], year: str = IPEDS_YEAR) -> Dict[str, List[int]]:
+    """Resolve free-text institution names to UNITIDs in one batched lookup.
+
+    Exact alias matches win; otherwise the best trigram FTS matches on INSTNM are returned.
+    Names that match nothing are left out.
+    """
+    names = list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+    if not names:
+        return {}
+    hd = table_names(year)["hd"]
+    values = ", ".join("(?, ?, ?)" for _ in names)
+    params = []
+    for i, name in enumerate(names):
+        params.extend([i, name.lower(), _fts_phrase(name)])
+
+    sql = f"""WITH q(idx, alias, phrase) AS (VALUES {values})
+SELECT q.idx, a.UNITID, 0 AS fuzzy, 0.0 AS score FROM q JOIN {hd}_alias a ON a.alias = q.alias
+UNION ALL
+SELECT q.idx, f.rowid, 1, f.rank FROM q JOIN {hd}_fts f ON {hd}_fts MATCH ('INSTNM:' || q.phrase)
+WHERE length(q.alias) >= 3
+ORDER BY 1, 3, 4"""
+
+    with span("resolve_institutions", kind="sql", names=len(names)) as resolve_span:
+        with get_pool().connection() as conn:
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError:
+                # Database without the name index (not reindexed yet): curated aliases plus substring match
+                resolve_span.set_attributes(fallback="like")
+                rows = _resolve_with_like(conn, hd, names)
+        resolve_span.set_attributes(rows=len(rows))
+
+    # Rows come ordered by name, exact alias matches first
+    resolved: Dict[str, List[int]] = {}
+    exact = set()
+    for idx, unitid, fuzzy, _ in rows:
+        matches = resolved.setdefault(names[idx], [])
+        if not fuzzy:
+            exact.add(idx)
+        elif idx in exact or len(matches) >= MAX_MATCHES:
+            continue
+        if unitid not in matches:
+            matches.append(unitid)
+    return resolved
+
+
+def _resolve_with_like(conn: sqlite3.Connection, hd: str, names: List[str]) -> List[tuple]:
+    values = ", ".join("(?, ?)" for _ in names)
+    params = []
+    for i, name in enumerate(names):
+        params.extend([i, f"%{CURATED_ALIASES.get(name.lower(), name)}%"])
+    sql = f"""WITH q(idx, pattern) AS (VALUES {values})
+SELECT q.idx, h.UNITID, 1, 0.0 FROM q JOIN {hd} h ON h.INSTNM LIKE q.pattern ORDER BY 1"""
+    return conn.execute(sql, params).fetchall()
+
+
+def resolve_spec(spec: QuerySpec) -> QuerySpec:
+    """Move institution names that resolve to UNITIDs from spec["institutions"] to spec["unitids"]."""
+    if not spec["institutions"]:
+        return spec
+    resolved = resolve_institutions(spec["institutions"])
+    unitids = list(spec["unitids"])
+    for unitids_for_name in resolved.values():
+        unitids.extend(unitid for unitid in unitids_for_name if unitid not in unitids)
+    unresolved = [name for name in spec["institutions"] if name.strip() not in resolved]
+    return {**spec, "institutions": unresolved, "unitids": unitids}
@@ -0,0 +1,401 @@
+"""Rule-based extraction of the user's preferences from the query.
+
+Gazetteers of states, cities (hd<year>.CITY/STABBR) and institutions (INSTNM plus the
+curated aliases), a major taxonomy, and budget and degree-level patterns turn queries
+like "cheap public universities in Texas under $20k for nursing" into a persona dict in
+microseconds. Words like "weather", "tuition" or "vs" set the query's intent. Every word
+of the query is either matched, known filler, or unexplained (including questions the
+persona can't express, like acceptance rates); the share of unexplained words sets the
+confidence, and the planner only asks the LLM when confidence is below PREFERENCE_CONFIDENCE.
+"""
+import os
+import re
+import json
+import threading
+from typing import Dict, List, Optional, Tuple, TypedDict, Union
+from src.utils.db import get_pool
+from src.utils.names import CURATED_ALIASES
+from src.utils.query_builder import CITY_ALIASES, COUNTRY_ALIASES, STATE_ABBREVIATIONS, STATE_CODES, TABLES
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Below this confidence the planner falls back to the LLM
+PREFERENCE_CONFIDENCE = float(os.getenv("PREFERENCE_CONFIDENCE", "0.75"))
+
+
+class Preferences(TypedDict, total=False):
+    """The persona the planner hands to the other nodes; fields the query doesn't mention are left out."""
+    location: str  # Readable by query_builder.parse_location, e.g. "Texas" or "Cambridge, MA"
+    major: str  # Canonical major names, comma separated
+    budget: Union[int, str]  # Yearly dollars, or "low"
+    institution: str  # Comma separated names as written in the query
+    degree_level: str  # A query_builder.DEGREE_LEVELS key
+    sector: str  # public and/or private
+    campus_size: str  # small, medium or large
+    climate: str  # e.g. "warm, sunny"
+    intent: str  # What the query asks about: search, cost, compare and/or weather (see detect_intents)
+
+
+# Major taxonomy: alias -> canonical major
+MAJOR_SYNONYMS = {
+    "cs": "computer science", "comp sci": "computer science", "compsci": "computer science",
+    "computing": "computer science", "computer engineering": "computer engineering",
+    "ee": "electrical engineering", "mech e": "mechanical engineering", "me": "mechanical engineering",
+    "bio": "biology", "econ": "economics", "poli sci": "political science", "psych": "psychology",
+    "business administration": "business", "business admin": "business",
+    "software engineering": "computer science", "programming": "computer science",
+    "data science": "data science", "artificial intelligence": "artificial intelligence", "ai": "artificial intelligence",
+    "engineering": "engineering", "electrical engineering": "electrical engineering",
+    "mechanical engineering": "mechanical engineering", "civil engineering": "civil engineering",
+    "chemical engineering": "chemical engineering", "aerospace engineering": "aerospace engineering",
+    "biomedical engineering": "biomedical engineering", "industrial engineering": "industrial engineering",
+    "nursing": "nursing", "medicine": "medicine", "pre-med": "medicine", "premed": "medicine",
+    "pre-law": "law", "law": "law", "public health": "public health", "pharmacy": "pharmacy",
+    "business": "business", "finance": "finance", "accounting": "accounting", "marketing": "marketing",
+    "management": "business", "economics": "economics", "mathematics": "mathematics", "math": "mathematics",
+    "maths": "mathematics", "statistics": "statistics", "physics": "physics", "chemistry": "chemistry",
+    "biology": "biology", "neuroscience": "neuroscience", "environmental science": "environmental science",
+    "psychology": "psychology", "sociology": "sociology", "political science": "political science",
+    "history": "history", "philosophy": "philosophy", "english": "english", "literature": "english",
+    "journalism": "journalism", "communications": "communications", "education": "education",
+    "architecture": "architecture", "art": "art", "fine arts": "art", "design": "design",
+    "music": "music", "film": "film", "theater": "theater", "agriculture": "agriculture",
+    "international relations": "international relations", "linguistics": "linguistics",
+    "computer science": "computer science",
+}
+
+# Single words that set a soft preference
+MODIFIERS = {
+    "public": ("sector", "public"), "private": ("sector", "private"),
+    "small": ("campus_size", "small"), "medium": ("campus_size", "medium"), "mid-size": ("campus_size", "medium"),
+    "mid-sized": ("campus_size", "medium"), "midsize": ("campus_size", "medium"),
+    "large": ("campus_size", "large"), "big": ("campus_size", "large"),
+    "warm": ("climate", "warm"), "hot": ("climate", "hot"), "sunny": ("climate", "sunny"),
+    "mild": ("climate", "mild"), "cold": ("climate", "cold"), "snowy": ("climate", "snowy"),
+    "temperate": ("climate", "mild"),
+}
+
+# Words that say what the user wants to know, mapped to an intent; queries with none are a search.
+# The intent is part of the persona, so a weather question and a school search in the same city differ
+INTENT_WORDS = {
+    "weather": "weather", "climate": "weather", "temperature": "weather", "temperatures": "weather",
+    "forecast": "weather", "snow": "weather", "rain": "weather",
+    "cost": "cost", "costs": "cost", "tuition": "cost", "price": "cost", "prices": "cost", "fees": "cost",
+    "expensive": "cost", "cheaper": "cost", "pricier": "cost", "afford": "cost",
+    "compare": "compare", "comparison": "compare", "comparing": "compare", "vs": "compare", "versus": "compare",
+    "between": "compare", "better": "compare",
+}
+
+# Questions the persona has no field for ("acceptance rate", "scholarships"); they count as
+# unexplained, so the planner asks the LLM
+UNEXPRESSED_INTENT_WORDS = {
+    "admission", "admissions", "acceptance", "rate", "rates", "ranking", "rankings", "ranked",
+    "scholarship", "scholarships", "aid", "deadline", "deadlines", "requirements", "salary", "salaries",
+    "housing", "dorms",
+}
+
+# Words that carry no preference of their own
+FILLER_WORDS = {
+    "a", "an", "the", "and", "or", "of", "in", "at", "near", "around", "for", "to", "with", "by", "on",
+    "from", "about", "than", "that", "this", "these", "there", "their", "it", "its", "is", "are", "be",
+    "i", "me", "my", "we", "our", "you", "your", "i'm", "im", "am", "what", "which", "where", "how", "much",
+    "many", "does", "do", "can", "could", "should", "would", "will", "want", "wants", "need", "looking",
+    "look", "find", "show", "list", "give", "tell", "recommend", "recommendations", "suggest", "help",
+    "good", "best", "top", "great", "strong", "some", "any", "options", "universities", "university",
+    "colleges", "college", "schools", "school", "campus", "campuses", "programs", "program", "degree",
+    "degrees", "major", "majors", "study", "studying", "attend", "attending", "like", "year", "years",
+    "per", "annually", "yearly", "information", "info", "details", "also", "please", "interested",
+    "get", "into", "go",
+    "city", "state", "in-state", "out-of-state", "places", "place", "somewhere", "anywhere",
+}
+
+# A city needs one of these before it (or a state after it), so "Compare Stanford" stays an institution
+CITY_PREPOSITIONS = {"in", "near", "around", "outside", "by"}
+
+# Amounts that are money on their own ("$30,000", "30k", "30 thousand") and bare numbers,
+# which only count as a budget in context (see _is_budget)
+MONEY_AMOUNT = (r"\$\s?\d[\d,]*(?:\.\d+)?\s?(?:k\b|thousand\b)?"
+                r"|\b\d[\d,]*(?:\.\d+)?\s?(?:(?:k|thousand)\b(?:\s?(?:dollars|usd)\b)?|(?:dollars|usd)\b)")
+BARE_AMOUNT = r"\b\d{1,3}(?:,\d{3})+\b|\b\d{4,6}\b"
+BUDGET_PATTERN = re.compile(
+    r"(?:\b(?:under|below|less than|no more than|up to|at most|max(?:imum)?|within|around|about|budget(?:\s+of|\s+is)?)\s+)?"
+    rf"(?:(?P<money>{MONEY_AMOUNT})|(?P<number>{BARE_AMOUNT}))"
+    r"(?P<per_year>\s*(?:a|per|/)\s*(?:year|yr)\b)?",
+    re.IGNORECASE,
+)
+# A bare number needs a money word shortly before it ("tuition under 30000") or "per year" after it...
+BUDGET_CUE_PATTERN = re.compile(r"\b(?:budget|tuition|costs?|price|afford|spend|pay|usd)\b", re.IGNORECASE)
+# ...and is never a year ("fall 2025"), a score ("SAT under 1200") or a count ("20,000 students")
+YEAR_PATTERN = re.compile(r"(?:19|20)\d\d")
+SCORE_PATTERN = re.compile(r"\b(?:sat|act|gpa|scores?)\b", re.IGNORECASE)
+COUNT_PATTERN = re.compile(r"\s*(?:students|undergrads|undergraduates|enrolled|applicants|people|sat|act|gpa)\b", re.IGNORECASE)
+# Characters before a bare number searched for a cue
+BUDGET_CUE_WINDOW = 30
+LOW_BUDGET_PATTERN = re.compile(r"\b(?:affordable|cheap|cheapest|inexpensive|low[- ]cost|budget[- ]friendly|lowest cost|on a budget)\b", re.IGNORECASE)
+
+# Degree phrases mapped to a query_builder.DEGREE_LEVELS key, one named group per level
+DEGREE_PATTERN = re.compile(
+    r"\b(?:(?P<bachelor>bachelor(?:'?s)?|undergrad(?:uate)?|four[- ]year|4[- ]year)"
+    r"|(?P<master>master(?:'?s)?|mba|grad(?:uate)? (?:school|programs?|degree))"
+    r"|(?P<phd>ph\.?d\.?|doctorate|doctoral)"
+    r"|(?P<associate>associate(?:'?s)?|two[- ]year|2[- ]year|community colleges?)"
+    # BS/MS only with context, so the state codes MS and MA aren't read as degrees
+    r"|(?P<bachelor_short>(?-i:BS|BA|BSc))(?= (?:in|degree))"
+    r"|(?P<master_short>(?-i:MS|MA|MSc))(?= (?:in|degree)))(?!\w)",
+    re.IGNORECASE,
+)
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9&'.-]*")
+
+
+def _key(words: List[str]) -> str:
+    return " ".join(word.lower().removesuffix("'s") for word in words)
+
+
+def _tokens(text: str) -> List[Tuple[str, int, int]]:
+    """Words with their character span; trailing punctuation is dropped."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        word = match.group(0).rstrip(".'-")
+        if word:
+            tokens.append((word, match.start(), match.start() + len(word)))
+    return tokens
+
+
+def _name_key(name: str) -> str:
+    return _key([word for word, _, _ in _tokens(name)])
+
+
+def _short_name(instnm: str) -> Optional[str]:
+    """"Harvard University" -> "harvard"; names that start with "University of" have none."""
+    match = re.match(r"^(.+?)\s+(?:University|College)(?:-Main Campus)?$", instnm)
+    return _name_key(match.group(1)) if match else None
+
+
+_gazetteers: Optional[Dict] = None
+_gazetteer_lock = threading.Lock()
+
+
+def _load_gazetteers() -> Dict:
+    cities: Dict[str, Tuple[str, set]] = {}
+    instnms: List[str] = []
+    try:
+        with get_pool().connection() as conn:
+            for city, state in conn.execute(f"SELECT DISTINCT CITY, STABBR FROM {TABLES['hd']} WHERE CITY IS NOT NULL"):
+                cities.setdefault(_name_key(city), (city, set()))[1].add(state)
+            instnms = [row[0] for row in conn.execute(f"SELECT INSTNM FROM {TABLES['hd']} WHERE INSTNM IS NOT NULL")]
+    except Exception as e:
+        # Without the database only states, city nicknames and curated aliases are recognised
+        print(f"Preference gazetteers without IPEDS data: {e}")
+    for alias, (city, state) in CITY_ALIASES.items():
+        cities.setdefault(_name_key(alias), (city, set()))[1].add(state)
+
+    institutions = {_name_key(name): name for name in instnms}
+    short_names: Dict[str, List[str]] = {}
+    for name in instnms:
+        short = _short_name(name)
+        if short and short not in STATE_ABBREVIATIONS and short not in MAJOR_SYNONYMS and short not in FILLER_WORDS:
+            short_names.setdefault(short, []).append(name)
+    for short, names in short_names.items():
+        # Only short names that point at exactly one institution
+        if len(names) == 1:
+            institutions.setdefault(short, None)
+    for alias in CURATED_ALIASES:
+        institutions.setdefault(_name_key(alias), None)
+
+    # Every leading run of words of every key, so matching stops as soon as a phrase can't grow into one
+    keys = list(cities) + list(institutions) + list(MAJOR_SYNONYMS) + list(STATE_ABBREVIATIONS) + list(MODIFIERS)
+    keys += [code.lower() for code in STATE_CODES]
+    prefixes = set()
+    for key in keys:
+        words = key.split()
+        prefixes.update(" ".join(words[:n]) for n in range(1, len(words) + 1))
+    # Curated aliases are matched however short ("ut"); other short keys need capitals ("MIT")
+    aliases = {_name_key(alias) for alias in CURATED_ALIASES}
+    return {"cities": cities, "institutions": institutions, "prefixes": prefixes, "aliases": aliases}
+
+
+def gazetteers() -> Dict:
+    """State, city, institution and major lookups, built from the database on first use."""
+    global _gazetteers
+    with _gazetteer_lock:
+        if _gazetteers is None:
+            _gazetteers = _load_gazetteers()
+        return _gazetteers
+
+
+def _is_budget(query: str, match: re.Match, previous_end: int) -> bool:
+    if match.group("money"):
+        return True
+    if COUNT_PATTERN.match(query, match.end("number")):
+        return False
+    if YEAR_PATTERN.fullmatch(match.group("number")) and not match.group("per_year"):
+        return False
+    # Only look back as far as the previous amount, so "SAT under 1200 and tuition under 30000" splits
+    before = query[max(previous_end, match.start("number") - BUDGET_CUE_WINDOW):match.start("number")]
+    if SCORE_PATTERN.search(before):
+        return False
+    return bool(match.group("per_year") or BUDGET_CUE_PATTERN.search(before))
+
+
+def _budget(query: str, consumed: List[Tuple[int, int]]) -> Optional[Union[int, str]]:
+    amounts = []
+    previous_end = 0
+    # Most queries have no amount; skip the costlier pattern for them
+    for match in (BUDGET_PATTERN.finditer(query) if any(char.isdigit() for char in query) else ()):
+        is_budget, previous_end = _is_budget(query, match, previous_end), match.end()
+        if not is_budget:
+            continue
+        text = (match.group("money") or match.group("number")).lower()
+        value = float(re.sub(r"[^\d.]", "", text) or 0)
+        if "k" in text or "thousand" in text:
+            value *= 1000
+        if value >= 1000:
+            amounts.append(int(value))
+            consumed.append(match.span())
+    for match in LOW_BUDGET_PATTERN.finditer(query):
+        consumed.append(match.span())
+    if amounts:
+        return max(amounts)
+    return "low" if LOW_BUDGET_PATTERN.search(query) else None
+
+
+def _degree_level(query: str, consumed: List[Tuple[int, int]]) -> Optional[str]:
+    level = None
+    for match in DEGREE_PATTERN.finditer(query):
+        consumed.append(match.span())
+        level = level or match.lastgroup.removesuffix("_short")
+    return level
+
+
+def _join(values: List[str]) -> str:
+    return ", ".join(dict.fromkeys(values))
+
+
+def detect_intents(query: str) -> List[str]:
+    """What the query asks about, sorted: any of compare, cost and weather; empty for a plain search."""
+    return sorted({INTENT_WORDS[word.lower()] for word, _, _ in _tokens(query) if word.lower() in INTENT_WORDS})
+
+
+def extract_preferences(query: str) -> Tuple[Preferences, float]:
+    """The persona found in the query, and the confidence (0-1) that nothing else was asked for."""
+    found = gazetteers()
+    cities, institutions = found["cities"], found["institutions"]
+    persona: Preferences = {}
+    consumed: List[Tuple[int, int]] = []
+
+    budget = _budget(query, consumed)
+    if budget is not None:
+        persona["budget"] = budget
+    degree_level = _degree_level(query, consumed)
+    if degree_level:
+        persona["degree_level"] = degree_level
+
+    tokens = [token for token in _tokens(query)
+              if not any(start <= token[1] < end for start, end in consumed)]
+    words = [word for word, _, _ in tokens]
+    shouting = query.isupper()
+    states, places, schools, majors = [], [], [], []
+    values: Dict[str, List[str]] = {}
+    matched = unexplained = 0
+    last = None
+    i = 0
+    while i < len(words):
+        previous = words[i - 1].lower() if i > 0 else ""
+        # "University of Texas" names an institution, not a location
+        in_name = previous == "of" and i > 1 and words[i - 2].lower() in ("university", "college")
+        lengths = []
+        while i + len(lengths) < len(words) and _key(words[i:i + len(lengths) + 1]) in found["prefixes"]:
+            lengths.append(len(lengths) + 1)
+        # Longest phrase first
+        for n in reversed(lengths):
+            key = _key(words[i:i + n])
+            surface = " ".join(word.removesuffix("'s") for word in words[i:i + n])
+            city_context = previous in CITY_PREPOSITIONS or (previous in ("or", "and") and last == "location")
+            kind = None
+            if key in MAJOR_SYNONYMS and (len(key) > 2 or surface.isupper()) and not shouting:
+                majors.append(MAJOR_SYNONYMS[key])
+                kind = "major"
+            elif n == 1 and key in MODIFIERS:
+                field, value = MODIFIERS[key]
+                values.setdefault(field, []).append(value)
+                kind = "modifier"
+            elif key in STATE_ABBREVIATIONS and not in_name:
+                states.append(surface)
+                kind = "location"
+            elif n == 1 and len(key) == 2 and surface.isupper() and surface in STATE_CODES and not shouting:
+                states.append(surface)
+                kind = "location"
+            elif key in cities and (city_context or key in CITY_ALIASES):
+                city, city_states = cities[key]
+                following = words[i + n] if i + n < len(words) else ""
+                code = STATE_ABBREVIATIONS.get(following.lower()) or (following if following in STATE_CODES else None)
+                if code in city_states:
+                    # An alias already names its state ("NYC"); "New York, NY" would read as the whole state
+                    places.append(surface if key in CITY_ALIASES else f"{city}, {code}")
+                    n += 1
+                else:
+                    places.append(surface if key in CITY_ALIASES else city)
+                kind = "location"
+            elif key in institutions and (len(key) > 3 or surface.isupper() or key in found["aliases"]):
+                schools.append(institutions[key] or surface)
+                kind = "institution"
+            if kind:
+                matched += n
+                last = kind
+                i += n
+                break
+        else:
+            word = _key(words[i:i + 1])
+            if word in INTENT_WORDS:
+                matched += 1
+            elif word in UNEXPRESSED_INTENT_WORDS or (word not in FILLER_WORDS and word not in COUNTRY_ALIASES):
+                unexplained += 1
+            i += 1
+
+    if states or places:
+        # States first, so parse_location doesn't read a state as narrowing the city before it
+        persona["location"] = "; ".join(dict.fromkeys(states + places))
+    if majors:
+        persona["major"] = _join(majors)
+    if schools:
+        persona["institution"] = _join(schools)
+    for field, field_values in values.items():
+        persona[field] = _join(field_values)
+    intents = detect_intents(query)
+    if intents:
+        persona["intent"] = ", ".join(intents)
+
+    content = matched + len(consumed) + unexplained
+    confidence = 1.0 if content == 0 else 1 - unexplained / content
+    return persona, confidence
+
+
+def parse_persona(persona) -> Dict:
+    """The planner's persona as a dict; an LLM-written persona arrives as text that should contain JSON."""
+    if isinstance(persona, dict):
+        return persona
+    text = str(persona or "")
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        value = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def merge_preferences(rules: Dict, llm_persona) -> Dict:
+    """The LLM's persona over the rule-based one; rule values fill the fields the LLM left empty."""
+    parsed = parse_persona(llm_persona)
+    if not parsed and str(llm_persona or "").strip():
+        # Keep an unparseable reply readable for the prompts downstream
+        parsed = {"description": str(llm_persona).strip()}
+    merged = dict(rules)
+    for field, value in parsed.items():
+        if value in (None, "", [], {}) or str(value).lower() in ("none", "null", "unknown", "not specified", "n/a"):
+            continue
+        merged[field] = value
+    return merged
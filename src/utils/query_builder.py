@@ -0,0 +1,225 @@
+import os
+import re
+from typing import List, Optional, Tuple, TypedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Survey year whose tables (hd<year>, adm<year>, ef<year>a, ic<year>_ay) the tools query
+IPEDS_YEAR = os.getenv("IPEDS_YEAR", "2023")
+
+
+def table_names(year: str = IPEDS_YEAR) -> dict:
+    """Table name for each IPEDS survey in a given year; every year is its own set of tables."""
+    return {"hd": f"hd{year}", "adm": f"adm{year}", "ef": f"ef{year}a", "ic": f"ic{year}_ay"}
+
+
+TABLES = table_names()
+
+# Schema of the IPEDS tables, shared with the LLM fallback prompts
+SCHEMA_DESCRIPTION = f"""Tables (all keyed by UNITID):
+- {TABLES["hd"]}(UNITID, INSTNM, CITY, STABBR, ZIP, WEBADDR, SECTOR, ICLEVEL) - institution directory; STABBR is the two-letter state code, SECTOR 1=public 4-year, 2=private nonprofit 4-year, 3=private for-profit 4-year; ICLEVEL 1=4-year, 2=2-year, 3=less than 2-year
+- {TABLES["adm"]}(UNITID, ADM_RATE, SAT_AVG, ACT_AVG, APPLY_COUNT, ADMIT_COUNT, ENROLL_COUNT) - admissions
+- {TABLES["ef"]}(UNITID, UGDS, GRADS) - undergraduate and graduate enrollment
+- {TABLES["ic"]}(UNITID, TUITIONFEE_IN, TUITIONFEE_OUT, ROOMBOARD_ON, OTHEREXPENSES) - yearly cost of attendance
+Join the tables with {TABLES["hd"]} on UNITID."""
+
+STATE_ABBREVIATIONS = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "washington dc": "DC", "washington d.c.": "DC", "florida": "FL", "georgia": "GA",
+    "hawaii": "HI", "idaho": "ID", "illinois": "IL", "indiana": "IN", "iowa": "IA",
+    "kansas": "KS", "kentucky": "KY", "louisiana": "LA", "maine": "ME", "maryland": "MD",
+    "massachusetts": "MA", "michigan": "MI", "minnesota": "MN", "mississippi": "MS",
+    "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK",
+    "oregon": "OR", "pennsylvania": "PA", "puerto rico": "PR", "rhode island": "RI",
+    "south carolina": "SC", "south dakota": "SD", "tennessee": "TN", "texas": "TX",
+    "utah": "UT", "vermont": "VT", "virginia": "VA", "washington": "WA",
+    "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+STATE_CODES = set(STATE_ABBREVIATIONS.values())
+
+# City nicknames mapped to (CITY, STABBR)
+CITY_ALIASES = {
+    "nyc": ("New York", "NY"), "new york city": ("New York", "NY"),
+    "sf": ("San Francisco", "CA"),
+    "boston": ("Boston", "MA"),
+}
+
+# Locations that mean "anywhere in the dataset"
+COUNTRY_ALIASES = {
+    "", "us", "u.s.", "usa", "u.s.a.", "united states", "united states of america",
+    "america", "anywhere", "any", "nationwide", "any location",
+}
+
+# Regional phrases we can't map to a state list; left to the LLM fallback
+REGION_PATTERN = re.compile(
+    r"\b(coast|region|area|midwest|northeast|northwest|southeast|southwest|new england|near|within|miles)\b"
+)
+
+# Degree levels mapped to hd<year>.ICLEVEL
+DEGREE_LEVELS = {
+    "bachelor": 1, "bachelors": 1, "bachelor's": 1, "ba": 1, "bs": 1, "undergraduate": 1,
+    "undergrad": 1, "master": 1, "masters": 1, "master's": 1, "ms": 1, "ma": 1, "mba": 1,
+    "graduate": 1, "grad": 1, "phd": 1, "ph.d.": 1, "doctorate": 1, "doctoral": 1,
+    "four-year": 1, "4-year": 1,
+    "associate": 2, "associates": 2, "associate's": 2, "two-year": 2, "2-year": 2,
+    "community college": 2,
+}
+
+TABLE_JOINS = f"""FROM {TABLES["hd"]} h
+LEFT JOIN {TABLES["adm"]} a ON a.UNITID = h.UNITID
+LEFT JOIN {TABLES["ef"]} e ON e.UNITID = h.UNITID
+LEFT JOIN {TABLES["ic"]} c ON c.UNITID = h.UNITID"""
+
+TOTAL_COST_IN = "c.TUITIONFEE_IN + c.ROOMBOARD_ON + c.OTHEREXPENSES"
+TOTAL_COST_OUT = "c.TUITIONFEE_OUT + c.ROOMBOARD_ON + c.OTHEREXPENSES"
+
+# Columns selected by each tool
+FOCUS_COLUMNS = {
+    "search": [
+        "h.UNITID", "h.INSTNM", "h.CITY", "h.STABBR", "h.WEBADDR", "h.SECTOR",
+        "a.ADM_RATE", "a.SAT_AVG", "e.UGDS", "c.TUITIONFEE_IN", "c.TUITIONFEE_OUT",
+    ],
+    "cost": [
+        "h.UNITID", "h.INSTNM", "h.CITY", "h.STABBR", "c.TUITIONFEE_IN", "c.TUITIONFEE_OUT",
+        "c.ROOMBOARD_ON", "c.OTHEREXPENSES",
+        f"{TOTAL_COST_IN} AS TOTAL_COST_IN", f"{TOTAL_COST_OUT} AS TOTAL_COST_OUT",
+    ],
+    "comparison": [
+        "h.UNITID", "h.INSTNM", "h.CITY", "h.STABBR", "h.SECTOR", "a.ADM_RATE", "a.SAT_AVG",
+        "a.ACT_AVG", "e.UGDS", "e.GRADS", "c.TUITIONFEE_IN", "c.TUITIONFEE_OUT",
+        "c.ROOMBOARD_ON", f"{TOTAL_COST_OUT} AS TOTAL_COST_OUT",
+    ],
+}
+
+FOCUS_ORDER = {
+    "search": "h.INSTNM",
+    "cost": "TOTAL_COST_OUT IS NULL, TOTAL_COST_OUT",
+    "comparison": "h.INSTNM",
+}
+
+MAX_ROWS = 25
+
+
+class QuerySpec(TypedDict):
+    """Filters parsed from the tool arguments."""
+    states: List[str]  # Whole-state matches on STABBR
+    cities: List[Tuple[str, Optional[str]]]  # (CITY, optional STABBR)
+    institutions: List[str]  # Name fragments matched against INSTNM
+    unitids: List[int]  # Institutions already resolved to primary keys (see names.resolve_spec)
+    iclevel: Optional[int]  # hd<year>.ICLEVEL
+
+
+def _split(value: str, pattern: str) -> List[str]:
+    return [part.strip() for part in re.split(pattern, value) if part.strip()]
+
+
+def _state_code(part: str) -> Optional[str]:
+    key = part.lower().strip(". ")
+    if key in STATE_ABBREVIATIONS:
+        return STATE_ABBREVIATIONS[key]
+    if key.upper() in STATE_CODES and len(key) == 2:
+        return key.upper()
+    return None
+
+
+def parse_location(location: str) -> Optional[Tuple[List[str], List[Tuple[str, Optional[str]]]]]:
+    """Parse a free-text location into state codes and (city, state) pairs."""
+    states, cities = [], []
+    if location.lower().strip() in COUNTRY_ALIASES:
+        return states, cities
+    if REGION_PATTERN.search(location.lower()) or re.search(r"\d", location):
+        return None
+
+    parts = _split(location, r",|;|/|\bor\b|\band\b")
+    for i, part in enumerate(parts):
+        code = _state_code(part)
+        if part.lower() in COUNTRY_ALIASES:
+            continue
+        if part.lower() in CITY_ALIASES:
+            cities.append(CITY_ALIASES[part.lower()])
+        elif code:
+            # An alias already carries its state; "Boston, MA" repeats it rather than adding all of MA
+            if cities and i > 0 and parts[i - 1].lower() in CITY_ALIASES and cities[-1][1] == code:
+                continue
+            # "Cambridge, MA" narrows the preceding city rather than adding the whole state
+            if cities and cities[-1][1] is None and i > 0 and not _state_code(parts[i - 1]):
+                cities[-1] = (cities[-1][0], code)
+            elif code not in states:
+                states.append(code)
+        else:
+            cities.append((part, None))
+    return states, cities
+
+
+def parse_institutions(institution: str) -> List[str]:
+    """Split a comma separated institution list."""
+    return _split(institution, r",|;|\bvs\.?|\bversus\b")
+
+
+def parse_spec(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> Optional[QuerySpec]:
+    """Turn tool arguments into a QuerySpec, or None if the builder can't handle them."""
+    parsed_location = parse_location(location or "")
+    if parsed_location is None:
+        return None
+
+    iclevel = None
+    level = (degree_level or "").lower().strip()
+    if level and level not in ("any", "all"):
+        if level not in DEGREE_LEVELS:
+            return None
+        iclevel = DEGREE_LEVELS[level]
+
+    # The IPEDS tables carry no program data, so major is not a SQL filter
+    states, cities = parsed_location
+    return {
+        "states": states,
+        "cities": cities,
+        "institutions": parse_institutions(institution or ""),
+        "unitids": [],
+        "iclevel": iclevel,
+    }
+
+
+def compile_spec(spec: QuerySpec, focus: str = "search") -> Tuple[str, List]:
+    """Compile a QuerySpec into a parameterized JOIN across the IPEDS tables."""
+    clauses, params = [], []
+
+    location_terms = []
+    if spec["states"]:
+        location_terms.append(f"h.STABBR IN ({', '.join('?' * len(spec['states']))})")
+        params.extend(spec["states"])
+    for city, state in spec["cities"]:
+        if state:
+            location_terms.append("(h.CITY = ? COLLATE NOCASE AND h.STABBR = ?)")
+            params.extend([city, state])
+        else:
+            location_terms.append("h.CITY = ? COLLATE NOCASE")
+            params.append(city)
+    if location_terms:
+        clauses.append("(" + " OR ".join(location_terms) + ")")
+
+    name_terms = []
+    if spec["unitids"]:
+        name_terms.append(f"h.UNITID IN ({', '.join('?' * len(spec['unitids']))})")
+        params.extend(spec["unitids"])
+    for name in spec["institutions"]:
+        name_terms.append("h.INSTNM LIKE ?")
+        params.append(f"%{name}%")
+    if name_terms:
+        clauses.append("(" + " OR ".join(name_terms) + ")")
+
+    if spec["iclevel"] is not None:
+        clauses.append("h.ICLEVEL = ?")
+        params.append(spec["iclevel"])
+
+    sql = f"SELECT {', '.join(FOCUS_COLUMNS[focus])}\n{TABLE_JOINS}"
+    if clauses:
+        sql += "\nWHERE " + "\nAND ".join(clauses)
+    sql += f"\nORDER BY {FOCUS_ORDER[focus]}\nLIMIT ?"
+    params.append(MAX_ROWS)
+    return sql, params
+
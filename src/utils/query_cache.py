@@ -0,0 +1,250 @@
+"""Cache of finished runs keyed on the planner's extracted user persona.
+
+Differently worded queries that extract the same preferences ("affordable CS schools
+in California" / "cheap computer science colleges in CA") share one entry, so a hit
+skips gathering, the report and the knowledge graph. Hard constraints (location,
+institutions, degree level, and the intent read from the query itself, so "weather in
+Boston" never gets the answer to "universities in Boston") must match exactly; the
+remaining preferences only need to be similar. Entries are dropped when the IPEDS database changes, and bounded by
+count, size and age.
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from src.graph.state import TOOL_RESULT_KEYS
+from src.utils.db import get_db_path
+from src.utils.preferences import MAJOR_SYNONYMS, detect_intents, parse_persona
+from src.utils.query_builder import DEGREE_LEVELS, IPEDS_YEAR, parse_institutions, parse_location
+from src.utils.tracing import annotate
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE", "1").lower() not in ("0", "false", "no")
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "500"))
+QUERY_CACHE_MAX_MB = float(os.getenv("QUERY_CACHE_MAX_MB", "64"))
+# Minimum Jaccard similarity of the soft preferences for a near match
+QUERY_CACHE_SIMILARITY = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.8"))
+
+# State keys stored for a run and restored on a hit
+CACHED_KEYS = TOOL_RESULT_KEYS + ["report", "knowledge_graph"]
+
+HARD_FIELDS = ("location", "institution", "degree_level", "intent")
+
+LOW_BUDGET_WORDS = {"affordable", "cheap", "inexpensive", "low", "low cost", "low-cost", "budget", "lowest"}
+HIGH_BUDGET_WORDS = {"any", "unlimited", "no limit", "high", "flexible"}
+
+STOPWORDS = {"a", "an", "the", "and", "or", "of", "in", "for", "to", "with", "program", "programs", "degree", "major"}
+
+
+def _text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(str(item) for item in value)
+    return " ".join(str(value or "").lower().split())
+
+
+def _canonical_location(value) -> str:
+    text = _text(value)
+    parsed = parse_location(text) if text else None
+    if parsed is None:
+        return text
+    states, cities = parsed
+    return ";".join(sorted(set(states)) + sorted({f"{city.lower()}|{state or ''}" for city, state in cities}))
+
+
+def _canonical_major(value) -> str:
+    majors = []
+    for part in re.split(r",|;|/|\band\b|\bor\b", _text(value)):
+        part = part.strip()
+        if part:
+            majors.append(MAJOR_SYNONYMS.get(part, part))
+    return ", ".join(sorted(set(majors)))
+
+
+def _canonical_budget(value) -> str:
+    text = _text(value)
+    amounts = [int(amount.replace(",", "")) for amount in re.findall(r"\d[\d,]*", text)]
+    if amounts:
+        amount = max(amounts)
+        amount = amount * 1000 if "k" in text and amount < 1000 else amount
+        # Budgets within the same $10k band behave the same
+        return f"{round(amount / 10000) * 10}k"
+    if text in LOW_BUDGET_WORDS or any(word in text for word in ("afford", "cheap", "low")):
+        return "low"
+    if text in HIGH_BUDGET_WORDS:
+        return "any"
+    return "" if text in ("", "none", "null", "unknown", "not specified", "n/a") else text
+
+
+def canonical_persona(persona) -> Dict[str, str]:
+    """Normalised, non-empty persona fields."""
+    persona = parse_persona(persona)
+    canonical = {}
+    for field, value in persona.items():
+        field = str(field).lower().strip()
+        if field == "location":
+            value = _canonical_location(value)
+        elif field in ("major", "majors", "field", "program"):
+            field, value = "major", _canonical_major(value)
+        elif field == "budget":
+            value = _canonical_budget(value)
+        elif field in ("institution", "institutions", "university", "universities"):
+            field = "institution"
+            value = ", ".join(sorted(name.lower() for name in parse_institutions(_text(value))))
+        elif field == "degree_level":
+            text = _text(value)
+            value = str(DEGREE_LEVELS.get(text, text))
+        else:
+            value = _text(value)
+        if value and value not in ("none", "null", "unknown", "not specified", "n/a"):
+            canonical[field] = value
+    return canonical
+
+
+def _soft_tokens(canonical: Dict[str, str]) -> frozenset:
+    tokens = set()
+    for field, value in canonical.items():
+        if field not in HARD_FIELDS:
+            tokens.update(f"{field}:{word}" for word in re.findall(r"[a-z0-9]+", value) if word not in STOPWORDS)
+    return frozenset(tokens)
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two token sets (1.0 when both are empty)."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def db_fingerprint() -> str:
+    """Identifies the IPEDS data the results came from; changes when the database is rebuilt."""
+    path = get_db_path()
+    try:
+        stat = os.stat(path)
+        return f"{IPEDS_YEAR}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        return f"{IPEDS_YEAR}:missing"
+
+
+class QueryCache:
+    """LRU cache of run results keyed on the canonical persona and the query's intent, bounded by entries, bytes and age."""
+
+    def __init__(self, ttl: float = QUERY_CACHE_TTL, max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+                 max_bytes: int = int(QUERY_CACHE_MAX_MB * 1024 * 1024), threshold: float = QUERY_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(persona, query: str) -> Optional[Tuple]:
+        canonical = canonical_persona(persona)
+        if not canonical:
+            return None
+        # Taken from the query rather than the persona, which an LLM may have written without it
+        canonical["intent"] = ", ".join(detect_intents(query)) or "search"
+        return tuple(sorted(canonical.items()))
+
+    def _drop(self, key: Tuple) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def _usable(self, entry: Dict, fingerprint: str, now: float) -> bool:
+        return entry["fingerprint"] == fingerprint and now - entry["created_at"] <= self.ttl
+
+    def get(self, persona, query: str) -> Optional[Dict]:
+        """Stored results for this persona and intent, or a close enough persona with the same intent, else None."""
+        key = self.key(persona, query)
+        if key is None:
+            return None
+        fingerprint, now = db_fingerprint(), time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._usable(entry, fingerprint, now):
+                self._drop(key)
+                entry = None
+            match = key if entry is not None else None
+
+            if match is None:
+                canonical = dict(key)
+                hard = tuple(canonical.get(field) for field in HARD_FIELDS)
+                tokens = _soft_tokens(canonical)
+                best = 0.0
+                for other, candidate in list(self._entries.items()):
+                    if not self._usable(candidate, fingerprint, now):
+                        self._drop(other)
+                        continue
+                    if candidate["hard"] != hard:
+                        continue
+                    score = similarity(tokens, candidate["tokens"])
+                    if score >= self.threshold and score > best:
+                        match, best = other, score
+
+            if match is None:
+                self.misses += 1
+                annotate(query_cache="miss")
+                return None
+            self._entries.move_to_end(match)
+            if match == key:
+                self.hits += 1
+                annotate(query_cache="hit")
+            else:
+                self.near_hits += 1
+                annotate(query_cache="near_hit")
+            return dict(self._entries[match]["values"])
+
+    def put(self, persona, state: Dict) -> bool:
+        """Store a finished run's results; returns False when the persona or results are unusable."""
+        key = self.key(persona, state.get("query", ""))
+        values = {name: state.get(name) for name in CACHED_KEYS if state.get(name)}
+        if key is None or not values.get("report"):
+            return False
+        size = len(json.dumps(values, default=str))
+        if size > self.max_bytes:
+            return False
+        canonical = dict(key)
+        entry = {
+            "values": values,
+            "size": size,
+            "hard": tuple(canonical.get(field) for field in HARD_FIELDS),
+            "tokens": _soft_tokens(canonical),
+            "fingerprint": db_fingerprint(),
+            "created_at": time.time(),
+        }
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "near_hits": self.near_hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+
+query_cache = QueryCache()
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """The process-wide query cache, or None when QUERY_CACHE is off"""
+    return query_cache if QUERY_CACHE_ENABLED else None
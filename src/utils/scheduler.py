@@ -0,0 +1,498 @@
+"""Process-wide scheduler for LLM requests.
+
+Every call through the shared client waits for a request slot and for room in the
+requests-per-minute and tokens-per-minute buckets, in priority order, so bursts queue
+instead of failing with 429s. Rate-limit and server errors are retried with jittered
+exponential backoff, and identical prompts already in flight share one request.
+"""
+import os
+import time
+import heapq
+import asyncio
+import random
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+from langchain_core.caches import BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessageChunk, BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from src.utils.context import estimate_tokens
+from src.utils.tracing import annotate
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Provider limits, off (0) unless set; Groq's free tier for llama-3.1-8b-instant is LLM_RPM=30, LLM_TPM=6000
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# Completion tokens reserved per request until the real usage is known
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "256"))
+
+# Seconds between checks while an async request waits for a slot
+ASYNC_POLL_INTERVAL = 0.02
+
+# Lower runs first; interactive calls (the streamed report) go ahead of background work
+PRIORITIES = {"interactive": 0, "default": 1, "background": 2}
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default="default")
+
+
+@contextmanager
+def llm_priority(name: str) -> Iterator[None]:
+    """Run LLM calls made inside the block at the given priority."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to one minute's allowance."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (a request larger than the bucket waits for a full one)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def refund(self, amount: float) -> None:
+        """Return (or, if negative, charge) the difference between reserved and actual use."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors and connection failures are worth retrying."""
+    code = _status_code(error)
+    if code is not None:
+        return code == 429 or code >= 500
+    return type(error).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """Priority queue in front of the LLM provider with rate limits, retries and single-flight."""
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._queue: List[tuple] = []
+        self._sequence = 0
+        self._active = 0
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {"requests": 0, "coalesced": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    def _enqueue(self, priority: str) -> tuple:
+        self._sequence += 1
+        entry = (PRIORITIES.get(priority, PRIORITIES["default"]), self._sequence)
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    def _dequeue(self, entry: tuple) -> None:
+        """Drop a request that gave up waiting and let the next one in line check again."""
+        self._queue.remove(entry)
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def _try_take(self, entry: tuple, tokens: int, throttled: bool):
+        """Under the lock: take a slot and rate budget if entry is first in line.
+        Returns (granted, seconds to wait or None to wait for a release, throttled)."""
+        if self._queue[0] != entry or self._active >= self.max_concurrency:
+            return False, None, throttled
+        wait = max(
+            self.requests.wait_time(1) if self.requests else 0.0,
+            self.tokens.wait_time(tokens) if self.tokens else 0.0,
+        )
+        if wait > 0.0:
+            return False, wait, True
+        heapq.heappop(self._queue)
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(min(tokens, self.tokens.capacity))
+        self._active += 1
+        self._stats["requests"] += 1
+        if throttled:
+            self._stats["throttled"] += 1
+        # The next request in line may be able to go right away
+        self._cond.notify_all()
+        return True, None, throttled
+
+    def acquire(self, priority: str = "default", tokens: int = 0) -> None:
+        """Block until this request is first in line and a slot plus rate budget are free."""
+        with self._cond:
+            entry = self._enqueue(priority)
+            throttled = False
+            try:
+                while True:
+                    granted, wait, throttled = self._try_take(entry, tokens, throttled)
+                    if granted:
+                        return
+                    self._cond.wait(timeout=wait)
+            except BaseException:
+                self._dequeue(entry)
+                raise
+
+    async def aacquire(self, priority: str = "default", tokens: int = 0) -> None:
+        """Like acquire, but waits on the event loop instead of blocking a thread.
+        Async waiters poll, so a release is noticed within ASYNC_POLL_INTERVAL."""
+        with self._cond:
+            entry = self._enqueue(priority)
+        throttled = False
+        try:
+            while True:
+                with self._cond:
+                    granted, wait, throttled = self._try_take(entry, tokens, throttled)
+                if granted:
+                    return
+                await asyncio.sleep(min(wait, ASYNC_POLL_INTERVAL) if wait is not None else ASYNC_POLL_INTERVAL)
+        except BaseException:
+            with self._cond:
+                self._dequeue(entry)
+            raise
+
+    def release(self, reserved_tokens: int = 0, used_tokens: Optional[int] = None) -> None:
+        with self._cond:
+            self._active -= 1
+            if self.tokens and used_tokens is not None:
+                self.tokens.refund(min(reserved_tokens, self.tokens.capacity) - used_tokens)
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when the provider sends it."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Backoff before the next attempt, or re-raise when the error is final."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            with self._cond:
+                self._stats["failures"] += 1
+            raise error
+        delay = self.backoff(attempt, error)
+        with self._cond:
+            self._stats["retries"] += 1
+        print(f"LLM request failed ({error}); retrying in {delay:.1f}s")
+        return delay
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0, usage: Callable[[Any], Optional[int]] = None) -> Any:
+        """Run fn under the scheduler at the current priority, retrying retryable errors."""
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, tokens)
+            used = None
+            try:
+                result = fn()
+                used = usage(result) if usage else None
+                return result
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+            finally:
+                self.release(tokens, used)
+            time.sleep(delay)
+
+    def stream(self, open_stream: Callable[[], Iterator], tokens: int = 0,
+               usage: Callable[[List[Any]], Optional[int]] = None) -> Iterator:
+        """Yield from a streaming request, holding its slot until the stream ends.
+        Only failures before the first chunk are retried; later ones would duplicate output."""
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, tokens)
+            try:
+                stream = open_stream()
+                first = next(stream, None)
+                break
+            except Exception as e:
+                self.release(tokens)
+                delay = self._retry_delay(attempt, e)
+            time.sleep(delay)
+
+        chunks = []
+        try:
+            if first is None:
+                return
+            chunks.append(first)
+            yield first
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            self.release(tokens, usage(chunks) if usage else None)
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0, usage: Callable[[Any], Optional[int]] = None) -> Any:
+        """Async call: fn returns a coroutine, and waits happen on the event loop."""
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(priority, tokens)
+            used = None
+            try:
+                result = await fn()
+                used = usage(result) if usage else None
+                return result
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+            finally:
+                self.release(tokens, used)
+            await asyncio.sleep(delay)
+
+    async def astream(self, open_stream: Callable[[], AsyncIterator], tokens: int = 0,
+                      usage: Callable[[List[Any]], Optional[int]] = None) -> AsyncIterator:
+        """Async stream: holds its slot until the stream ends, retrying only before the first chunk."""
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(priority, tokens)
+            try:
+                stream = open_stream()
+                first = await anext(stream, None)
+                break
+            except Exception as e:
+                self.release(tokens)
+                delay = self._retry_delay(attempt, e)
+            await asyncio.sleep(delay)
+
+        chunks = []
+        try:
+            if first is None:
+                return
+            chunks.append(first)
+            yield first
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            self.release(tokens, usage(chunks) if usage else None)
+
+    def call_once(self, key: str, fn: Callable[[], Any], tokens: int = 0, usage: Callable[[Any], Optional[int]] = None) -> Any:
+        """Like call, but concurrent calls with the same key share a single request."""
+        with self._cond:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            annotate(coalesced=True)
+            return future.result()
+
+        try:
+            result = self.call(fn, tokens, usage)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._cond:
+                self._inflight.pop(key, None)
+
+    async def acall_once(self, key: str, fn: Callable[[], Awaitable[Any]], tokens: int = 0,
+                         usage: Callable[[Any], Optional[int]] = None) -> Any:
+        """Async call_once; shares in-flight requests with sync callers too."""
+        with self._cond:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            annotate(coalesced=True)
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await self.acall(fn, tokens, usage)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._cond:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {**self._stats, "active": self._active, "queued": len(self._queue)}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Get the process-wide scheduler shared by every session"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+
+def _estimate_prompt_tokens(messages: List[BaseMessage]) -> int:
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+def _result_tokens(result: ChatResult) -> Optional[int]:
+    for generation in result.generations:
+        usage = getattr(generation.message, "usage_metadata", None)
+        if usage:
+            return usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    usage = (result.llm_output or {}).get("token_usage") or {}
+    return usage.get("total_tokens")
+
+
+class SchedulingChatModel(BaseChatModel):
+    """Chat model wrapper that sends every request of the inner model through the scheduler."""
+
+    inner: BaseChatModel
+    scheduler: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def _get_ls_params(self, stop: Optional[List[str]] = None, **kwargs):
+        return self.inner._get_ls_params(stop=stop, **kwargs)
+
+    def _get_scheduler(self) -> LLMScheduler:
+        return self.scheduler or get_scheduler()
+
+    def bind_tools(self, tools, **kwargs):
+        # Let the provider format the tools, then bind the same arguments to the wrapper
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    @staticmethod
+    def _request_key(messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict) -> str:
+        return hashlib.sha256(f"{dumps(messages)}\x00{stop}\x00{sorted(kwargs.items())!r}".encode("utf-8")).hexdigest()
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = _estimate_prompt_tokens(messages) + LLM_EXPECTED_COMPLETION_TOKENS
+        return self._get_scheduler().call_once(
+            self._request_key(messages, stop, kwargs),
+            lambda: self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens,
+            _result_tokens,
+        )
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = _estimate_prompt_tokens(messages) + LLM_EXPECTED_COMPLETION_TOKENS
+        return await self._get_scheduler().acall_once(
+            self._request_key(messages, stop, kwargs),
+            lambda: self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            tokens,
+            _result_tokens,
+        )
+
+    def _stream_cache_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict) -> Optional[tuple]:
+        """(prompt, llm_string) under which langchain-core caches the same request made with invoke,
+        or None without a cache; langchain-core itself never caches streamed generations."""
+        if not isinstance(self.cache, BaseCache):
+            return None
+        messages = [message.model_copy(update={"id": None}) if getattr(message, "id", None) else message for message in messages]
+        return dumps(messages), self._get_llm_string(stop=stop, **kwargs)
+
+    @staticmethod
+    def _cached_chunk(generations) -> Optional[ChatGenerationChunk]:
+        """A cache hit replayed as one chunk."""
+        if not isinstance(generations, list) or not generations:
+            return None
+        message = getattr(generations[0], "message", None)
+        content = message.content if message is not None else generations[0].text
+        return ChatGenerationChunk(message=AIMessageChunk(content=content), generation_info=generations[0].generation_info)
+
+    @staticmethod
+    def _streamed_generation(chunks: List[ChatGenerationChunk]) -> ChatGeneration:
+        """A finished stream as the generation invoke would have returned."""
+        merged = chunks[0]
+        for chunk in chunks[1:]:
+            merged += chunk
+        return ChatGeneration(message=message_chunk_to_message(merged.message), generation_info=merged.generation_info)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        key = self._stream_cache_key(messages, stop, kwargs)
+        cached = self._cached_chunk(self.cache.lookup(*key)) if key else None
+        if cached is not None:
+            yield cached
+            return
+
+        # Streams are not coalesced: every caller needs its own tokens as they arrive
+        prompt_tokens = _estimate_prompt_tokens(messages)
+        chunks = []
+        for chunk in self._get_scheduler().stream(
+            lambda: self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs),
+            prompt_tokens + LLM_EXPECTED_COMPLETION_TOKENS,
+            lambda chunks: prompt_tokens + estimate_tokens("".join(chunk.text for chunk in chunks)),
+        ):
+            chunks.append(chunk)
+            yield chunk
+        # Only a text stream that ran to the end is cached; a hit is replayed as text
+        if key and chunks and not any(getattr(chunk.message, "tool_call_chunks", None) for chunk in chunks):
+            self.cache.update(*key, [self._streamed_generation(chunks)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._stream_cache_key(messages, stop, kwargs)
+        cached = self._cached_chunk(await self.cache.alookup(*key)) if key else None
+        if cached is not None:
+            yield cached
+            return
+
+        prompt_tokens = _estimate_prompt_tokens(messages)
+        chunks = []
+        async for chunk in self._get_scheduler().astream(
+            lambda: self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs),
+            prompt_tokens + LLM_EXPECTED_COMPLETION_TOKENS,
+            lambda chunks: prompt_tokens + estimate_tokens("".join(chunk.text for chunk in chunks)),
+        ):
+            chunks.append(chunk)
+            yield chunk
+        if key and chunks and not any(getattr(chunk.message, "tool_call_chunks", None) for chunk in chunks):
+            await self.cache.aupdate(*key, [self._streamed_generation(chunks)])
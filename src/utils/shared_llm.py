@@ -1,15 +1,65 @@
 import os
-from langchain_groq import ChatGroq
+import threading
+from functools import lru_cache
+from typing import Callable, List, Tuple, TypeVar
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Shared LLM client for the entire application
-shared_llm = ChatGroq(
-    api_key=os.getenv("GROQ_API_KEY"), 
-    model="llama-3.1-8b-instant"
-)
+T = TypeVar("T")
+
+# (role, template) pairs; turned into a ChatPromptTemplate on first use by chat_prompt
+PromptMessages = Tuple[Tuple[str, str], ...]
+
+_shared_llm = None
+_shared_llm_lock = threading.Lock()
+# Memoized factories of objects built on the shared client, dropped when the client is replaced
+_factories: List = []
+
+
+def create_shared_llm():
+    """The production client. Requests go through the process-wide scheduler (rate limits,
+    priorities, retries, coalescing), which owns retries, so the Groq client's own are disabled.
+    Responses are cached on disk when LLM_CACHE_PATH is set; cache hits skip the scheduler."""
+    from langchain_groq import ChatGroq
+    from src.utils.llm_cache import get_llm_cache
+    from src.utils.scheduler import SchedulingChatModel
+
+    return SchedulingChatModel(
+        inner=ChatGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            model="llama-3.1-8b-instant",
+            max_retries=0
+        ),
+        cache=get_llm_cache()
+    )
 
 def get_shared_llm():
-    """Get the shared LLM client"""
-    return shared_llm
+    """Get the shared LLM client, created on first use"""
+    global _shared_llm
+    with _shared_llm_lock:
+        if _shared_llm is None:
+            _shared_llm = create_shared_llm()
+        return _shared_llm
+
+def set_shared_llm(llm):
+    """Replace the shared LLM client, e.g. with a fake model for offline benchmarks.
+    Chains built by llm_factory functions are rebuilt on the new client at their next use."""
+    global _shared_llm
+    with _shared_llm_lock:
+        _shared_llm = llm
+    for factory in _factories:
+        factory.cache_clear()
+
+def llm_factory(func: Callable[[], T]) -> Callable[[], T]:
+    """Memoize a zero-argument factory of something built on the shared client (a chain, a
+    tool-bound model), so importing a module never creates the client."""
+    cached = lru_cache(maxsize=None)(func)
+    _factories.append(cached)
+    return cached
+
+@lru_cache(maxsize=None)
+def chat_prompt(messages: PromptMessages):
+    """The ChatPromptTemplate for a prompt's messages, built once"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages(list(messages))
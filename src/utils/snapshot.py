@@ -0,0 +1,172 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from src.utils.db import get_pool
+from src.utils.tracing import span
+from src.utils.query_builder import QuerySpec, FOCUS_COLUMNS, MAX_ROWS, TABLE_JOINS, TOTAL_COST_IN, TOTAL_COST_OUT
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Serve the IPEDS tools from the in-memory snapshot instead of SQL (IPEDS_SNAPSHOT=0 disables)
+USE_SNAPSHOT = os.getenv("IPEDS_SNAPSHOT", "1").lower() not in ("0", "false", "no")
+
+TEXT_COLUMNS = ["INSTNM", "CITY", "STABBR", "WEBADDR"]
+INTEGER_COLUMNS = [
+    "UNITID", "SECTOR", "ICLEVEL", "SAT_AVG", "ACT_AVG", "UGDS", "GRADS", "TUITIONFEE_IN",
+    "TUITIONFEE_OUT", "ROOMBOARD_ON", "OTHEREXPENSES", "TOTAL_COST_IN", "TOTAL_COST_OUT",
+]  # Everything else numeric (ADM_RATE) stays a float
+
+SNAPSHOT_SQL = f"""SELECT h.UNITID, h.INSTNM, h.CITY, h.STABBR, h.WEBADDR, h.SECTOR, h.ICLEVEL,
+a.ADM_RATE, a.SAT_AVG, a.ACT_AVG, e.UGDS, e.GRADS,
+c.TUITIONFEE_IN, c.TUITIONFEE_OUT, c.ROOMBOARD_ON, c.OTHEREXPENSES,
+{TOTAL_COST_IN} AS TOTAL_COST_IN, {TOTAL_COST_OUT} AS TOTAL_COST_OUT
+{TABLE_JOINS}"""
+
+# Sort column and direction for each tool, matching FOCUS_ORDER in the SQL builder
+FOCUS_RANKING = {
+    "search": ("INSTNM", True),
+    "cost": ("TOTAL_COST_OUT", True),
+    "comparison": ("INSTNM", True),
+}
+
+
+def _output_name(column: str) -> str:
+    """Result column name for a FOCUS_COLUMNS entry ("h.INSTNM" -> "INSTNM", "... AS X" -> "X")."""
+    return column.split(" AS ")[-1].split(".")[-1]
+
+
+class Snapshot:
+    """Columnar, read-only copy of the joined IPEDS tables with vectorised filtering and ranking.
+
+    Text columns are NumPy unicode arrays, numeric columns float64 with NaN for missing values.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+        self.size = len(columns["UNITID"])
+        # Lower-cased copies for case-insensitive matching, built once
+        self._lower = {name: np.char.lower(columns[name]) for name in ("INSTNM", "CITY")}
+
+    @classmethod
+    def from_rows(cls, names: List[str], rows: List[tuple]) -> "Snapshot":
+        columns = {}
+        for i, name in enumerate(names):
+            values = [row[i] for row in rows]
+            if name in TEXT_COLUMNS:
+                columns[name] = np.array(["" if value is None else str(value) for value in values], dtype=str)
+            else:
+                columns[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        return cls(columns)
+
+    def filter(
+        self,
+        states: Optional[Iterable[str]] = None,
+        cities: Optional[Iterable[tuple]] = None,
+        names: Optional[Iterable[str]] = None,
+        unitids: Optional[Iterable[int]] = None,
+        iclevel: Optional[int] = None,
+    ) -> np.ndarray:
+        """Boolean row mask for the QuerySpec filters. Location filters (states, cities) are
+        OR-ed together, as are names and unitids; the groups and iclevel are AND-ed."""
+        c = self.columns
+        mask = np.ones(self.size, dtype=bool)
+
+        states, cities = list(states or []), list(cities or [])
+        if states or cities:
+            location = np.isin(c["STABBR"], states)
+            for city, state in cities:
+                match = self._lower["CITY"] == city.lower()
+                if state:
+                    match &= c["STABBR"] == state
+                location |= match
+            mask &= location
+
+        names, unitids = list(names or []), list(unitids or [])
+        if names or unitids:
+            match = np.isin(c["UNITID"], unitids)
+            for name in names:
+                match |= np.char.find(self._lower["INSTNM"], name.lower()) >= 0
+            mask &= match
+
+        if iclevel is not None:
+            mask &= c["ICLEVEL"] == iclevel
+        return mask
+
+    def rank(self, mask: np.ndarray, by: str = "INSTNM", ascending: bool = True, limit: Optional[int] = MAX_ROWS) -> np.ndarray:
+        """Row indices matching mask, sorted by one column with missing values last."""
+        rows = np.flatnonzero(mask)
+        values = self.columns[by][rows]
+        if by in TEXT_COLUMNS:
+            order = np.argsort(values, kind="stable")
+            if not ascending:
+                order = order[::-1]
+        else:
+            # argsort puts NaN last; negate for descending so NaN stays last
+            order = np.argsort(values if ascending else -values, kind="stable")
+        return rows[order[:limit] if limit else order]
+
+    def records(self, rows: np.ndarray, columns: List[str]) -> Dict:
+        """Build a QueryResult ({columns, rows}) with plain Python values."""
+        out = []
+        for i in rows:
+            record = []
+            for name in columns:
+                value = self.columns[name][i]
+                if name in TEXT_COLUMNS:
+                    record.append(str(value) or None)
+                elif np.isnan(value):
+                    record.append(None)
+                elif name in INTEGER_COLUMNS:
+                    record.append(int(value))
+                else:
+                    record.append(float(value))
+            out.append(record)
+        return {"columns": columns, "rows": out}
+
+    def query(self, spec: QuerySpec, focus: str = "search") -> Dict:
+        """Answer a tool's QuerySpec the same way compile_spec's SQL would."""
+        with span("snapshot.query", kind="snapshot", focus=focus) as query_span:
+            mask = self.filter(
+                states=spec["states"],
+                cities=spec["cities"],
+                names=spec["institutions"],
+                unitids=spec["unitids"],
+                iclevel=spec["iclevel"],
+            )
+            by, ascending = FOCUS_RANKING[focus]
+            rows = self.rank(mask, by=by, ascending=ascending, limit=MAX_ROWS)
+            query_span.set_attributes(rows=len(rows))
+            return self.records(rows, [_output_name(column) for column in FOCUS_COLUMNS[focus]])
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def load_snapshot() -> Snapshot:
+    """Join the IPEDS tables once into a columnar Snapshot"""
+    with get_pool().connection() as conn:
+        cursor = conn.execute(SNAPSHOT_SQL)
+        names = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
+    snapshot = Snapshot.from_rows(names, rows)
+    print(f"Loaded IPEDS snapshot: {snapshot.size} institutions")
+    return snapshot
+
+
+def get_snapshot() -> Snapshot:
+    """Get the process-wide snapshot, loading it on first use"""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = load_snapshot()
+        return _snapshot
+
+
+def reset_snapshot() -> None:
+    """Drop the snapshot so the next call reloads it, e.g. after re-ingesting the database"""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
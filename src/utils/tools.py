@@ -1,22 +1,16 @@
-import os
-import sqlite3
-from typing import List, Dict, Optional
-from tavily import TavilyClient
-from langchain_core.prompts import ChatPromptTemplate
+from typing import List, Dict, TypedDict
 from langchain_core.tools import tool
-from src.utils.shared_llm import get_shared_llm
+from src.utils.shared_llm import PromptMessages, chat_prompt, get_shared_llm
+from src.utils.query_builder import parse_spec, compile_spec, QuerySpec, SCHEMA_DESCRIPTION
+from src.utils.snapshot import get_snapshot, USE_SNAPSHOT
+from src.utils.names import resolve_spec
+from src.utils.weather import get_weather, aget_weather
+from src.utils.db import get_pool, run_db
+from src.utils.tracing import span, annotate
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Use shared LLM client
-llm_client = get_shared_llm()
-
-def get_db_connection():
-    """Get database connection"""
-    db_path = os.getenv("DATABASE_PATH", "data/ipeds_data.db")
-    return sqlite3.connect(db_path)
-
 def clean_sql_query(sql_query: str) -> str:
     """Clean SQL query by removing markdown formatting"""
     # Remove markdown code blocks
@@ -25,157 +19,157 @@ def clean_sql_query(sql_query: str) -> str:
     sql_query = sql_query.strip()
     return sql_query
 
-def execute_sql_and_format(sql_query: str) -> str:
-    """Execute SQL query and format results for display"""
+class QueryResult(TypedDict, total=False):
+    """Structured tool output: column names plus one list of values per row."""
+    columns: List[str]
+    rows: List[list]
+    error: str  # Set instead of rows when the query failed
+
+def execute_sql(sql_query: str, params: tuple = ()) -> QueryResult:
+    """Execute SQL query and return its rows as a QueryResult"""
     # Clean the SQL query first
     sql_query = clean_sql_query(sql_query)
     
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        
-        # Get column names
-        columns = [description[0] for description in cursor.description]
-        
-        # Get results
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Let LLM handle all result processing
-        data_results = []
-        for row in results:
-            data_results.append(dict(zip(columns, row)))
-        
-        return str(data_results)
-        
-    except Exception as e:
-        return f"Database error: {str(e)}"
-
-# Let LLM handle all SQL generation
-sql_prompt = ChatPromptTemplate.from_messages([
+    with span("sql", kind="sql", statement=sql_query[:500]) as sql_span:
+        try:
+            with get_pool().connection() as conn:
+                cursor = conn.execute(sql_query, params)
+                
+                # Get column names
+                columns = [description[0] for description in cursor.description]
+                
+                # Get results
+                results = cursor.fetchall()
+                cursor.close()
+            
+            sql_span.set_attributes(rows=len(results))
+            return {"columns": columns, "rows": [list(row) for row in results]}
+            
+        except Exception as e:
+            sql_span.set_attributes(error=str(e))
+            return {"columns": [], "rows": [], "error": f"Database error: {str(e)}"}
+
+def run_built_query(spec: QuerySpec, focus: str) -> QueryResult:
+    """Answer a parsed tool call from the in-memory snapshot or built SQL"""
+    # Institution names become primary keys in one batched index lookup
+    spec = resolve_spec(spec)
+    if USE_SNAPSHOT:
+        annotate(source="snapshot")
+        return get_snapshot().query(spec, focus)
+    annotate(source="sql")
+    return execute_sql(*compile_spec(spec, focus))
+
+def _sql_inputs(location: str, major: str, institution: str, degree_level: str) -> Dict:
+    return {
+        "schema": SCHEMA_DESCRIPTION,
+        "location": location,
+        "major": major,
+        "institution": institution,
+        "degree_level": degree_level
+    }
+
+def run_query(sql_prompt: PromptMessages, focus: str, location: str, major: str, institution: str, degree_level: str) -> QueryResult:
+    """Answer a tool call from the in-memory snapshot or built SQL, falling back to LLM-generated SQL for inputs the builder can't handle"""
+    spec = parse_spec(location, major, institution, degree_level)
+    if spec is not None:
+        return run_built_query(spec, focus)
+    
+    print(f"Falling back to LLM SQL generation for {focus}")
+    annotate(source="llm_sql")
+    sql_response = chat_prompt(sql_prompt) | get_shared_llm()
+    sql_query = sql_response.invoke(_sql_inputs(location, major, institution, degree_level)).content.strip()
+    return execute_sql(sql_query)
+
+async def arun_query(sql_prompt: PromptMessages, focus: str, location: str, major: str, institution: str, degree_level: str) -> QueryResult:
+    """Async run_query: the LLM call is awaited and SQLite runs on the database threads"""
+    spec = parse_spec(location, major, institution, degree_level)
+    if spec is not None:
+        return await run_db(run_built_query, spec, focus)
+    
+    print(f"Falling back to LLM SQL generation for {focus}")
+    annotate(source="llm_sql")
+    sql_response = chat_prompt(sql_prompt) | get_shared_llm()
+    sql_query = (await sql_response.ainvoke(_sql_inputs(location, major, institution, degree_level))).content.strip()
+    return await run_db(execute_sql, sql_query)
+
+# LLM SQL generation, used only when the query builder can't handle the inputs
+sql_prompt = (
     ("system", """Generate a valid SQLite query for university data.
 
-Let the LLM determine the appropriate tables, columns, and query structure based on the requirements.
+{schema}
 
 Output ONLY the SQL query, no markdown formatting
 Do NOT include ```sql or ``` tags
 Do NOT include any explanations"""),
     ("human", "Generate SQL for: Location: {location}, Major: {major}, Institution: {institution}, Degree Level: {degree_level}")
-])
-
-# Let LLM handle all result formatting
-format_prompt = ChatPromptTemplate.from_messages([
-    ("system", """Format university data into a readable format. Let the LLM determine the best way to present the information.
-
-Make it clear and easy to read."""),
-    ("human", "Format this university data: {data}")
-])
+)
 
 @tool
-def university_search(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> str:
+def university_search(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> QueryResult:
     """Search for universities based on location, major, institution, or degree level."""
     print("🔍 Searching universities...")
     
-    # Let LLM generate SQL
-    sql_response = sql_prompt | llm_client
-    sql_query = sql_response.invoke({
-        "location": location,
-        "major": major,
-        "institution": institution,
-        "degree_level": degree_level
-    }).content.strip()
-    
-    # Execute SQL and get raw results
-    raw_results = execute_sql_and_format(sql_query)
-    
-    # Let LLM format results
-    format_response = format_prompt | llm_client
-    formatted_results = format_response.invoke({"data": raw_results}).content
+    return run_query(sql_prompt, "search", location, major, institution, degree_level)
+
+async def _university_search(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> QueryResult:
+    print("🔍 Searching universities...")
     
-    return formatted_results
+    return await arun_query(sql_prompt, "search", location, major, institution, degree_level)
 
-# Let LLM handle cost analysis
-cost_sql_prompt = ChatPromptTemplate.from_messages([
+# tool.ainvoke awaits this instead of running the sync tool in a worker thread
+university_search.coroutine = _university_search
+
+# Cost-focused fallback SQL generation
+cost_sql_prompt = (
     ("system", """Generate a SQLite query focused on university costs and affordability.
 
-Let the LLM determine the appropriate tables, columns, and query structure for cost analysis.
+{schema}
 
 Output ONLY the SQL query, no markdown formatting
 Do NOT include ```sql or ``` tags
 Do NOT include any explanations"""),
     ("human", "Generate cost analysis SQL for: Location: {location}, Major: {major}, Institution: {institution}, Degree Level: {degree_level}")
-])
-
-# Let LLM handle cost formatting
-cost_format_prompt = ChatPromptTemplate.from_messages([
-    ("system", """Format university cost data into a readable cost analysis. Let the LLM determine the best way to present cost information.
-
-Make it clear and easy to read."""),
-    ("human", "Format this cost data: {data}")
-])
+)
 
 @tool
-def cost_analysis(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> str:
+def cost_analysis(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> QueryResult:
     """Analyze costs for universities and return a cost comparison table."""
     print("💰 Analyzing costs...")
     
-    # Let LLM generate cost-focused SQL
-    sql_response = cost_sql_prompt | llm_client
-    sql_query = sql_response.invoke({
-        "location": location,
-        "major": major,
-        "institution": institution,
-        "degree_level": degree_level
-    }).content.strip()
-    
-    # Execute SQL and get raw results
-    raw_results = execute_sql_and_format(sql_query)
-    
-    # Let LLM format cost results
-    format_response = cost_format_prompt | llm_client
-    formatted_results = format_response.invoke({"data": raw_results}).content
-    
-    return formatted_results
+    return run_query(cost_sql_prompt, "cost", location, major, institution, degree_level)
 
-@tool
-def university_comparison(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> str:
-    """Compare multiple universities and return a comparison table."""
-    print("🔄 Comparing universities...")
+async def _cost_analysis(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> QueryResult:
+    print("💰 Analyzing costs...")
     
-    # Let LLM generate comparison SQL
-    comparison_sql_prompt = ChatPromptTemplate.from_messages([
-        ("system", """Generate a SQLite query to compare universities. Let the LLM determine the appropriate tables, columns, and query structure for comparison.
+    return await arun_query(cost_sql_prompt, "cost", location, major, institution, degree_level)
+
+cost_analysis.coroutine = _cost_analysis
+
+# Comparison-focused fallback SQL generation
+comparison_sql_prompt = (
+    ("system", """Generate a SQLite query to compare universities.
+
+{schema}
 
 Output ONLY the SQL query, no markdown formatting
 Do NOT include ```sql or ``` tags
 Do NOT include any explanations"""),
-        ("human", "Generate comparison SQL for: Location: {location}, Major: {major}, Institution: {institution}, Degree Level: {degree_level}")
-    ])
-    
-    sql_response = comparison_sql_prompt | llm_client
-    sql_query = sql_response.invoke({
-        "location": location,
-        "major": major,
-        "institution": institution,
-        "degree_level": degree_level
-    }).content.strip()
-    
-    # Execute SQL and get raw results
-    raw_results = execute_sql_and_format(sql_query)
-    
-    # Let LLM format comparison results
-    comparison_format_prompt = ChatPromptTemplate.from_messages([
-        ("system", """Format university comparison data into a readable comparison table. Let the LLM determine the best way to present comparison information.
+    ("human", "Generate comparison SQL for: Location: {location}, Major: {major}, Institution: {institution}, Degree Level: {degree_level}")
+)
 
-Make it clear and easy to read."""),
-        ("human", "Format this comparison data: {data}")
-    ])
+@tool
+def university_comparison(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> QueryResult:
+    """Compare multiple universities and return a comparison table."""
+    print("🔄 Comparing universities...")
     
-    format_response = comparison_format_prompt | llm_client
-    formatted_results = format_response.invoke({"data": raw_results}).content
+    return run_query(comparison_sql_prompt, "comparison", location, major, institution, degree_level)
+
+async def _university_comparison(location: str = "", major: str = "", institution: str = "", degree_level: str = "") -> QueryResult:
+    print("🔄 Comparing universities...")
     
-    return formatted_results
+    return await arun_query(comparison_sql_prompt, "comparison", location, major, institution, degree_level)
+
+university_comparison.coroutine = _university_comparison
 
 @tool
 def get_weather_data(location: str) -> str:
@@ -183,45 +177,32 @@ def get_weather_data(location: str) -> str:
     print(f"🌤️ Getting weather for {location}...")
     
     try:
-        # Use Tavily for weather search
-        tavily_tool = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-        search_result = tavily_tool.search(f"current weather in {location}")
+        # Cached live weather, or local climate normals while the cache is cold
+        return get_weather(location)
         
-        # Let LLM format weather results
-        weather_format_prompt = ChatPromptTemplate.from_messages([
-            ("system", """Format weather search results into a readable weather report. Let the LLM determine the best way to present weather information.
+    except Exception as e:
+        return f"Weather search error: {str(e)}"
 
-Make it clear and informative."""),
-            ("human", "Format this weather data for {location}: {data}")
-        ])
-        
-        # Convert search results to string
-        weather_data = str(search_result)
-        
-        format_response = weather_format_prompt | llm_client
-        formatted_weather = format_response.invoke({
-            "location": location,
-            "data": weather_data
-        }).content
-        
-        return formatted_weather
+async def _get_weather_data(location: str) -> str:
+    print(f"🌤️ Getting weather for {location}...")
+    
+    try:
+        return await aget_weather(location)
         
     except Exception as e:
         return f"Weather search error: {str(e)}"
 
-# Test function
+get_weather_data.coroutine = _get_weather_data
+
+# Smoke test: built queries and climate normals answer without the LLM
 if __name__ == "__main__":
-    print("🧪 Testing Tools with fully LLM-driven everything")
+    print("Testing tools with built queries")
     print("=" * 50)
     
-    # Test weather (should work without database)
-    print("Testing weather function:")
-    result = get_weather_data.invoke({"location": "Boston"})
-    print(f"Result: {result}")
+    result = university_search.invoke({"location": "Boston, MA"})
+    print(f"university_search: {len(result.get('rows', []))} rows {result.get('error', '')}")
     
-    print("\n" + "=" * 50)
-    print("✅ Tools ready with fully LLM-driven everything!")
-
-
-
-
+    result = cost_analysis.invoke({"institution": "MIT"})
+    print(f"cost_analysis: {len(result.get('rows', []))} rows {result.get('error', '')}")
+    
+    print(f"get_weather_data: {get_weather_data.invoke({'location': 'Boston'})}")
@@ -0,0 +1,343 @@
+"""Timing spans for nodes, LLM calls, tools, SQL and Tavily requests.
+
+Spans nest through a context variable, so anything run inside a span (including
+work submitted with contextvars.copy_context()) becomes its child. Finished spans
+go to the configured exporters (TRACE_EXPORTERS, comma-separated):
+
+    memory  keep the most recent spans in process (default)
+    jsonl   append one JSON object per span to TRACE_JSONL_PATH
+    otel    forward to OpenTelemetry (needs opentelemetry-api and a configured SDK)
+
+start_trace() additionally collects every span of one request for the Streamlit waterfall.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_EXPORTERS = os.getenv("TRACE_EXPORTERS", "memory")
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "data/traces.jsonl")
+MEMORY_SPANS = int(os.getenv("TRACE_MEMORY_SPANS", "2000"))
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+class Span:
+    """One timed operation with attributes; kind is node, llm, tool, sql, snapshot, http or internal."""
+
+    def __init__(self, name: str, kind: str = "internal", parent: Optional["Span"] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": self.start_time,
+            "duration_ms": None if self.duration_ms is None else round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """All spans of one request, for rendering a latency waterfall."""
+
+    def __init__(self, root: Span):
+        self.root = root
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def waterfall(self) -> List[Dict]:
+        """Finished spans ordered by start, with offsets (ms) from the start of the request."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span._start)
+        depth = {self.root.span_id: 0}
+        rows = []
+        for span in spans:
+            depth[span.span_id] = depth.get(span.parent_id, -1) + 1
+            offset = (span._start - self.root._start) * 1000
+            rows.append({
+                "name": span.name,
+                "kind": span.kind,
+                "depth": depth[span.span_id],
+                "start_ms": round(offset, 2),
+                "end_ms": round(offset + (span.duration_ms or 0), 2),
+                "duration_ms": round(span.duration_ms or 0, 2),
+                "error": span.error,
+                "attributes": span.attributes,
+            })
+        return rows
+
+
+class SpanExporter:
+    """Receives spans as they start and finish; exporters must not raise."""
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def export(self, span: Span) -> None:
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps the most recent finished spans."""
+
+    def __init__(self, max_spans: int = MEMORY_SPANS):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span.to_dict())
+
+    def get_spans(self) -> List[Dict]:
+        return list(self.spans)
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class JSONLExporter(SpanExporter):
+    """Appends each finished span as a JSON line."""
+
+    def __init__(self, path: str = TRACE_JSONL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class OpenTelemetryExporter(SpanExporter):
+    """Mirrors spans into OpenTelemetry using whatever tracer provider the process configured."""
+
+    def __init__(self, tracer_name: str = "university-planner"):
+        from opentelemetry import trace as otel_trace
+
+        self._otel = otel_trace
+        self._tracer = otel_trace.get_tracer(tracer_name)
+        self._spans: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span) -> None:
+        with self._lock:
+            parent = self._spans.get(span.parent_id)
+        context = self._otel.set_span_in_context(parent) if parent is not None else None
+        otel_span = self._tracer.start_span(
+            span.name, context=context, start_time=int(span.start_time * 1e9), attributes={"kind": span.kind},
+        )
+        with self._lock:
+            self._spans[span.span_id] = otel_span
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            otel_span = self._spans.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if value is not None:
+                otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        if span.error:
+            otel_span.set_status(self._otel.Status(self._otel.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.start_time + span.duration_ms / 1000) * 1e9))
+
+
+_exporters: Optional[List[SpanExporter]] = None
+_exporters_lock = threading.Lock()
+
+
+def _exporters_from_env() -> List[SpanExporter]:
+    exporters = []
+    for name in (part.strip().lower() for part in TRACE_EXPORTERS.split(",")):
+        if name == "memory":
+            exporters.append(InMemoryExporter())
+        elif name == "jsonl":
+            exporters.append(JSONLExporter())
+        elif name == "otel":
+            try:
+                exporters.append(OpenTelemetryExporter())
+            except ImportError:
+                print("TRACE_EXPORTERS includes otel but opentelemetry-api is not installed")
+    return exporters
+
+
+def get_exporters() -> List[SpanExporter]:
+    """Get the configured exporters, creating them from TRACE_EXPORTERS on first use"""
+    global _exporters
+    with _exporters_lock:
+        if _exporters is None:
+            _exporters = _exporters_from_env()
+        return _exporters
+
+
+def set_exporters(exporters: List[SpanExporter]) -> None:
+    """Replace the exporters, e.g. with an InMemoryExporter in the benchmark"""
+    global _exporters
+    with _exporters_lock:
+        _exporters = list(exporters)
+
+
+def _notify(method: str, span: Span) -> None:
+    for exporter in get_exporters():
+        try:
+            getattr(exporter, method)(span)
+        except Exception as e:
+            print(f"Trace exporter {type(exporter).__name__} failed: {e}")
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, kind: str = "internal", parent: Optional[Span] = None, **attributes) -> Span:
+    """Start a span under parent (default: the current span) without making it current."""
+    span = Span(name, kind, parent if parent is not None else _current_span.get(), attributes)
+    _notify("on_start", span)
+    return span
+
+
+def end_span(span: Span, error: Optional[BaseException] = None) -> None:
+    span.finish(error)
+    trace = _current_trace.get()
+    if trace is not None and trace.root.trace_id == span.trace_id and span is not trace.root:
+        trace.add(span)
+    _notify("export", span)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes) -> Iterator[Span]:
+    """Time the enclosed block as a child of the current span."""
+    current = start_span(name, kind, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, e)
+        raise
+    else:
+        end_span(current)
+    finally:
+        _current_span.reset(token)
+
+
+def annotate(**attributes) -> None:
+    """Add attributes to the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+@contextmanager
+def start_trace(name: str, **attributes) -> Iterator[Trace]:
+    """Start a new trace for one request; every span inside it is collected on the Trace."""
+    root = Span(name, "request", None, attributes)
+    trace = Trace(root)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(root)
+    _notify("on_start", root)
+    try:
+        yield trace
+    except BaseException as e:
+        root.finish(e)
+        raise
+    finally:
+        root.finish()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _notify("export", root)
+
+
+def _token_usage(response) -> Dict[str, int]:
+    """Prompt/completion tokens from usage metadata on the message, or the provider's llm_output."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0)}
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": usage.get("completion_tokens", 0)}
+    return {}
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """LangChain callback handler that records one llm span per chat model call.
+
+    The span is made current while the model runs, so the LLM cache can mark hits on it.
+    """
+
+    # Run in the model's own context in async runs too, so the span it sets is seen by the cache lookup
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[Any, Span] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        llm = start_span(
+            "llm",
+            kind="llm",
+            model=metadata.get("ls_model_name") or (serialized or {}).get("name"),
+            node=metadata.get("langgraph_node"),
+            messages=sum(len(batch) for batch in messages),
+        )
+        with self._lock:
+            self._spans[run_id] = llm
+        _current_span.set(llm)
+
+    def _finish(self, run_id, error: Optional[BaseException] = None, response=None):
+        with self._lock:
+            llm = self._spans.pop(run_id, None)
+        if llm is None:
+            return
+        if response is not None:
+            llm.set_attributes(**_token_usage(response))
+        end_span(llm, error)
+        # Restore the span that was current before the model started
+        _current_span.set(llm.parent)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, response=response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=error)
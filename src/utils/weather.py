@@ -0,0 +1,277 @@
+import os
+import csv
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from src.utils.shared_llm import chat_prompt, get_shared_llm
+from src.utils.query_builder import parse_location
+from src.utils.tracing import span, annotate
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fresh for WEATHER_TTL seconds; served stale (while refreshing in the background) until WEATHER_STALE_TTL
+WEATHER_TTL = float(os.getenv("WEATHER_TTL", "3600"))
+WEATHER_STALE_TTL = float(os.getenv("WEATHER_STALE_TTL", "21600"))
+# Locations kept; the least recently used are dropped
+WEATHER_MAX_ENTRIES = int(os.getenv("WEATHER_MAX_ENTRIES", "1000"))
+CLIMATE_NORMALS_PATH = os.getenv("CLIMATE_NORMALS_PATH", "data/climate_normals.csv")
+
+# Let LLM format weather results
+weather_format_prompt = (
+    ("system", """Format weather search results into a readable weather report. Let the LLM determine the best way to present weather information.
+
+Make it clear and informative."""),
+    ("human", "Format this weather data for {location}: {data}")
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_weather_client():
+    """Shared Tavily client; one pooled HTTP session for every weather lookup"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from tavily import TavilyClient
+
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            _client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"), session=session)
+        return _client
+
+
+def set_weather_client(client) -> None:
+    """Replace the Tavily client, e.g. with a local stub exposing search(query) in tests"""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+_async_client = None
+
+
+def get_async_weather_client():
+    """Shared async Tavily client for the async pipeline"""
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            from tavily import AsyncTavilyClient
+
+            _async_client = AsyncTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+        return _async_client
+
+
+def set_async_weather_client(client) -> None:
+    """Replace the async Tavily client, e.g. with a stub exposing an async search(query)"""
+    global _async_client
+    with _client_lock:
+        _async_client = client
+
+
+def normalize_location(location: str) -> str:
+    """Cache key for a location, so "Boston, Massachusetts" and "boston ma" share an entry."""
+    parsed = parse_location(location or "")
+    if parsed:
+        states, cities = parsed
+        parts = [f"{city.lower()}|{state or ''}" for city, state in cities] + sorted(states)
+        if parts:
+            return ";".join(parts)
+    return " ".join((location or "").lower().replace(",", " ").split())
+
+
+_normals = None
+
+
+def _load_normals() -> Dict[Tuple[str, str], Dict]:
+    global _normals
+    if _normals is None:
+        normals = {}
+        if os.path.exists(CLIMATE_NORMALS_PATH):
+            with open(CLIMATE_NORMALS_PATH, newline="") as f:
+                for row in csv.DictReader(f):
+                    normals[(row["CITY"].lower(), row["STABBR"])] = row
+        _normals = normals
+    return _normals
+
+
+def climate_normals(location: str) -> Optional[str]:
+    """Precomputed climate normals for a city (or its state) from local data, if we have them."""
+    normals = _load_normals()
+    parsed = parse_location(location or "")
+    if not parsed or not normals:
+        return None
+    states, cities = parsed
+
+    row = None
+    for city, state in cities:
+        matches = [r for (c, s), r in normals.items() if c == city.lower() and (state is None or s == state)]
+        row = matches[0] if matches else normals.get(("", state)) if state else None
+        if row:
+            break
+    if row is None and states:
+        row = normals.get(("", states[0]))
+    if row is None:
+        return None
+
+    place = f"{row['CITY']}, {row['STABBR']}" if row["CITY"] else f"{row['STABBR']} (statewide)"
+    text = (f"Typical climate for {place} (1991-2020 normals, approximate): average January temperature "
+            f"{row['JAN_AVG_F']}°F, average July temperature {row['JUL_AVG_F']}°F, "
+            f"about {row['ANNUAL_PRECIP_IN']} in of precipitation per year")
+    if float(row["ANNUAL_SNOW_IN"] or 0) > 0:
+        text += f" and {row['ANNUAL_SNOW_IN']} in of snow"
+    return text + ". Live conditions were not available for this request."
+
+
+def fetch_weather(location: str) -> str:
+    """Live weather: Tavily search formatted by the LLM"""
+    with span("tavily.search", kind="http", location=location):
+        search_result = get_weather_client().search(f"current weather in {location}")
+    format_response = chat_prompt(weather_format_prompt) | get_shared_llm()
+    return format_response.invoke({"location": location, "data": str(search_result)}).content
+
+
+async def afetch_weather(location: str) -> str:
+    """Async fetch_weather"""
+    with span("tavily.search", kind="http", location=location):
+        search_result = await get_async_weather_client().search(f"current weather in {location}")
+    format_response = chat_prompt(weather_format_prompt) | get_shared_llm()
+    return (await format_response.ainvoke({"location": location, "data": str(search_result)})).content
+
+
+class WeatherCache:
+    """Location-keyed LRU cache of formatted weather with a TTL and stale-while-revalidate refreshes.
+    Concurrent lookups of the same location share one fetch."""
+
+    def __init__(self, ttl: float = WEATHER_TTL, stale_ttl: float = WEATHER_STALE_TTL, max_entries: int = WEATHER_MAX_ENTRIES):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # Fetches in flight, background or not, by location key
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather")
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        """The fetch in flight for a location, and whether the caller has to run it."""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future, False
+            future = self._pending[key] = Future()
+            return future, True
+
+    def _finish(self, key: str, future: Future, value: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+        """Store a fetched value and hand it (or the error) to everyone waiting on the fetch."""
+        with self._lock:
+            if error is None:
+                self._entries[key] = (value, time.time())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._pending.pop(key, None)
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def _fetch(self, key: str, location: str, future: Future) -> None:
+        try:
+            value = fetch_weather(location)
+        except Exception as e:
+            print(f"Weather refresh failed for {location}: {e}")
+            self._finish(key, future, error=e)
+        else:
+            self._finish(key, future, value)
+
+    def _refresh_in_background(self, key: str, location: str) -> None:
+        future, owner = self._claim(key)
+        if owner:
+            self._executor.submit(self._fetch, key, location, future)
+
+    def _cached(self, key: str, location: str) -> Optional[str]:
+        """A fresh or stale entry, or climate normals while the cache is cold; None on a full miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+        age = time.time() - entry[1] if entry else None
+
+        if entry and age < self.ttl:
+            annotate(weather_cache="fresh")
+            return entry[0]
+        if entry and age < self.stale_ttl:
+            annotate(weather_cache="stale")
+            self._refresh_in_background(key, location)
+            return entry[0]
+
+        # Cold (or too stale): answer from local normals right away and fetch live weather for next time
+        normals = climate_normals(location)
+        if normals:
+            annotate(weather_cache="normals")
+            self._refresh_in_background(key, location)
+            return normals
+
+        annotate(weather_cache="miss")
+        return None
+
+    def get(self, location: str) -> str:
+        key = normalize_location(location)
+        value = self._cached(key, location)
+        if value is not None:
+            return value
+
+        future, owner = self._claim(key)
+        if owner:
+            self._fetch(key, location, future)
+        try:
+            return future.result()
+        except Exception as e:
+            raise RuntimeError(f"no live weather or climate normals for {location}: {e}")
+
+    async def aget(self, location: str) -> str:
+        """Async get; only a full miss waits on the network, and it does so on the event loop."""
+        key = normalize_location(location)
+        value = self._cached(key, location)
+        if value is not None:
+            return value
+
+        future, owner = self._claim(key)
+        if owner:
+            try:
+                value = await afetch_weather(location)
+            except asyncio.CancelledError:
+                self._finish(key, future, error=RuntimeError("weather lookup was cancelled"))
+                raise
+            except Exception as e:
+                self._finish(key, future, error=e)
+            else:
+                self._finish(key, future, value)
+        try:
+            return await asyncio.wrap_future(future)
+        except Exception as e:
+            raise RuntimeError(f"no live weather or climate normals for {location}: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+weather_cache = WeatherCache()
+
+
+def get_weather(location: str) -> str:
+    """Formatted weather for a location from the cache, live search or local climate normals"""
+    return weather_cache.get(location)
+
+
+async def aget_weather(location: str) -> str:
+    """Async get_weather"""
+    return await weather_cache.aget(location)
@@ -1,10 +1,44 @@
 import streamlit as st
-import json
-from src.graph.runner import run_graph
-from st_link_analysis import st_link_analysis, NodeStyle, EdgeStyle
-from st_link_analysis.component.layouts import LAYOUTS
+import time
+import uuid
+from src.graph.runner import run_graph, resume_graph, rerun_graph, warm_up
+from src.graph.checkpoints import get_checkpointer
+from src.utils.knowledge_graph import KnowledgeGraph, parse_elements
 
 st.set_page_config(page_title="University Planner Agent", layout="wide")
+
+@st.cache_resource
+def warm_up_graph():
+    """Compile the graph once per server process; runs after the page is drawn, while the user types"""
+    return warm_up()
+
+@st.cache_data(max_entries=32)
+def parse_graph(knowledge_graph):
+    """Parse a run's knowledge graph JSON once; reruns reuse the parsed elements"""
+    return parse_elements(knowledge_graph)
+
+def render_waterfall(rows):
+    """Per-request latency waterfall: one bar per span, offset from the start of the request"""
+    if not rows:
+        return
+    import altair as alt
+    import pandas as pd
+
+    data = pd.DataFrame([
+        {**{k: row[k] for k in ("kind", "start_ms", "end_ms", "duration_ms")},
+         "span": f"{i:02d} " + "  " * row["depth"] + row["name"],
+         "details": ", ".join(f"{k}={v}" for k, v in row["attributes"].items() if v is not None and k != "statement")}
+        for i, row in enumerate(rows)
+    ])
+    chart = alt.Chart(data).mark_bar().encode(
+        x=alt.X("start_ms:Q", title="ms since request start"),
+        x2="end_ms:Q",
+        y=alt.Y("span:N", sort=None, title=None),
+        color="kind:N",
+        tooltip=["span", "kind", "duration_ms", "details"],
+    )
+    st.altair_chart(chart, use_container_width=True)
+
 st.title("University Planner Agent")
 
 # Two-column layout
@@ -16,43 +50,99 @@ with col1:
     
     query = st.text_input("Enter your university preferences:")
 
+    # Checkpoints are kept per browser session and run, so a failed run can be retried from its last step
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    # With CHECKPOINTER=none there is nothing to resume or re-run from; a retry starts over
+    checkpointed = get_checkpointer() is not None
+
+    def run_with_progress(run):
+        """Run the graph via run(step_callback, token_callback, trace_callback), rendering steps and streamed tokens"""
+        with st.spinner('Searching for universities...'):
+            steps_so_far = []
+            steps_placeholder = st.empty()
+            status_placeholder = st.empty()
+            report_header = st.empty()
+            report_placeholder = st.empty()
+
+            def step_callback(step_name):
+                steps_so_far.append(step_name.replace('_', ' ').title())
+                steps_placeholder.markdown("**Steps completed:**\n" + "\n".join([f"- {s}" for s in steps_so_far]))
+
+            # Render the report as the recommender streams it, at most every 100 ms
+            report_tokens = []
+            last_render = [0.0]
+
+            def token_callback(token):
+                if not report_tokens:
+                    report_header.subheader("University Recommendations")
+                report_tokens.append(token)
+                if time.monotonic() - last_render[0] > 0.1:
+                    report_placeholder.markdown("".join(report_tokens))
+                    last_render[0] = time.monotonic()
+
+            def trace_callback(trace):
+                st.session_state["trace"] = trace.waterfall()
+
+            try:
+                final_state = run(step_callback, token_callback, trace_callback)
+                st.session_state["final_state"] = final_state
+                st.session_state.pop("failed_run", None)
+            except Exception as e:
+                # Offer a retry, resuming from the run's last checkpoint when there is one
+                st.session_state["failed_run"] = st.session_state.get("run_id")
+                st.session_state["run_error"] = str(e)
+                st.rerun()
+
+            steps_placeholder.markdown("**All steps completed:**\n" + "\n".join([f"- {s}" for s in steps_so_far]))
+            status_placeholder.success("University recommendations completed!")
+
+            report = final_state.get("report", "No report generated.")
+            knowledge_graph = final_state.get("knowledge_graph", {})
+
+            st.session_state["research_report"] = report
+            st.session_state["knowledge_graph"] = knowledge_graph
+            st.session_state["research_completed"] = True
+            
+            # Update graph key to force re-render
+            st.session_state["graph_key"] = st.session_state.get("graph_key", 0) + 1
+
+            report_header.subheader("University Recommendations")
+            report_placeholder.markdown(report)
+
+    def start_run(run_query):
+        st.session_state["run_id"] = uuid.uuid4().hex
+        st.session_state["run_query"] = run_query
+        initial_state = {"query": run_query}
+        run_with_progress(lambda step_callback, token_callback, trace_callback: run_graph(
+            initial_state, step_callback=step_callback, token_callback=token_callback,
+            trace_callback=trace_callback, session_id=session_id, run_id=st.session_state["run_id"]))
+
     if st.button("Get Recommendations"):
         if query:
-            with st.spinner('Searching for universities...'):
-                steps_so_far = []
-                steps_placeholder = st.empty()
-
-                def step_callback(step_name):
-                    steps_so_far.append(step_name.replace('_', ' ').title())
-                    steps_placeholder.markdown("**Steps completed:**\n" + "\n".join([f"- {s}" for s in steps_so_far]))
-
-                initial_state = {"query": query}
-                try:
-                    final_state = run_graph(initial_state, step_callback=step_callback)
-                    st.session_state["final_state"] = final_state
-                except Exception as e:
-                    st.error(f"Error running graph: {e}")
-                    st.stop()
-
-                steps_placeholder.markdown("**All steps completed:**\n" + "\n".join([f"- {s}" for s in steps_so_far]))
-                st.success("University recommendations completed!")
-
-                report = final_state.get("report", "No report generated.")
-                knowledge_graph = final_state.get("knowledge_graph", {})
-
-                st.session_state["research_report"] = report
-                st.session_state["knowledge_graph"] = knowledge_graph
-                st.session_state["research_completed"] = True
-                
-                # Update graph key to force re-render
-                st.session_state["graph_key"] = st.session_state.get("graph_key", 0) + 1
-
-                st.subheader("University Recommendations")
-                st.markdown(report)
+            start_run(query)
 
         else:
             st.warning("Please enter your university preferences.")
 
+    elif st.session_state.get("failed_run"):
+        st.error(f"Error running graph: {st.session_state.get('run_error')}")
+        if checkpointed and st.button("Retry from the last completed step"):
+            # Pick the failed run up where it stopped instead of repeating plan and gather
+            run_id = st.session_state["failed_run"]
+            run_with_progress(lambda step_callback, token_callback, trace_callback: resume_graph(
+                session_id, run_id, step_callback=step_callback, token_callback=token_callback,
+                trace_callback=trace_callback))
+        elif not checkpointed and st.button("Retry"):
+            start_run(st.session_state["run_query"])
+
+    elif (checkpointed and st.session_state.get("research_completed", False)
+          and not (st.session_state.get("final_state") or {}).get("cache_hit") and st.button("Regenerate report")):
+        # Same gathered data; only the report and the knowledge graph are redone
+        run_id = st.session_state["run_id"]
+        run_with_progress(lambda step_callback, token_callback, trace_callback: rerun_graph(
+            session_id, run_id, from_node="recommend", step_callback=step_callback,
+            token_callback=token_callback, trace_callback=trace_callback))
+
     elif st.session_state.get("research_completed", False):
         st.markdown("---")
         st.subheader("University Recommendations")
@@ -60,6 +150,10 @@ with col1:
         report = st.session_state.get("research_report", "No report available.")
         st.markdown(report)
 
+    if st.session_state.get("trace"):
+        with st.expander("Latency waterfall"):
+            render_waterfall(st.session_state["trace"])
+
 # Right column - Knowledge Graph
 with col2:
     st.subheader("Knowledge Graph")
@@ -68,82 +162,31 @@ with col2:
     if not st.session_state.get("research_completed", False):
         st.info("Run university search first to see the knowledge graph.")
     else:
-        LAYOUT_NAMES = list(LAYOUTS.keys())
+        # The graph component is only needed once a run has finished
+        from st_link_analysis import st_link_analysis, NodeStyle, EdgeStyle
+        from st_link_analysis.component.layouts import LAYOUTS
 
-        class DynamicGraph:
-            def __init__(self, knowledge_graph):
-                self.knowledge_graph = knowledge_graph
-                self.load_data()
-
-            def load_data(self):
-                try:
-                    # Use the knowledge graph from the final state
-                    if isinstance(self.knowledge_graph, str):
-                        # If it's a string, try to parse as JSON
-                        elements = json.loads(self.knowledge_graph)
-                    else:
-                        # If it's already a dict, use it directly
-                        elements = self.knowledge_graph
-                    
-                    # Ensure proper structure
-                    if "nodes" not in elements:
-                        elements["nodes"] = []
-                    if "edges" not in elements:
-                        elements["edges"] = []
-                    
-                    # Let the data structure handle itself
-                    self.all_nodes = elements["nodes"]
-                    self.all_edges = elements["edges"]
-                    self.nodes = set([n["data"]["id"] for n in self.all_nodes])
-                    self.edges = set([e["data"]["id"] for e in self.all_edges])
-                except (json.JSONDecodeError, KeyError, TypeError) as e:
-                    st.warning("No valid knowledge graph data available.")
-                    self.all_nodes = []
-                    self.all_edges = []
-                    self.nodes = set()
-                    self.edges = set()
-
-            def get_elements(self):
-                return {
-                    "nodes": [n for n in self.all_nodes if n["data"]["id"] in self.nodes],
-                    "edges": [e for e in self.all_edges if e["data"]["id"] in self.edges],
-                }
-
-            def remove(self, node_ids):
-                self.nodes -= set(node_ids)
-                self._update_edges()
-
-            def expand(self, node_ids):
-                new_nodes = set()
-                node_ids = set(node_ids)
-                for e in self.all_edges:
-                    if e["data"]["source"] in node_ids:
-                        new_nodes.add(e["data"]["target"])
-                    elif e["data"]["target"] in node_ids:
-                        new_nodes.add(e["data"]["source"])
-                self.nodes |= new_nodes
-                self._update_edges()
-
-            def _update_edges(self):
-                self.edges = {
-                    e["data"]["id"]
-                    for e in self.all_edges
-                    if e["data"]["source"] in self.nodes and e["data"]["target"] in self.nodes
-                }
+        LAYOUT_NAMES = list(LAYOUTS.keys())
 
         COMPONENT_KEY = "NODE_ACTIONS"
 
-        # Create graph from knowledge graph data
-        knowledge_graph = st.session_state.get("knowledge_graph", {})
-        if not hasattr(st.session_state, "graph"):
-            st.session_state.graph = DynamicGraph(knowledge_graph)
+        # One graph per completed run: rebuild when the run's graph_key changes, otherwise keep
+        # the user's expand/remove state across reruns
+        current_key = st.session_state.get("graph_key", 0)
+        if st.session_state.get("graph_loaded_key") != current_key or "graph" not in st.session_state:
+            try:
+                st.session_state.graph = KnowledgeGraph(parse_graph(st.session_state.get("knowledge_graph", {})))
+            except ValueError:
+                st.session_state.graph = KnowledgeGraph()
+            st.session_state.graph_loaded_key = current_key
+        if not st.session_state.graph.nodes:
+            st.warning("No valid knowledge graph data available.")
 
         layout = st.selectbox("Try with different layouts", LAYOUT_NAMES, index=LAYOUT_NAMES.index("dagre"))
 
-        def create_dynamic_node_styles(nodes):
-            if not nodes:
+        def create_dynamic_node_styles(node_labels):
+            if not node_labels:
                 return []
-            node_labels = {n["data"].get("label", "UNKNOWN") for n in nodes}
             colors = ["#FF7F3E", "#2A629A", "#FF6B6B", "#4ECDC4", "#45B7D1", "#96CEB4", "#FFEAA7", "#FFC107"]
             node_styles = []
             for i, label in enumerate(node_labels):
@@ -151,26 +194,27 @@ with col2:
                 node_styles.append(NodeStyle(label, color, "label", "description"))
             return node_styles
 
-        def create_dynamic_edge_styles(edges):
-            if not edges:
+        def create_dynamic_edge_styles(edge_labels):
+            if not edge_labels:
                 return []
-            edge_labels = {e["data"].get("label", "RELATED") for e in edges}
             return [EdgeStyle(label, caption='label', directed=True) for label in edge_labels]
 
+        # Styles cover every label in the graph, so colours stay put as nodes are expanded or removed
         elements = st.session_state.graph.get_elements()
-        node_styles = create_dynamic_node_styles(elements["nodes"])
-        edge_styles = create_dynamic_edge_styles(elements["edges"])
+        node_styles = create_dynamic_node_styles(st.session_state.graph.node_labels())
+        edge_styles = create_dynamic_edge_styles(st.session_state.graph.edge_labels())
+
+        # Use dynamic key to force re-render when new research is completed
+        graph_key = f"{COMPONENT_KEY}_{current_key}"
 
         def onchange_callback():
-            val = st.session_state[COMPONENT_KEY]
+            val = st.session_state[graph_key]
             if val["action"] == "remove":
-                st.session_state.graph.remove(val["data"]["node_ids"])
+                st.session_state.graph_diff = st.session_state.graph.remove(val["data"]["node_ids"])
             elif val["action"] == "expand":
-                st.session_state.graph.expand(val["data"]["node_ids"])
+                st.session_state.graph_diff = st.session_state.graph.expand(val["data"]["node_ids"])
 
         with st.container(border=True):
-            # Use dynamic key to force re-render when new research is completed
-            graph_key = f"{COMPONENT_KEY}_{st.session_state.get('graph_key', 0)}"
             vals = st_link_analysis(
                 elements,
                 layout=layout,
@@ -183,5 +227,8 @@ with col2:
             if vals:
                 st.markdown("#### Graph Interactions")
                 st.json(vals, expanded=True)
+                if st.session_state.get("graph_diff"):
+                    st.json(st.session_state.graph_diff, expanded=False)
 
-
+# Last, so the first page render doesn't wait for LangGraph, the agents and the IPEDS snapshot
+warm_up_graph()